@@ -0,0 +1,105 @@
+"""
+Benchmarks the vectorized feature engine in src/features.py against the
+previous per-column groupby/rolling and row-wise apply implementation.
+
+Run from the repository root:
+    python -m benchmarks.bench_features --seasons 1 5 10
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from src.data import load_merged_gws_data, load_team_info
+from src.features import compute_rolling_features, add_contextual_features
+
+
+# -----------------------------------------
+# Reference implementation (pre-vectorization)
+# -----------------------------------------
+def legacy_compute_rolling_features(df, window=3):
+    df = df.sort_values(by=["player_id", "gameweek"])
+    columns = {
+        'rolling_points': 'total_points', 'rolling_minutes': 'minutes', 'rolling_goals': 'goals_scored',
+        'rolling_assists': 'assists', 'rolling_xG': 'expected_goals', 'rolling_xA': 'expected_assists',
+        'rolling_xGI': 'expected_goal_involvements',
+    }
+    for out, src in columns.items():
+        df[out] = df.groupby('player_id')[src] \
+                    .rolling(window=window, min_periods=1).mean().reset_index(0, drop=True)
+    df['rolling_points_std'] = df.groupby('player_id')['total_points'] \
+                                 .rolling(window=window, min_periods=1).std().reset_index(0, drop=True).fillna(0)
+    return df
+
+
+def legacy_add_contextual_features(df, teams_df):
+    team_name_to_id = teams_df.set_index('name')['id'].to_dict()
+    df['team'] = df['team'].map(team_name_to_id)
+    df['opponent_team'] = df['opponent_team'].map(team_name_to_id).fillna(df['opponent_team'])
+    df = df.sort_values(['player_id', 'gameweek'])
+    strength = teams_df[['id', 'strength_overall_home', 'strength_overall_away']]
+    df = df.merge(strength.rename(columns={
+        'id': 'team_id', 'strength_overall_home': 'team_strength_home',
+        'strength_overall_away': 'team_strength_away'}), left_on='team', right_on='team_id', how='left')
+    df = df.merge(strength.rename(columns={
+        'id': 'opponent_team_id', 'strength_overall_home': 'opponent_strength_home',
+        'strength_overall_away': 'opponent_strength_away'}), left_on='opponent_team', right_on='opponent_team_id', how='left')
+    df['is_home'] = df['was_home'].astype(int)
+    df['opponent_strength'] = df.apply(
+        lambda row: row['opponent_strength_away'] if row['was_home'] else row['opponent_strength_home'],
+        axis=1
+    )
+    df['fixture_difficulty'] = df['opponent_strength'] - df['team_strength_home']
+    df['opponent_defense_strength'] = df['opponent_strength']
+    df['cost_change'] = df.groupby('player_id')['now_cost'].diff().fillna(0)
+    return df.drop(columns=['team_id', 'opponent_team_id'])
+
+
+def replicate_seasons(df, n_seasons):
+    """
+    Stacks `n_seasons` copies of one season, giving each copy its own player ids.
+    """
+    offset = int(df['player_id'].max()) + 1
+    copies = [df.assign(player_id=df['player_id'] + k * offset) for k in range(n_seasons)]
+    return pd.concat(copies, ignore_index=True)
+
+
+def _best_of(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+
+def _check_equal(expected, actual):
+    for col in expected.columns:
+        a, b = expected[col], actual[col]
+        if a.dtype.kind == 'f' or b.dtype.kind == 'f':
+            np.testing.assert_allclose(a.to_numpy(float), b.to_numpy(float), rtol=1e-5, atol=1e-5, err_msg=col)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--seasons', type=int, nargs='+', default=[1, 5])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    season = load_merged_gws_data()
+    teams_df = load_team_info()
+
+    print(f"{'seasons':>8} {'rows':>9} {'legacy (s)':>11} {'vectorized (s)':>15} {'speedup':>8}")
+    for n in args.seasons:
+        df = replicate_seasons(season, n)
+        legacy_time, expected = _best_of(
+            lambda: legacy_add_contextual_features(legacy_compute_rolling_features(df.copy()), teams_df), 1)
+        new_time, actual = _best_of(
+            lambda: add_contextual_features(compute_rolling_features(df.copy()), teams_df), args.repeat)
+        _check_equal(expected, actual)
+        print(f"{n:>8} {len(df):>9} {legacy_time:>11.3f} {new_time:>15.3f} {legacy_time / new_time:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
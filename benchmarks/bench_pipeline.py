@@ -0,0 +1,240 @@
+"""
+Benchmark suite for the prediction pipeline at 1x, 10x and 100x one season.
+
+For each scale (synthetic season files, see benchmarks/synthetic.py) it times
+every stage and the end-to-end run:
+    load_cold       load_merged_gws_data, parsing the CSVs
+    load_warm       load_merged_gws_data from the Arrow snapshots
+    rolling         compute_rolling_features
+    contextual      add_contextual_features
+    predict_points  predict_points (committed stacked model) on every row
+    predict_all     predict_all (stacked + quantile models) on every row
+    optimize        optimize_team on the latest gameweek
+    end_to_end      all of the above from the raw CSVs
+
+and records wall time (best of --repeat), peak RSS above the stage's starting
+RSS, and peak traced Python/numpy allocations (tracemalloc, measured in a
+separate untimed run). Results are appended to a JSON history and can be
+compared against a saved baseline; any stage slower (or using more memory) than
+the baseline by more than --threshold fails the run with exit code 1.
+
+Runs offline against the committed models. From the repository root:
+    python -m benchmarks.bench_pipeline --scales 1 10 --save-baseline
+    python -m benchmarks.bench_pipeline --scales 1 10 --compare
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+from benchmarks.synthetic import synthetic_dataset, SYNTHETIC_DIR
+from src.data import load_merged_gws_data, load_team_info
+from src.features import compute_rolling_features, add_contextual_features, prepare_latest_features
+from src.model import predict_points, predict_all
+from src.optimizer import optimize_team
+from src.registry import get_model, get_quantile_models
+
+RESULTS_DIR = 'benchmarks/results'
+HISTORY_PATH = os.path.join(RESULTS_DIR, 'history.json')
+BASELINE_PATH = os.path.join(RESULTS_DIR, 'baseline.json')
+# Differences below these are noise, whatever the ratio.
+MIN_DELTA_S = 0.01
+MIN_DELTA_MB = 20.0
+
+
+# -----------------------------------------
+# 1. Measurement
+# -----------------------------------------
+def _rss_mb(field):
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith(field):
+                return int(line.split()[1]) / 1024
+    return None
+
+
+def _reset_peak_rss():
+    """
+    Resets the kernel's peak-RSS counter (Linux); returns False where unsupported.
+    """
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def measure(fn, repeat=1, trace=True):
+    """
+    Runs `fn` and returns (result, metrics) with wall_s (best of `repeat`),
+    peak_rss_mb (above the starting RSS; the process-lifetime peak where the
+    counter can't be reset) and alloc_peak_mb (tracemalloc, extra run).
+    """
+    gc.collect()
+    resettable = _reset_peak_rss()
+    start_rss = _rss_mb('VmRSS:') if resettable else 0.0
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - start)
+    if resettable:
+        peak_rss = _rss_mb('VmHWM:') - start_rss
+    else:
+        peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+    metrics = {'wall_s': min(times), 'peak_rss_mb': round(peak_rss, 1)}
+    if trace:
+        del result
+        gc.collect()
+        tracemalloc.start()
+        result = fn()
+        metrics['alloc_peak_mb'] = round(tracemalloc.get_traced_memory()[1] / 2**20, 1)
+        tracemalloc.stop()
+    return result, metrics
+
+
+# -----------------------------------------
+# 2. Stages
+# -----------------------------------------
+def run_scale(scale, repeat=1, trace=True, data_dir=SYNTHETIC_DIR):
+    """
+    Benchmarks every stage at one scale; returns {'rows': n, 'stages': {...}}.
+    """
+    paths = synthetic_dataset(scale, data_dir)
+    teams_df = load_team_info()
+    stacked = get_model('stacked')
+    quantile_models = get_quantile_models()
+    stages = {}
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        df_gws, stages['load_cold'] = measure(
+            lambda: load_merged_gws_data(paths, use_cache=False), repeat, trace)
+        load_merged_gws_data(paths, cache_dir=cache_dir)  # write the snapshots
+        _, stages['load_warm'] = measure(
+            lambda: load_merged_gws_data(paths, cache_dir=cache_dir), repeat, trace)
+
+    df_rolling, stages['rolling'] = measure(lambda: compute_rolling_features(df_gws.copy()), repeat, trace)
+    df_features, stages['contextual'] = measure(
+        lambda: add_contextual_features(df_rolling.copy(), teams_df), repeat, trace)
+    _, stages['predict_points'] = measure(lambda: predict_points(stacked, df_features.copy()), repeat, trace)
+    predictions, stages['predict_all'] = measure(
+        lambda: predict_all(stacked, quantile_models, df_features), repeat, trace)
+
+    latest_gw = df_features['gameweek'].max()
+    latest = prepare_latest_features(df_features, latest_gw).join(predictions)
+    _, stages['optimize'] = measure(lambda: optimize_team(latest.copy(), risk_aversion=0.01), repeat, trace)
+
+    def end_to_end():
+        features = add_contextual_features(
+            compute_rolling_features(load_merged_gws_data(paths, use_cache=False)), teams_df)
+        latest = prepare_latest_features(features, features['gameweek'].max())
+        latest = latest.join(predict_all(stacked, quantile_models, latest))
+        return optimize_team(latest, risk_aversion=0.01)
+
+    _, stages['end_to_end'] = measure(end_to_end, repeat, trace)
+    return {'rows': len(df_gws), 'stages': stages}
+
+
+# -----------------------------------------
+# 3. History and regression check
+# -----------------------------------------
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def append_history(run, path=HISTORY_PATH):
+    history = []
+    if os.path.exists(path):
+        with open(path) as f:
+            history = json.load(f)
+    history.append(run)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(history, f, indent=2)
+
+
+def compare_runs(run, baseline, threshold=0.25):
+    """
+    Returns a list of (scale, stage, metric, baseline, current, ratio) for every
+    metric more than `threshold` (relative) and the noise floor above baseline.
+    """
+    regressions = []
+    for scale, result in run['scales'].items():
+        base = baseline['scales'].get(scale)
+        if base is None:
+            continue
+        for stage, metrics in result['stages'].items():
+            base_metrics = base['stages'].get(stage, {})
+            for metric, floor in (('wall_s', MIN_DELTA_S), ('peak_rss_mb', MIN_DELTA_MB),
+                                  ('alloc_peak_mb', MIN_DELTA_MB)):
+                old, new = base_metrics.get(metric), metrics.get(metric)
+                if old is None or new is None or new - old <= floor:
+                    continue
+                if new > old * (1 + threshold):
+                    regressions.append((scale, stage, metric, old, new, new / old if old else float('inf')))
+    return regressions
+
+
+def print_run(run):
+    print(f"{'scale':>5} {'rows':>9} {'stage':>15} {'wall (s)':>9} {'peak RSS (MB)':>14} {'alloc (MB)':>11}")
+    for scale, result in run['scales'].items():
+        for stage, m in result['stages'].items():
+            print(f"{scale:>5} {result['rows']:>9} {stage:>15} {m['wall_s']:>9.3f} "
+                  f"{m['peak_rss_mb']:>14.1f} {m.get('alloc_peak_mb', float('nan')):>11.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scales', type=int, nargs='+', default=[1, 10])
+    parser.add_argument('--repeat', type=int, default=1)
+    parser.add_argument('--no-trace', action='store_true', help="Skip the tracemalloc runs")
+    parser.add_argument('--data-dir', default=SYNTHETIC_DIR)
+    parser.add_argument('--history', default=HISTORY_PATH)
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--save-baseline', action='store_true')
+    parser.add_argument('--compare', action='store_true')
+    parser.add_argument('--threshold', type=float, default=0.25)
+    args = parser.parse_args()
+
+    run = {
+        'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'commit': _git_commit(),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'repeat': args.repeat,
+        'scales': {str(s): run_scale(s, args.repeat, not args.no_trace, args.data_dir) for s in args.scales},
+    }
+    print_run(run)
+    append_history(run, args.history)
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(args.baseline) or '.', exist_ok=True)
+        with open(args.baseline, 'w') as f:
+            json.dump(run, f, indent=2)
+    if args.compare:
+        with open(args.baseline) as f:
+            regressions = compare_runs(run, json.load(f), args.threshold)
+        for scale, stage, metric, old, new, ratio in regressions:
+            print(f"REGRESSION {scale}x {stage} {metric}: {old:.3f} -> {new:.3f} ({ratio:.2f}x)")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions above {args.threshold:.0%} against {args.baseline}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+"""
+Checks candidate pruning (src.pruning) against the unpruned optimizer.
+
+For each scale (synthetic season files, see benchmarks/synthetic.py; scale 0 is
+data/merged_gw.csv) it predicts the latest gameweek with the committed models,
+then for every risk aversion x budget solves optimize_team with and without
+pruning and compares the objective values. It reports the pool reduction and
+the solve speedup, and exits with code 1 if any pruned objective falls short of
+the unpruned one by more than the solver's gap tolerance.
+
+Run from the repository root:
+    python -m benchmarks.bench_pruning --scales 0 1 10
+"""
+import argparse
+import sys
+import time
+
+import numpy as np
+
+from benchmarks.synthetic import synthetic_dataset, SYNTHETIC_DIR
+from src.data import load_merged_gws_data, load_team_info
+from src.features import compute_rolling_features, add_contextual_features, prepare_latest_features
+from src.model import predict_all
+from src.optimizer import optimize_team, optimize_scenarios, squad_objective
+from src.pruning import CandidateIndex
+from src.registry import get_model, get_quantile_models
+
+RISK_AVERSIONS = (0.0, 0.01, 0.1, 0.5)
+BUDGETS = (1000, 900, 800)
+# HiGHS stops at a relative MIP gap of 1e-4
+TOLERANCE = 1e-4
+
+
+def latest_predictions(paths, teams_df, stacked, quantile_models):
+    features = add_contextual_features(compute_rolling_features(load_merged_gws_data(paths, use_cache=False)),
+                                       teams_df)
+    latest = prepare_latest_features(features, features['gameweek'].max())
+    latest = latest.join(predict_all(stacked, quantile_models, latest))
+    latest['predicted_risk'] = latest['predicted_p90'] - latest['predicted_points']
+    return latest
+
+
+def _objective(team, risk_aversion):
+    return float(squad_objective(team, risk_aversion).sum())
+
+
+def check_scale(latest, risk_aversions=RISK_AVERSIONS, budgets=BUDGETS):
+    """
+    Returns (rows, failures): one row per risk aversion x budget with the pool
+    sizes, objectives and solve times, and the rows whose objectives disagree.
+    """
+    rows, failures = [], []
+    for risk_aversion in risk_aversions:
+        for budget in budgets:
+            start = time.perf_counter()
+            full = optimize_team(latest, risk_aversion, budget, prune=False)
+            full_s = time.perf_counter() - start
+            start = time.perf_counter()
+            pruned = optimize_team(latest, risk_aversion, budget, prune=True)
+            pruned_s = time.perf_counter() - start
+
+            row = {'risk_aversion': risk_aversion, 'budget': budget,
+                   'players': pruned.attrs['pool']['players'], 'candidates': pruned.attrs['pool']['candidates'],
+                   'full': _objective(full, risk_aversion), 'pruned': _objective(pruned, risk_aversion),
+                   'full_s': full_s, 'pruned_s': pruned_s}
+            rows.append(row)
+            if row['pruned'] < row['full'] - TOLERANCE * max(abs(row['full']), 1.0):
+                failures.append(row)
+    return rows, failures
+
+
+def check_scenarios(latest):
+    """
+    Compares optimize_scenarios with and without pruning on a small frontier,
+    including forced and excluded players. Returns the disagreeing scenarios.
+    """
+    top = latest.sort_values('predicted_points', ascending=False)['player_id'].tolist()
+    scenarios = [{'risk_aversion': ra, 'budget': b} for ra in (0.0, 0.2) for b in (1000, 850)]
+    scenarios += [{'risk_aversion': 0.1, 'exclude': top[:5]}, {'risk_aversion': 0.1, 'include': top[-2:]}]
+    frontiers = [optimize_scenarios(latest, scenarios, n_jobs=1, prune=prune)
+                 .groupby('scenario')['objective'].first() for prune in (False, True)]
+    full, pruned = frontiers
+    return [i for i in full.index if pruned[i] < full[i] - TOLERANCE * max(abs(full[i]), 1.0)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scales', type=int, nargs='+', default=[0, 1, 10])
+    parser.add_argument('--data-dir', default=SYNTHETIC_DIR)
+    args = parser.parse_args()
+
+    teams_df = load_team_info()
+    stacked, quantile_models = get_model('stacked'), get_quantile_models()
+    failed = False
+    print(f"{'scale':>5} {'ra':>5} {'budget':>6} {'players':>8} {'kept':>6} {'ratio':>6} "
+          f"{'full obj':>9} {'pruned obj':>10} {'full (s)':>9} {'pruned (s)':>10}")
+    for scale in args.scales:
+        paths = ['data/merged_gw.csv'] if scale == 0 else synthetic_dataset(scale, args.data_dir)
+        latest = latest_predictions(paths, teams_df, stacked, quantile_models)
+        rows, failures = check_scale(latest)
+        for r in rows:
+            print(f"{scale:>5} {r['risk_aversion']:>5} {r['budget']:>6} {r['players']:>8} {r['candidates']:>6} "
+                  f"{r['players'] / r['candidates']:>6.1f} {r['full']:>9.3f} {r['pruned']:>10.3f} "
+                  f"{r['full_s']:>9.3f} {r['pruned_s']:>10.3f}")
+        index = CandidateIndex(latest)
+        print(f"{scale:>5} any risk aversion / budget: {len(latest)} -> {int(index.mask.sum())} "
+              f"({index.reduction_ratio:.1f}x); median solve speedup "
+              f"{np.median([r['full_s'] / r['pruned_s'] for r in rows]):.1f}x")
+        bad_scenarios = check_scenarios(latest)
+        for r in failures:
+            print(f"MISMATCH {scale}x ra={r['risk_aversion']} budget={r['budget']}: "
+                  f"{r['full']:.4f} unpruned vs {r['pruned']:.4f} pruned")
+        for i in bad_scenarios:
+            print(f"MISMATCH {scale}x scenario {i}")
+        failed |= bool(failures or bad_scenarios)
+    if failed:
+        sys.exit(1)
+    print("Pruned objectives match the unpruned solves")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+"""
+Checks the forward fixture features (src.features.build_fixture_features)
+against the historical feature definitions, and times the builder.
+
+Played gameweeks are replayed as "upcoming" fixtures: for every start gameweek
+the builder gets each player's state from the gameweeks before it and the
+fixture list derived from the raw rows. Every forward row must then match the
+historical row of the same player, gameweek and opponent from
+add_contextual_features on is_home, fixture_difficulty and
+opponent_defense_strength, carry the player's latest rolling state, and every
+historical player-fixture must have a forward row. Exits with code 1 on any
+mismatch.
+
+Run from the repository root:
+    python -m benchmarks.check_fixture_features --horizon 3
+"""
+import argparse
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from src.data import load_merged_gws_data, load_team_info
+from src.features import (compute_rolling_features, add_contextual_features, latest_player_state,
+                          build_fixture_features, team_ids, ROLLING_FEATURES)
+
+CONTEXT_COLUMNS = ['is_home', 'fixture_difficulty', 'opponent_defense_strength']
+
+
+def fixtures_from_gws(df_gws, teams_df):
+    """
+    The fixture list (gameweek, team_h, team_a as team ids) of the played gameweeks.
+    """
+    home = df_gws[df_gws['was_home'].astype(bool)]
+    fixtures = pd.DataFrame({'gameweek': home['gameweek'], 'fixture': home['fixture'],
+                             'team_h': team_ids(home['team'], teams_df),
+                             'team_a': team_ids(home['opponent_team'], teams_df)})
+    return fixtures.drop_duplicates(['gameweek', 'fixture']).drop(columns='fixture')
+
+
+def check_start(df_features, fixtures, teams_df, start_gw, horizon):
+    """
+    Returns a list of mismatch descriptions for one start gameweek.
+    """
+    state = latest_player_state(df_features[df_features['gameweek'] < start_gw])
+    forward = build_fixture_features(state, fixtures, teams_df, start_gw, horizon)
+    keys = ['player_id', 'gameweek', 'opponent_team']
+    played = df_features[df_features['gameweek'].between(start_gw, start_gw + horizon - 1)
+                         & df_features['player_id'].isin(state['player_id'])
+                         & (df_features['team'].to_numpy() == df_features['player_id']
+                            .map(state.set_index('player_id')['team']).to_numpy())]
+    merged = played[keys + CONTEXT_COLUMNS].merge(forward[keys + CONTEXT_COLUMNS], on=keys, how='left',
+                                                   suffixes=('', '_forward'), indicator=True)
+    problems = []
+    missing = int((merged['_merge'] == 'left_only').sum())
+    if missing:
+        problems.append(f"GW{start_gw}: {missing} played player-fixtures have no forward row")
+    merged = merged[merged['_merge'] == 'both']
+    for col in CONTEXT_COLUMNS:
+        a, b = merged[col].to_numpy(np.float64), merged[f'{col}_forward'].to_numpy(np.float64)
+        if not np.allclose(a, b, equal_nan=False):
+            problems.append(f"GW{start_gw}: {col} differs on {int((~np.isclose(a, b)).sum())} rows")
+
+    carried = forward.drop_duplicates('player_id').set_index('player_id')
+    expected = state.set_index('player_id').loc[carried.index]
+    for col in ROLLING_FEATURES:
+        if not np.allclose(carried[col], expected[col], equal_nan=True):
+            problems.append(f"GW{start_gw}: {col} not carried from the latest state")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--horizon', type=int, default=3)
+    parser.add_argument('--scale', type=int, default=100, help="Player-pool multiple for the timing run")
+    args = parser.parse_args()
+
+    teams_df = load_team_info()
+    df_gws = load_merged_gws_data()
+    df_features = add_contextual_features(compute_rolling_features(df_gws.copy()), teams_df)
+    fixtures = fixtures_from_gws(df_gws, teams_df)
+
+    problems, checked = [], 0
+    last_gw = int(df_features['gameweek'].max())
+    for start_gw in range(2, last_gw - args.horizon + 2):
+        problems += check_start(df_features, fixtures, teams_df, start_gw, args.horizon)
+        checked += 1
+
+    state = latest_player_state(df_features)
+    offset = int(state['player_id'].max()) + 1
+    big = pd.concat([state.assign(player_id=state['player_id'] + k * offset) for k in range(args.scale)],
+                    ignore_index=True)
+    start = time.perf_counter()
+    forward = build_fixture_features(big, fixtures, teams_df, last_gw - args.horizon + 1, args.horizon)
+    elapsed = time.perf_counter() - start
+    print(f"Checked {checked} start gameweeks (horizon {args.horizon}); "
+          f"{len(big)} players -> {len(forward)} player-fixtures in {elapsed:.3f}s")
+
+    for problem in problems:
+        print(f"MISMATCH {problem}")
+    if problems:
+        sys.exit(1)
+    print("Forward fixture features match the historical definitions")
+
+
+if __name__ == '__main__':
+    main()
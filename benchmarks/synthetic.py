@@ -0,0 +1,146 @@
+"""
+Synthetic merged_gw.csv generator for benchmarks.
+
+Writes season files shaped like data/merged_gw.csv: the GW1–21 header and row
+layout, then GW22+ rows with the seven mng_* columns inserted mid-row, so the
+loader's schema routing is exercised exactly as on the real file. A scale of N
+means N season files with disjoint player ids.
+
+Run from the repository root:
+    python -m benchmarks.synthetic --scale 10
+"""
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+from src.data import OLD_COLUMNS, NEW_COLUMNS
+
+SYNTHETIC_DIR = 'data/cache/synthetic'
+PLAYERS_PER_SEASON = 800
+GAMEWEEKS = 38
+NEW_SCHEMA_FROM = 22
+TEAM_NAMES = [
+    'Arsenal', 'Aston Villa', 'Bournemouth', 'Brentford', 'Brighton', 'Chelsea', 'Crystal Palace', 'Everton',
+    'Fulham', 'Ipswich', 'Leicester', 'Liverpool', 'Man City', 'Man Utd', 'Newcastle', "Nott'm Forest",
+    'Southampton', 'Spurs', 'West Ham', 'Wolves',
+]
+POSITIONS = np.array(['GK', 'DEF', 'MID', 'FWD'])
+POSITION_SHARE = [0.1, 0.34, 0.4, 0.16]
+
+
+def generate_season(n_players=PLAYERS_PER_SEASON, n_gameweeks=GAMEWEEKS, id_offset=0, seed=0):
+    """
+    Returns one season of raw rows as a frame with NEW_COLUMNS (the mng_*
+    columns are only written for GW >= NEW_SCHEMA_FROM), ordered by gameweek.
+    """
+    rng = np.random.default_rng(seed)
+    player = np.arange(n_players)
+    position = rng.choice(POSITIONS, n_players, p=POSITION_SHARE)
+    team = rng.integers(0, len(TEAM_NAMES), n_players)
+    base_cost = rng.integers(40, 130, n_players)
+    quality = rng.gamma(2.0, 1.0, n_players)
+
+    # One row per player per gameweek, gameweek-major like the real file
+    pid = np.tile(player, n_gameweeks)
+    gw = np.repeat(np.arange(1, n_gameweeks + 1), n_players)
+    n = len(pid)
+    minutes = np.where(rng.random(n) < 0.6, rng.integers(0, 91, n), 0)
+    played = minutes > 0
+    goals = rng.poisson(0.15 * quality[pid]) * played
+    assists = rng.poisson(0.12 * quality[pid]) * played
+    xg = np.round(rng.gamma(0.5, 0.2 * quality[pid]) * played, 2)
+    xa = np.round(rng.gamma(0.5, 0.15 * quality[pid]) * played, 2)
+    points = np.where(played, 1 + (minutes >= 60) + 5 * goals + 3 * assists + rng.integers(-1, 3, n), 0)
+    was_home = rng.random(n) < 0.5
+    cost_drift = np.cumsum(rng.integers(-1, 2, (n_gameweeks, n_players)) * (rng.random((n_gameweeks, n_players)) < 0.1), axis=0)
+    kickoff = pd.Timestamp('2024-08-17T14:00:00Z') + pd.to_timedelta((gw - 1) * 7, unit='D')
+
+    df = pd.DataFrame({
+        'name': [f"Synthetic Player {i}" for i in pid + id_offset],
+        'position': position[pid],
+        'team': np.asarray(TEAM_NAMES, dtype=object)[team[pid]],
+        'xP': np.round(rng.gamma(1.5, 1.0, n), 1),
+        'assists': assists,
+        'bonus': rng.integers(0, 4, n) * (points > 6),
+        'bps': rng.integers(-5, 50, n) * played,
+        'clean_sheets': ((rng.random(n) < 0.3) & (minutes >= 60)).astype(int),
+        'creativity': np.round(rng.gamma(1.0, 10.0, n) * played, 1),
+        'element': pid + id_offset + 1,
+        'expected_assists': xa,
+        'expected_goal_involvements': np.round(xg + xa, 2),
+        'expected_goals': xg,
+        'expected_goals_conceded': np.round(rng.gamma(1.0, 1.0, n) * played, 2),
+        'fixture': (gw - 1) * 10 + team[pid] // 2 + 1,
+        'goals_conceded': rng.poisson(1.2, n) * played,
+        'goals_scored': goals,
+        'ict_index': np.round(rng.gamma(1.0, 3.0, n) * played, 1),
+        'influence': np.round(rng.gamma(1.0, 10.0, n) * played, 1),
+        'kickoff_time': kickoff.strftime('%Y-%m-%dT%H:%M:%SZ'),
+        'minutes': minutes,
+        'mng_clean_sheets': 0, 'mng_draw': 0, 'mng_goals_scored': 0, 'mng_loss': 0,
+        'mng_underdog_draw': 0, 'mng_underdog_win': 0, 'mng_win': 0,
+        'modified': False,
+        'opponent_team': (team[pid] + gw) % len(TEAM_NAMES) + 1,
+        'own_goals': ((rng.random(n) < 0.005) & played).astype(int),
+        'penalties_missed': ((rng.random(n) < 0.003) & played).astype(int),
+        'penalties_saved': ((rng.random(n) < 0.01) & (position[pid] == 'GK') & played).astype(int),
+        'red_cards': ((rng.random(n) < 0.003) & played).astype(int),
+        'round': gw,
+        'saves': rng.poisson(2.0, n) * (position[pid] == 'GK') * played,
+        'selected': rng.integers(1_000, 5_000_000, n),
+        'starts': (minutes >= 45).astype(int),
+        'team_a_score': rng.poisson(1.3, n),
+        'team_h_score': rng.poisson(1.5, n),
+        'threat': np.round(rng.gamma(1.0, 10.0, n) * played, 1),
+        'total_points': points,
+        'transfers_balance': rng.integers(-50_000, 50_000, n),
+        'transfers_in': rng.integers(0, 100_000, n),
+        'transfers_out': rng.integers(0, 100_000, n),
+        'value': base_cost[pid] + cost_drift.ravel(),
+        'was_home': was_home,
+        'yellow_cards': ((rng.random(n) < 0.08) & played).astype(int),
+        'GW': gw,
+    })
+    return df[NEW_COLUMNS]
+
+
+def write_season_csv(df, path):
+    """
+    Writes a season in the real file's layout: OLD_COLUMNS header, GW1–21 rows
+    without the mng_* columns, then GW22+ rows with them.
+    """
+    old = df['GW'] < NEW_SCHEMA_FROM
+    df.loc[old, OLD_COLUMNS].to_csv(path, index=False)
+    df.loc[~old].to_csv(path, index=False, header=False, mode='a')
+
+
+def synthetic_dataset(scale, out_dir=SYNTHETIC_DIR, n_players=PLAYERS_PER_SEASON, seed=0):
+    """
+    Returns the paths of `scale` synthetic season files, generating any that
+    are missing. Season k uses player ids offset by k * n_players.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    paths = []
+    for k in range(scale):
+        path = os.path.join(out_dir, f"merged_gw-p{n_players}-s{seed}-{k:03d}.csv")
+        if not os.path.exists(path):
+            season = generate_season(n_players, id_offset=k * n_players, seed=seed + k)
+            write_season_csv(season, path + '.tmp')
+            os.replace(path + '.tmp', path)
+        paths.append(path)
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scale', type=int, default=1)
+    parser.add_argument('--out-dir', default=SYNTHETIC_DIR)
+    args = parser.parse_args()
+    for path in synthetic_dataset(args.scale, args.out_dir):
+        print(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+"""
+Walk-forward backtesting.
+
+For each gameweek k: train on gameweeks < k, predict gameweek k from the
+features of gameweek k - 1 (as the app does for the next gameweek), pick a
+squad with optimize_team and score it on the actual total_points of gameweek k.
+
+The feature matrix is built once, sorted by gameweek, so every fold's
+training set is a zero-copy prefix view of it. Folds run in a process pool;
+with the default fork start method workers inherit the matrix without copying.
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from src.model import (make_stacked_model, make_quantile_model, fit_quantile_model,
+                       feature_matrix, predict_all)
+from src.optimizer import optimize_team
+
+_FOLD_DATA = {}
+
+
+def _init_fold_worker(data):
+    _FOLD_DATA.update(data)
+
+
+def pinball_loss(y_true, y_pred, q):
+    """
+    Mean pinball (quantile) loss.
+    """
+    diff = np.asarray(y_true) - np.asarray(y_pred)
+    return float(np.mean(np.maximum(q * diff, (q - 1) * diff)))
+
+
+def _run_fold(k, risk_aversion, quantiles, n_threads):
+    """
+    Trains on gameweeks < k and evaluates predictions and the optimized squad on gameweek k.
+    """
+    d = _FOLD_DATA
+    X, y, gw = d['X'], d['y'], d['gameweek']
+    val_start, train_end = np.searchsorted(gw, k - 1), np.searchsorted(gw, k)
+
+    # Prefix slices of the gameweek-sorted arrays are views, not copies.
+    stacked = make_stacked_model(n_jobs=n_threads).fit(X[:train_end], y[:train_end])
+    quantile_models = {
+        q: fit_quantile_model(make_quantile_model(q, n_jobs=n_threads),
+                              X[:val_start], y[:val_start], X[val_start:train_end], y[val_start:train_end])
+        for q in quantiles
+    }
+
+    # Latest features (gameweek k - 1), one row per player (last fixture in a double gameweek).
+    latest = d['meta'].iloc[val_start:train_end].copy()
+    latest = latest.join(predict_all(stacked, quantile_models, X[val_start:train_end]).set_index(latest.index))
+    latest = latest.drop_duplicates('player_id', keep='last')
+
+    # Actual points in gameweek k (summed over double gameweeks; blanks score 0).
+    actual = d['actual'].get(k, pd.Series(dtype=float))
+    y_true = latest['player_id'].map(actual).fillna(0).to_numpy()
+
+    squad = optimize_team(latest, risk_aversion=risk_aversion)
+    result = {
+        'gameweek': k,
+        'n_train': int(train_end),
+        'mae': float(np.mean(np.abs(y_true - latest['predicted_points'].to_numpy()))),
+        'squad_points': float(squad['player_id'].map(actual).fillna(0).sum()),
+        'predicted_squad_points': float(squad['predicted_points'].sum()),
+        'status': squad.attrs.get('status'),
+    }
+    for q in quantiles:
+        result[f"pinball_p{int(q * 100)}"] = pinball_loss(y_true, latest[f"predicted_p{int(q * 100)}"], q)
+    return result
+
+
+def walk_forward_backtest(df_features, start_gw=None, end_gw=None, risk_aversion=0.01,
+                          quantiles=(0.1, 0.5, 0.9), target_column='total_points', n_jobs=None):
+    """
+    Runs a walk-forward backtest over gameweeks start_gw..end_gw.
+
+    df_features: output of compute_rolling_features + add_contextual_features.
+    start_gw defaults to the fifth gameweek in the data (so every fold has a
+    training history and a validation gameweek for early stopping).
+
+    Returns one row per fold with MAE, pinball loss per quantile and the
+    realised (actual) and predicted points of the optimized squad. Folds run
+    across `n_jobs` processes; each fold's models get cpu_count // n_jobs threads.
+    """
+    df = df_features.sort_values('gameweek', kind='stable').reset_index(drop=True)
+    gameweeks = np.sort(df['gameweek'].unique())
+    start_gw = start_gw if start_gw is not None else gameweeks[min(4, len(gameweeks) - 1)]
+    end_gw = end_gw if end_gw is not None else gameweeks[-1]
+    folds = [int(k) for k in gameweeks if start_gw <= k <= end_gw]
+
+    actual = df.groupby(['gameweek', 'player_id'])[target_column].sum()
+    data = {
+        'X': feature_matrix(df),
+        'y': df[target_column].to_numpy(dtype=np.float32),
+        'gameweek': df['gameweek'].to_numpy(),
+        'meta': df[['player_id', 'name', 'position', 'team', 'now_cost']],
+        'actual': {k: actual.loc[k] for k in folds},
+    }
+
+    n_jobs = max(1, min(n_jobs or os.cpu_count() or 1, len(folds)))
+    n_threads = max(1, (os.cpu_count() or 1) // n_jobs)
+    args = [(k, risk_aversion, tuple(quantiles), n_threads) for k in folds]
+
+    if n_jobs == 1:
+        _init_fold_worker(data)
+        results = [_run_fold(*a) for a in args]
+    else:
+        with ProcessPoolExecutor(max_workers=n_jobs, initializer=_init_fold_worker, initargs=(data,)) as pool:
+            results = list(pool.map(_run_fold, *zip(*args)))
+    return pd.DataFrame(results)
+
+
+def summarize_backtest(results):
+    """
+    Averages the per-fold metrics and totals the realised squad points.
+    """
+    metrics = [c for c in results.columns if c == 'mae' or c.startswith('pinball_')]
+    summary = results[metrics].mean()
+    summary['squad_points_total'] = results['squad_points'].sum()
+    summary['squad_points_mean'] = results['squad_points'].mean()
+    summary['folds'] = len(results)
+    return summary
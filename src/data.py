@@ -1,73 +1,112 @@
-import pandas as pd
+import hashlib
+import os
 from io import StringIO
 
-def load_merged_gws_data(path="data/merged_gw.csv"):
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+
+from src.instrument import timed, annotate
+
+# Columns for GW1–21 (old structure)
+OLD_COLUMNS = [
+    'name', 'position', 'team', 'xP', 'assists', 'bonus', 'bps', 'clean_sheets', 'creativity',
+    'element', 'expected_assists', 'expected_goal_involvements', 'expected_goals', 'expected_goals_conceded',
+    'fixture', 'goals_conceded', 'goals_scored', 'ict_index', 'influence', 'kickoff_time', 'minutes',
+    'modified', 'opponent_team', 'own_goals', 'penalties_missed', 'penalties_saved', 'red_cards',
+    'round', 'saves', 'selected', 'starts', 'team_a_score', 'team_h_score', 'threat', 'total_points',
+    'transfers_balance', 'transfers_in', 'transfers_out', 'value', 'was_home', 'yellow_cards', 'GW'
+]
+
+# Columns for GW22+ (new structure, with the manager columns inserted mid-row)
+NEW_COLUMNS = [
+    'name', 'position', 'team', 'xP', 'assists', 'bonus', 'bps', 'clean_sheets', 'creativity',
+    'element', 'expected_assists', 'expected_goal_involvements', 'expected_goals', 'expected_goals_conceded',
+    'fixture', 'goals_conceded', 'goals_scored', 'ict_index', 'influence', 'kickoff_time', 'minutes',
+    'mng_clean_sheets', 'mng_draw', 'mng_goals_scored', 'mng_loss', 'mng_underdog_draw', 'mng_underdog_win', 'mng_win',
+    'modified', 'opponent_team', 'own_goals', 'penalties_missed', 'penalties_saved', 'red_cards',
+    'round', 'saves', 'selected', 'starts', 'team_a_score', 'team_h_score', 'threat', 'total_points',
+    'transfers_balance', 'transfers_in', 'transfers_out', 'value', 'was_home', 'yellow_cards', 'GW'
+]
+
+# Raw column -> name used everywhere downstream
+COLUMN_RENAMES = {
+    'element': 'player_id',
+    'GW': 'gameweek',
+    'value': 'now_cost'
+}
+
+CACHE_DIR = "data/cache"
+
+
+def _snapshot_prefix(path):
     """
-    Loads and automatically fixes the merged gameweek data for the 24–25 season.
+    Snapshot filename prefix for a source CSV: its name plus a hash of its
+    absolute path, so same-named files in different directories don't collide.
+    """
+    stem = os.path.splitext(os.path.basename(path))[0]
+    path_hash = hashlib.sha1(os.path.abspath(path).encode()).hexdigest()[:12]
+    return f"{stem}-{path_hash}-"
 
-    Handles the issue where after GW21, extra columns (like mng_win, mng_loss) 
-    are inserted into the middle of the data, corrupting rows.
 
-    Steps:
-      1. Load manually line-by-line
-      2. Split good (GW1–21) and corrupted (GW22–31) parts
-      3. Load separately with correct headers
-      4. Merge back cleanly
-      5. Rename columns and fix types
-    """
-
-    # Define correct columns for GW1–21 (old structure)
-    old_columns = [
-        'name', 'position', 'team', 'xP', 'assists', 'bonus', 'bps', 'clean_sheets', 'creativity',
-        'element', 'expected_assists', 'expected_goal_involvements', 'expected_goals', 'expected_goals_conceded',
-        'fixture', 'goals_conceded', 'goals_scored', 'ict_index', 'influence', 'kickoff_time', 'minutes',
-        'modified', 'opponent_team', 'own_goals', 'penalties_missed', 'penalties_saved', 'red_cards',
-        'round', 'saves', 'selected', 'starts', 'team_a_score', 'team_h_score', 'threat', 'total_points',
-        'transfers_balance', 'transfers_in', 'transfers_out', 'value', 'was_home', 'yellow_cards', 'GW'
-    ]
-
-    # Define corrected columns for GW22+ (new structure)
-    new_columns = [
-        'name', 'position', 'team', 'xP', 'assists', 'bonus', 'bps', 'clean_sheets', 'creativity',
-        'element', 'expected_assists', 'expected_goal_involvements', 'expected_goals', 'expected_goals_conceded',
-        'fixture', 'goals_conceded', 'goals_scored', 'ict_index', 'influence', 'kickoff_time', 'minutes',
-        'mng_clean_sheets', 'mng_draw', 'mng_goals_scored', 'mng_loss', 'mng_underdog_draw', 'mng_underdog_win', 'mng_win',
-        'modified', 'opponent_team', 'own_goals', 'penalties_missed', 'penalties_saved', 'red_cards',
-        'round', 'saves', 'selected', 'starts', 'team_a_score', 'team_h_score', 'threat', 'total_points',
-        'transfers_balance', 'transfers_in', 'transfers_out', 'value', 'was_home', 'yellow_cards', 'GW'
-    ]
-
-    # Load file as raw lines
-    with open(path, 'r') as f:
-        lines = f.readlines()
+def _snapshot_path(path, cache_dir):
+    """
+    Returns the snapshot path for a source CSV, keyed on its absolute path,
+    mtime and size so that any edit to the source invalidates the snapshot.
+    """
+    stat = os.stat(path)
+    return os.path.join(cache_dir, f"{_snapshot_prefix(path)}{stat.st_mtime_ns}-{stat.st_size}.arrow")
 
-    good_lines = []
-    bad_lines = []
 
-    for line in lines:
-        if line.strip() == '':
-            continue
-        if line.count(',') <= len(old_columns):
-            good_lines.append(line)
-        else:
-            bad_lines.append(line)
+def _parse_chunk(lines, columns):
+    """
+    Parses a block of raw lines with the given header and keeps only the old columns.
+    """
+    chunk = pd.read_csv(StringIO(''.join(lines)), names=columns, header=None, on_bad_lines='skip')
+    return chunk[OLD_COLUMNS]
 
-    # Save temp split into dataframes
-    good_df = pd.read_csv(StringIO(''.join(good_lines)), names=old_columns, header=0, on_bad_lines='skip')
-    bad_df = pd.read_csv(StringIO(''.join(bad_lines)), names=new_columns, header=None, on_bad_lines='skip')
 
-    # Clean bad_df: drop extra columns (keep only old_columns)
-    bad_df = bad_df[old_columns]
+def _stream_merged_gws(path, chunk_lines):
+    """
+    Reads the raw file once, chunk by chunk, and yields (schema, frame) per chunk.
 
-    # Merge clean
-    df = pd.concat([good_df, bad_df], ignore_index=True)
+    Each line is routed by its comma count to the GW1–21 or GW22+ buffer; a buffer
+    is parsed as soon as it holds `chunk_lines` lines, so only one chunk of raw
+    text is alive at any time.
+    """
+    buffers = {'old': [], 'new': []}
+    schemas = {'old': OLD_COLUMNS, 'new': NEW_COLUMNS}
+
+    with open(path, 'r') as f:
+        next(f, None)  # header
+        for line in f:
+            if line.strip() == '':
+                continue
+            key = 'old' if line.count(',') <= len(OLD_COLUMNS) else 'new'
+            buffer = buffers[key]
+            buffer.append(line)
+            if len(buffer) >= chunk_lines:
+                yield key, _parse_chunk(buffer, schemas[key])
+                buffer.clear()
+
+    for key, buffer in buffers.items():
+        if buffer:
+            yield key, _parse_chunk(buffer, schemas[key])
+
+
+def _parse_merged_gws(path, chunk_lines):
+    """
+    Parses one season file and applies the column renames and type fixes.
+    """
+    parts = {'old': [], 'new': []}
+    for key, chunk in _stream_merged_gws(path, chunk_lines):
+        parts[key].append(chunk)
+
+    # Merge clean: GW1–21 rows first, then GW22+, each in file order
+    df = pd.concat(parts['old'] + parts['new'], ignore_index=True)
 
     # Rename columns
-    df = df.rename(columns={
-        'element': 'player_id',
-        'GW': 'gameweek',
-        'value': 'now_cost'
-    })
+    df = df.rename(columns=COLUMN_RENAMES)
 
     # Drop 'round' if exists
     if 'round' in df.columns:
@@ -78,6 +117,67 @@ def load_merged_gws_data(path="data/merged_gw.csv"):
 
     return df
 
+
+@timed()
+def load_merged_gws_data(path="data/merged_gw.csv", use_cache=True, cache_dir=CACHE_DIR, chunk_lines=50_000,
+                         columns=None):
+    """
+    Loads and automatically fixes the merged gameweek data for the 24–25 season.
+
+    Handles the issue where after GW21, extra columns (like mng_win, mng_loss)
+    are inserted into the middle of the data, corrupting rows.
+
+    Steps:
+      1. Return the cached Arrow snapshot if the source is unchanged: only the
+         requested `columns` are read, and numeric columns are zero-copy
+         (read-only) views of the memory-mapped file, so a warm load's memory
+         is mostly the string columns
+      2. Otherwise stream the file once in chunks, routing each line to the
+         GW1–21 or GW22+ schema by its comma count
+      3. Keep the old columns only, rename columns and fix types
+      4. Write a typed Arrow snapshot keyed on the file's path, mtime and size
+
+    `path` may also be a list of season files; each one is loaded (and cached)
+    independently and the results are concatenated (which copies them).
+    `columns` selects a subset of the (renamed) columns.
+    """
+    if isinstance(path, (list, tuple)):
+        return pd.concat(
+            [load_merged_gws_data(p, use_cache, cache_dir, chunk_lines, columns) for p in path],
+            ignore_index=True
+        )
+
+    snapshot = _snapshot_path(path, cache_dir) if use_cache else None
+    if snapshot is not None and os.path.exists(snapshot):
+        annotate(snapshot_hit=1)
+        table = feather.read_table(snapshot, columns=columns, memory_map=True)
+        return table.to_pandas(split_blocks=True, self_destruct=True)
+
+    annotate(snapshot_hit=0)
+    df = _parse_merged_gws(path, chunk_lines)
+
+    if snapshot is not None:
+        _write_snapshot(df, snapshot, _snapshot_prefix(path))
+
+    return df if columns is None else df[list(columns)]
+
+
+def _write_snapshot(df, snapshot, prefix):
+    """
+    Writes an uncompressed Arrow IPC snapshot (so it can be memory-mapped) and
+    removes stale snapshots of the same source file (same `prefix`).
+    """
+    cache_dir = os.path.dirname(snapshot)
+    os.makedirs(cache_dir, exist_ok=True)
+    for fname in os.listdir(cache_dir):
+        if fname.startswith(prefix) and fname.endswith('.arrow'):
+            os.remove(os.path.join(cache_dir, fname))
+
+    tmp = snapshot + '.tmp'
+    feather.write_feather(pa.Table.from_pandas(df, preserve_index=False), tmp, compression='uncompressed')
+    os.replace(tmp, snapshot)
+
+
 def load_team_info(path="data/teams.csv"):
     """
     Loads team metadata.
@@ -0,0 +1,283 @@
+"""
+Exact, fast explanations for the tree models.
+
+Each tree base learner is explained with its library's native TreeSHAP output
+(XGBoost pred_contribs, LightGBM pred_contrib, CatBoost ShapValues). The
+stacked model's meta-learner is linear, so its explanation is the
+coefficient-weighted sum of the members' contributions plus a combined base
+value; contributions + base value add up exactly to the prediction.
+
+RandomForest has no native contributions: shap.TreeExplainer is used when shap
+is installed, otherwise the same path-dependent TreeSHAP computed here by
+enumerating each tree's feature subsets (a depth-3 tree uses at most 7
+features, i.e. 128 subsets). Trees using more than MAX_EXACT_FEATURES features
+fall back to Saabas path attributions with a warning; those add up to the
+prediction but are not SHAP values.
+
+Usage:
+    python -m src.explain          # top reasons for the latest gameweek
+"""
+import argparse
+import os
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+from math import factorial
+
+import numpy as np
+import pandas as pd
+
+from src.features import PREDICTORS
+from src.model import feature_matrix
+
+# Exact subset enumeration costs 2**features per tree; beyond this, use Saabas.
+MAX_EXACT_FEATURES = 12
+_MAX_CELLS = 2 ** 22
+
+
+def _xgb_contributions(booster, X, iteration_range=(0, 0)):
+    import xgboost
+    data = xgboost.DMatrix(X, feature_names=booster.feature_names)
+    return booster.predict(data, pred_contribs=True, iteration_range=iteration_range)
+
+
+def _catboost_contributions(model, X):
+    from catboost import Pool
+    return model.get_feature_importance(Pool(X), type='ShapValues')
+
+
+def _tree_go_left(t, X, nodes):
+    """
+    (rows x nodes) boolean: whether each row goes left at each internal node,
+    with missing values routed as the tree was trained to route them.
+    """
+    x = X[:, t.feature[nodes]]
+    go_left = x <= t.threshold[nodes]
+    missing_left = getattr(t, 'missing_go_to_left', None)
+    if missing_left is not None:
+        go_left = np.where(np.isnan(x), missing_left[nodes].astype(bool), go_left)
+    return go_left
+
+
+def _tree_shap(t, X, n_features):
+    """
+    Exact path-dependent TreeSHAP of one sklearn tree (rows x (features + 1)).
+
+    For every subset S of the features the tree splits on, the expected
+    prediction v_S(x) follows x at splits on features in S and splits the
+    weight by node cover otherwise; the Shapley formula over these values gives
+    each feature's contribution and v_{} the base value.
+    """
+    internal = np.flatnonzero(t.children_left >= 0)
+    used = np.unique(t.feature[internal])
+    m = len(used)
+    slot = dict(zip(used, range(m)))
+    cover = t.weighted_n_node_samples
+    value = t.value[:, 0, 0]
+    leaves = np.flatnonzero(t.children_left < 0)
+    subsets = np.arange(2 ** m)
+    follow = ((subsets[:, None] >> np.arange(m)) & 1).astype(bool)
+    sizes = follow.sum(axis=1)
+
+    out = np.zeros((len(X), n_features + 1))
+    step = max(1, _MAX_CELLS // (len(subsets) * t.node_count))
+    for start in range(0, len(X), step):
+        go_left = _tree_go_left(t, X[start:start + step], internal)
+        # Nodes are numbered parent before child, so one pass fills the weights
+        weight = np.zeros((len(subsets), len(go_left), t.node_count))
+        weight[:, :, 0] = 1.0
+        for k, node in enumerate(internal):
+            left, right = t.children_left[node], t.children_right[node]
+            known = follow[:, slot[t.feature[node]]][:, None]
+            weight[:, :, left] = weight[:, :, node] * np.where(known, go_left[None, :, k],
+                                                               cover[left] / cover[node])
+            weight[:, :, right] = weight[:, :, node] * np.where(known, ~go_left[None, :, k],
+                                                                cover[right] / cover[node])
+        v = weight[:, :, leaves] @ value[leaves]
+
+        block = out[start:start + step]
+        for k, feature in enumerate(used):
+            without = subsets[~follow[:, k]]
+            coef = np.array([factorial(s) * factorial(m - s - 1) for s in sizes[without]]) / factorial(m)
+            block[:, feature] = coef @ (v[without | (1 << k)] - v[without])
+        block[:, -1] = v[0]
+    return out
+
+
+def _saabas(t, X, n_features):
+    """
+    Saabas attributions of one sklearn tree: each split's change in node value
+    credited to the split feature (not SHAP values; see _tree_shap).
+    """
+    value = t.value[:, 0, 0]
+    parent = np.full(t.node_count, -1)
+    for children in (t.children_left, t.children_right):
+        internal = children >= 0
+        parent[children[internal]] = np.flatnonzero(internal)
+    # Row `node` credits (value[node] - value[parent]) to the parent's split feature
+    block = np.zeros((t.node_count, n_features))
+    child = np.flatnonzero(parent >= 0)
+    np.add.at(block, (child, t.feature[parent[child]]), value[child] - value[parent[child]])
+    path = t.decision_path(np.ascontiguousarray(X, dtype=np.float32))
+    return np.hstack([path @ block, np.full((len(X), 1), value[0])])
+
+
+def _forest_contributions(forest, X):
+    """
+    Per-feature contributions of a sklearn tree ensemble (averaged over its
+    trees): TreeSHAP via shap if available, else _tree_shap per tree, or
+    Saabas attributions (with a warning) for trees splitting on more than
+    MAX_EXACT_FEATURES features.
+    """
+    try:
+        import shap
+    except ImportError:
+        shap = None
+    if shap is not None:
+        if hasattr(forest, 'feature_names_in_'):
+            X = pd.DataFrame(X, columns=forest.feature_names_in_, copy=False)
+        explainer = shap.TreeExplainer(forest)
+        values = explainer.shap_values(X, check_additivity=False)
+        bias = np.full((len(values), 1), np.ravel(explainer.expected_value)[0])
+        return np.hstack([values, bias])
+
+    # sklearn trees split on float32 inputs
+    X = np.asarray(X, dtype=np.float32)
+    n_features = forest.n_features_in_
+    contributions = np.zeros((len(X), n_features + 1))
+    approximate = 0
+    for tree in forest.estimators_:
+        t = tree.tree_
+        if len(np.unique(t.feature[t.children_left >= 0])) <= MAX_EXACT_FEATURES:
+            contributions += _tree_shap(t, X, n_features)
+        else:
+            contributions += _saabas(t, X, n_features)
+            approximate += 1
+    if approximate:
+        warnings.warn(f"{approximate} of {len(forest.estimators_)} trees split on more than "
+                      f"{MAX_EXACT_FEATURES} features; their contributions are Saabas approximations, "
+                      f"not SHAP values (install shap for exact values).")
+    return contributions / len(forest.estimators_)
+
+
+def tree_contributions(estimator, X):
+    """
+    Returns (rows x (features + 1)) contributions of one tree model for the
+    feature matrix X; the last column is the base value.
+    Accepts the sklearn wrappers and the registry's native boosters.
+    """
+    kind = getattr(estimator, 'kind', None)
+    if kind == 'xgboost':
+        return _xgb_contributions(estimator.booster, X)
+    if kind == 'lightgbm':
+        return estimator.booster.predict(X, pred_contrib=True)
+    if kind == 'catboost':
+        return _catboost_contributions(estimator.booster, X)
+    if hasattr(estimator, 'get_booster'):  # XGBoost sklearn wrapper
+        best = getattr(estimator, 'best_iteration', None)
+        return _xgb_contributions(estimator.get_booster(), X, (0, best + 1) if best is not None else (0, 0))
+    if hasattr(estimator, 'booster_'):  # LightGBM sklearn wrapper (uses best_iteration if set)
+        return estimator.booster_.predict(X, pred_contrib=True)
+    if hasattr(estimator, 'get_feature_importance'):  # CatBoost
+        return _catboost_contributions(estimator, X)
+    if hasattr(estimator, 'estimators_') and hasattr(estimator, 'decision_path'):  # sklearn forests
+        return _forest_contributions(estimator, X)
+    raise TypeError(f"No tree explanation for {type(estimator).__name__}")
+
+
+def is_tree_explainable(model):
+    """
+    True if `model` (a stack or single model) can be explained by tree_contributions.
+    """
+    members = getattr(model, 'estimators_', None) if hasattr(model, 'final_estimator_') else None
+    for estimator in members if members is not None else [model]:
+        if not (getattr(estimator, 'kind', None) in ('xgboost', 'lightgbm', 'catboost')
+                or hasattr(estimator, 'get_booster') or hasattr(estimator, 'booster_')
+                or hasattr(estimator, 'get_feature_importance') or hasattr(estimator, 'decision_path')):
+            return False
+    if members is not None:
+        meta = model.final_estimator_
+        return hasattr(meta, 'coef_') and not getattr(model, 'passthrough', False)
+    return True
+
+
+def shap_values(model, features, batch_size=4096, n_threads=None):
+    """
+    Exact SHAP values of a stacked model (or a single tree model); see the
+    module docstring for the one approximate case, which is warned about.
+
+    `features` is a frame with PREDICTORS columns or an already built float64
+    matrix. Rows are processed in batches; within a batch the members are
+    explained concurrently (the native libraries release the GIL).
+
+    Returns (values, base_values): a (rows x PREDICTORS) array and a (rows,)
+    array, with values.sum(axis=1) + base_values equal to the prediction.
+    """
+    X = feature_matrix(features) if isinstance(features, pd.DataFrame) else \
+        np.ascontiguousarray(features, dtype=np.float64)
+    if hasattr(model, 'final_estimator_'):
+        members = list(model.estimators_)
+        weights = np.asarray(model.final_estimator_.coef_, dtype=np.float64).ravel()
+        intercept = float(np.ravel(model.final_estimator_.intercept_)[0])
+    else:
+        members, weights, intercept = [model], np.ones(1), 0.0
+
+    values = np.zeros((len(X), X.shape[1]))
+    base_values = np.full(len(X), intercept)
+    with ThreadPoolExecutor(max_workers=n_threads or min(len(members), os.cpu_count() or 1)) as pool:
+        for start in range(0, len(X), batch_size):
+            batch = X[start:start + batch_size]
+            rows = slice(start, start + len(batch))
+            for w, phi in zip(weights, pool.map(lambda m: tree_contributions(m, batch), members)):
+                values[rows] += w * phi[:, :-1]
+                base_values[rows] += w * phi[:, -1]
+    return values, base_values
+
+
+def explain_predictions(model, features_df, top_n=3, batch_size=4096, n_threads=None):
+    """
+    Per-player "why this prediction": for each row of `features_df`, the
+    predicted points, the base value and the `top_n` features with the largest
+    absolute contribution ('reason_k' names the feature, 'impact_k' is its
+    signed contribution in points).
+    """
+    values, base_values = shap_values(model, features_df, batch_size, n_threads)
+    id_columns = [c for c in ('player_id', 'name', 'position', 'team') if c in features_df.columns]
+    result = features_df[id_columns].copy()
+    result['predicted_points'] = values.sum(axis=1) + base_values
+    result['base_value'] = base_values
+
+    order = np.argsort(-np.abs(values), axis=1)[:, :top_n]
+    names = np.asarray(PREDICTORS, dtype=object)
+    for k in range(order.shape[1]):
+        result[f'reason_{k + 1}'] = names[order[:, k]]
+        result[f'impact_{k + 1}'] = np.take_along_axis(values, order[:, k:k + 1], axis=1)[:, 0]
+    return result
+
+
+def global_importance(model, features, batch_size=4096, n_threads=None):
+    """
+    Mean absolute SHAP value of each predictor over `features`, sorted
+    descending (the same frame run_shap_analysis returns).
+    """
+    values, _ = shap_values(model, features, batch_size, n_threads)
+    importance = pd.DataFrame({'feature': PREDICTORS, 'mean_abs_shap': np.abs(values).mean(axis=0)})
+    return importance.sort_values('mean_abs_shap', ascending=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Explain the stacked model's latest-gameweek predictions.")
+    parser.add_argument('--top', type=int, default=3)
+    args = parser.parse_args()
+
+    from src.data import load_merged_gws_data, load_team_info
+    from src.features import compute_rolling_features, add_contextual_features
+    from src.registry import get_model
+
+    df = add_contextual_features(compute_rolling_features(load_merged_gws_data()), load_team_info())
+    latest = df[df['gameweek'] == df['gameweek'].max()]
+    explanations = explain_predictions(get_model('stacked'), latest, top_n=args.top)
+    print(explanations.sort_values('predicted_points', ascending=False).to_string(index=False))
+
+
+if __name__ == '__main__':
+    main()
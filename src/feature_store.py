@@ -0,0 +1,214 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+
+from src.features import (ROLLING_FEATURES, ROLLING_STD_FEATURES, compute_rolling_features,
+                          add_contextual_features, prepare_latest_features, compact_dtypes)
+
+STORE_DIR = "data/feature_store"
+
+# Raw stats that feed the rolling windows, in state-array order.
+WINDOW_SOURCES = list(dict.fromkeys(list(ROLLING_FEATURES.values()) + list(ROLLING_STD_FEATURES.values())))
+
+
+# -----------------------------------------
+# 1. Storage layout
+# -----------------------------------------
+def _partition_path(path, gameweek):
+    return os.path.join(path, "features", f"gw={int(gameweek):02d}.arrow")
+
+
+def _state_path(path):
+    return os.path.join(path, "window_state.npz")
+
+
+def _write_partition(path, gameweek, rows):
+    target = _partition_path(path, gameweek)
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    tmp = target + ".tmp"
+    feather.write_feather(pa.Table.from_pandas(rows, preserve_index=False), tmp, compression='uncompressed')
+    os.replace(tmp, target)
+
+
+def _save_state(path, state):
+    os.makedirs(path, exist_ok=True)
+    tmp = _state_path(path) + ".tmp.npz"
+    np.savez(tmp, **state)
+    os.replace(tmp, _state_path(path))
+
+
+def load_window_state(path=STORE_DIR):
+    """
+    Loads the per-player rolling window state:
+      - player_ids: sorted player ids (P,)
+      - values: last `window` raw values per player and stat, oldest first, NaN-padded (P, window, stats)
+      - last_cost: latest now_cost per player (P,)
+      - last_gameweek: the most recent ingested gameweek
+    """
+    with np.load(_state_path(path)) as data:
+        state = {key: data[key] for key in data.files}
+    state['last_gameweek'] = int(state['last_gameweek'])
+    return state
+
+
+def _state_from_history(df, window):
+    """
+    Extracts the window state from a full (raw) history frame.
+    """
+    df = df.sort_values(['player_id', 'gameweek'])
+    tail = df.groupby('player_id', sort=True).tail(window)
+    player_ids, player_slot = np.unique(tail['player_id'].to_numpy(), return_inverse=True)
+
+    # Position of each tail row counted from the player's most recent row.
+    from_end = tail.groupby('player_id').cumcount(ascending=False).to_numpy()
+    values = np.full((len(player_ids), window, len(WINDOW_SOURCES)), np.nan)
+    values[player_slot, window - 1 - from_end] = tail[WINDOW_SOURCES].to_numpy(dtype=np.float64)
+
+    last_cost = df.groupby('player_id', sort=True)['now_cost'].last().to_numpy(dtype=np.float64)
+    return {
+        'player_ids': player_ids,
+        'values': values,
+        'last_cost': last_cost,
+        'last_gameweek': int(df['gameweek'].max()),
+    }
+
+
+# -----------------------------------------
+# 2. Build and incremental update
+# -----------------------------------------
+def build_feature_store(df_gws, teams_df, path=STORE_DIR, window=3):
+    """
+    Bootstraps the feature store from the full gameweek history.
+    Writes one feature partition per gameweek plus the per-player window state,
+    and returns the full feature frame.
+    """
+    df_features = add_contextual_features(compute_rolling_features(df_gws, window=window), teams_df)
+    for gameweek, rows in df_features.groupby('gameweek', sort=True):
+        _write_partition(path, gameweek, rows)
+    _save_state(path, _state_from_history(df_gws, window))
+    return df_features
+
+
+def _extend_state(state, player_ids):
+    """
+    Adds empty windows for players seen for the first time.
+    """
+    new_ids = np.setdiff1d(player_ids, state['player_ids'])
+    if len(new_ids) == 0:
+        return state
+    all_ids = np.concatenate([state['player_ids'], new_ids])
+    order = np.argsort(all_ids, kind='stable')
+    _, window, n_stats = state['values'].shape
+    values = np.concatenate([state['values'], np.full((len(new_ids), window, n_stats), np.nan)])
+    last_cost = np.concatenate([state['last_cost'], np.full(len(new_ids), np.nan)])
+    return dict(state, player_ids=all_ids[order], values=values[order], last_cost=last_cost[order])
+
+
+def _advance_windows(state, rows):
+    """
+    Pushes one row per player into its window and returns the rolling features
+    and cost change for those rows. Touches only the players in `rows`.
+    """
+    idx = np.searchsorted(state['player_ids'], rows['player_id'].to_numpy())
+    values = state['values']
+    window_vals = np.concatenate(
+        [values[idx, 1:], rows[WINDOW_SOURCES].to_numpy(dtype=np.float64)[:, None, :]], axis=1)
+    values[idx] = window_vals
+
+    present = ~np.isnan(window_vals)
+    count = present.sum(axis=1)
+    filled = np.where(present, window_vals, 0.0)
+    total = filled.sum(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.where(count > 0, total / count, np.nan)
+        var = ((filled * filled).sum(axis=1) - total * mean) / (count - 1)
+        std = np.where(count > 1, np.sqrt(np.maximum(var, 0.0)), 0.0)
+
+    now_cost = rows['now_cost'].to_numpy(dtype=np.float64)
+    previous = state['last_cost'][idx]
+    cost_change = np.where(np.isnan(previous), 0.0, now_cost - previous)
+    state['last_cost'][idx] = now_cost
+
+    column = {src: i for i, src in enumerate(WINDOW_SOURCES)}
+    out = {name: mean[:, column[src]] for name, src in ROLLING_FEATURES.items()}
+    out.update({name: std[:, column[src]] for name, src in ROLLING_STD_FEATURES.items()})
+    out['cost_change'] = cost_change
+    return out
+
+
+def update_feature_store(new_rows, teams_df, path=STORE_DIR):
+    """
+    Ingests the raw rows of one or more new gameweeks (as returned by
+    load_merged_gws_data) and computes features for those rows only, carrying
+    the per-player rolling windows forward from the stored state.
+
+    Cost is O(players in the new gameweeks), independent of history length.
+    Returns the feature rows of the newly ingested gameweeks.
+    """
+    state = load_window_state(path)
+    if new_rows['gameweek'].min() <= state['last_gameweek']:
+        raise ValueError(
+            f"Gameweek {new_rows['gameweek'].min()} is already in the feature store "
+            f"(last ingested: {state['last_gameweek']})."
+        )
+
+    state = _extend_state(state, np.unique(new_rows['player_id'].to_numpy()))
+    ingested = []
+    for gameweek, gw_rows in new_rows.groupby('gameweek', sort=True):
+        gw_rows = gw_rows.sort_values(['player_id', 'kickoff_time']).reset_index(drop=True)
+
+        # Double gameweeks: push each player's fixtures in kickoff order.
+        rolled = {}
+        fixture_no = gw_rows.groupby('player_id').cumcount().to_numpy()
+        for k in range(fixture_no.max() + 1):
+            mask = fixture_no == k
+            for name, col in _advance_windows(state, gw_rows[mask]).items():
+                rolled.setdefault(name, np.empty(len(gw_rows)))[mask] = col
+
+        for name in list(ROLLING_FEATURES) + list(ROLLING_STD_FEATURES):
+            gw_rows[name] = rolled[name]
+        features = add_contextual_features(gw_rows, teams_df)
+        # Rows stay in (player_id, kickoff) order, so the computed changes line up.
+        features['cost_change'] = rolled['cost_change']
+        features = compact_dtypes(features)
+
+        _write_partition(path, gameweek, features)
+        ingested.append(features)
+
+    state['last_gameweek'] = int(new_rows['gameweek'].max())
+    _save_state(path, state)
+    return pd.concat(ingested, ignore_index=True)
+
+
+# -----------------------------------------
+# 3. Reading
+# -----------------------------------------
+def stored_gameweeks(path=STORE_DIR):
+    """
+    Lists the gameweeks present in the feature store, in order.
+    """
+    folder = os.path.join(path, "features")
+    if not os.path.isdir(folder):
+        return []
+    return sorted(int(f[3:-6]) for f in os.listdir(folder) if f.startswith("gw=") and f.endswith(".arrow"))
+
+
+def load_feature_store(path=STORE_DIR, gameweeks=None):
+    """
+    Loads the stored feature rows (memory-mapped), optionally for selected gameweeks only.
+    """
+    gameweeks = stored_gameweeks(path) if gameweeks is None else gameweeks
+    parts = [feather.read_table(_partition_path(path, gw), memory_map=True).to_pandas() for gw in gameweeks]
+    return compact_dtypes(pd.concat(parts, ignore_index=True))
+
+
+def load_latest_features(path=STORE_DIR):
+    """
+    Returns prepare_latest_features for the most recent stored gameweek,
+    reading only that gameweek's partition.
+    """
+    latest_gw = stored_gameweeks(path)[-1]
+    return prepare_latest_features(load_feature_store(path, [latest_gw]), latest_gw)
@@ -1,5 +1,109 @@
+import numpy as np
 import pandas as pd
 
+from src.instrument import timed
+
+# Rolling means: output column -> source column.
+ROLLING_FEATURES = {
+    'rolling_points': 'total_points',
+    'rolling_minutes': 'minutes',
+    'rolling_goals': 'goals_scored',
+    'rolling_assists': 'assists',
+    'rolling_xG': 'expected_goals',
+    'rolling_xA': 'expected_assists',
+    'rolling_xGI': 'expected_goal_involvements',
+}
+
+# Rolling std deviations: output column -> source column.
+ROLLING_STD_FEATURES = {
+    'rolling_points_std': 'total_points',
+}
+
+# Define the full predictor list including new features.
+PREDICTORS = [
+    'rolling_points', 'rolling_minutes', 'rolling_goals', 'rolling_assists',
+    'rolling_xG', 'rolling_xA', 'rolling_xGI', 'rolling_points_std',
+    'now_cost', 'cost_change', 'is_home', 'fixture_difficulty', 'opponent_defense_strength'
+]
+
+# Raw columns the feature functions read (compute_rolling_features,
+# add_contextual_features, prepare_latest_features).
+FEATURE_SOURCE_COLUMNS = [
+    'player_id', 'gameweek', 'name', 'position', 'team', 'opponent_team', 'was_home', 'now_cost',
+    *dict.fromkeys(list(ROLLING_FEATURES.values()) + list(ROLLING_STD_FEATURES.values())),
+]
+
+# Low-cardinality string columns stored as pandas categoricals.
+CATEGORICAL_COLUMNS = ['name', 'position']
+
+
+def _group_starts(keys):
+    """
+    For rows sorted by `keys`, returns the index of the first row of each row's group.
+    """
+    n = len(keys)
+    idx = np.arange(n)
+    is_start = np.ones(n, dtype=bool)
+    is_start[1:] = keys[1:] != keys[:-1]
+    return np.maximum.accumulate(np.where(is_start, idx, 0))
+
+
+def _is_player_sorted(df):
+    """
+    True if rows are already ordered by (player_id, gameweek).
+    """
+    pid = df['player_id'].to_numpy()
+    gw = df['gameweek'].to_numpy()
+    same = pid[1:] == pid[:-1]
+    return bool(np.all((pid[1:] > pid[:-1]) | (same & (gw[1:] >= gw[:-1]))))
+
+
+def _rolling_moments(values, group_start, window):
+    """
+    Windowed count, sum and sum of squares over the trailing `window` rows of
+    each group, for every column of `values` (n_rows x n_cols) at once.
+
+    Each lag is a shifted view of the sorted array masked at group boundaries,
+    so the whole computation is `window` vectorized passes with no cumulative
+    rounding error. NaNs are skipped, matching pandas' rolling(min_periods=1).
+    """
+    n = values.shape[0]
+    idx = np.arange(n)
+    present = ~np.isnan(values)
+    filled = np.where(present, values, 0.0)
+
+    count = np.zeros(values.shape)
+    total = np.zeros(values.shape)
+    total_sq = np.zeros(values.shape)
+    for lag in range(window):
+        valid = (idx - lag >= group_start)[lag:, None]
+        count[lag:] += present[:n - lag] & valid
+        shifted = np.where(valid, filled[:n - lag], 0.0)
+        total[lag:] += shifted
+        total_sq[lag:] += shifted * shifted
+    return count, total, total_sq
+
+
+def compact_dtypes(df):
+    """
+    Downcasts float64 columns to float32 and converts string columns listed in
+    CATEGORICAL_COLUMNS to categoricals, in place. Returns the frame.
+
+    PREDICTORS and the raw columns they are computed from stay float64: the
+    committed models were trained on float64 features and their predictions
+    move by up to a point when the inputs are rounded to float32.
+    """
+    keep = set(PREDICTORS) | set(FEATURE_SOURCE_COLUMNS)
+    for col in df.columns[df.dtypes == np.float64]:
+        if col not in keep:
+            df[col] = df[col].astype(np.float32)
+    for col in CATEGORICAL_COLUMNS:
+        if col in df.columns and df[col].dtype == object:
+            df[col] = df[col].astype('category')
+    return df
+
+
+@timed()
 def compute_rolling_features(df, window=3):
     """
     Compute rolling features for each player based on gameweek data.
@@ -12,30 +116,68 @@ def compute_rolling_features(df, window=3):
       - expected_assists (rolling_xA)
       - expected_goal_involvements (rolling_xGI)
     Also computes rolling std deviation for points (rolling_points_std).
+
+    All windows are computed in a single grouped pass over the player-sorted
+    NumPy arrays; the rolling features are float64 (see compact_dtypes).
     """
     df = df.sort_values(by=["player_id", "gameweek"])
 
-    df['rolling_points'] = df.groupby('player_id')['total_points'] \
-                               .rolling(window=window, min_periods=1).mean().reset_index(0, drop=True)
-    df['rolling_minutes'] = df.groupby('player_id')['minutes'] \
-                                .rolling(window=window, min_periods=1).mean().reset_index(0, drop=True)
-    df['rolling_goals'] = df.groupby('player_id')['goals_scored'] \
-                              .rolling(window=window, min_periods=1).mean().reset_index(0, drop=True)
-    df['rolling_assists'] = df.groupby('player_id')['assists'] \
-                                .rolling(window=window, min_periods=1).mean().reset_index(0, drop=True)
-    df['rolling_xG'] = df.groupby('player_id')['expected_goals'] \
-                            .rolling(window=window, min_periods=1).mean().reset_index(0, drop=True)
-    df['rolling_xA'] = df.groupby('player_id')['expected_assists'] \
-                            .rolling(window=window, min_periods=1).mean().reset_index(0, drop=True)
-    df['rolling_xGI'] = df.groupby('player_id')['expected_goal_involvements'] \
-                            .rolling(window=window, min_periods=1).mean().reset_index(0, drop=True)
-    
+    group_start = _group_starts(df['player_id'].to_numpy())
+    sources = list(dict.fromkeys(list(ROLLING_FEATURES.values()) + list(ROLLING_STD_FEATURES.values())))
+    values = df[sources].to_numpy(dtype=np.float64)
+    count, total, total_sq = _rolling_moments(values, group_start, window)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.where(count > 0, total / count, np.nan)
+        # Sample variance (ddof=1), as pandas' rolling std
+        var = (total_sq - total * mean) / (count - 1)
+        std = np.where(count > 1, np.sqrt(np.maximum(var, 0.0)), np.nan)
+
+    column = {src: i for i, src in enumerate(sources)}
+    for out, src in ROLLING_FEATURES.items():
+        df[out] = mean[:, column[src]]
+
     # Rolling Std Dev of Points (captures volatility)
-    df['rolling_points_std'] = df.groupby('player_id')['total_points'] \
-                                    .rolling(window=window, min_periods=1).std().reset_index(0, drop=True).fillna(0)
-    
-    return df
+    for out, src in ROLLING_STD_FEATURES.items():
+        df[out] = np.nan_to_num(std[:, column[src]], nan=0.0)
+
+    return compact_dtypes(df)
+
+
+def team_strength_table(teams_df, home_column='strength_overall_home', away_column='strength_overall_away'):
+    """
+    Builds (home, away) strength arrays indexed directly by team id.
+    Unknown ids map to NaN.
+    """
+    ids = teams_df['id'].to_numpy()
+    home = np.full(ids.max() + 1, np.nan)
+    away = np.full(ids.max() + 1, np.nan)
+    home[ids] = teams_df[home_column].to_numpy()
+    away[ids] = teams_df[away_column].to_numpy()
+    return home, away
+
 
+def lookup_team(table, team_ids):
+    """
+    Vectorized lookup of a per-team array; missing or unknown ids give NaN.
+    """
+    ids = pd.to_numeric(pd.Series(team_ids), errors='coerce').to_numpy(dtype=np.float64)
+    valid = ~np.isnan(ids) & (ids >= 0) & (ids < len(table))
+    out = np.full(len(ids), np.nan)
+    out[valid] = table[ids[valid].astype(np.intp)]
+    return out
+
+
+def team_ids(values, teams_df):
+    """
+    Team ids for a column holding team names or ids: names are mapped through
+    teams_df, numeric values are taken as ids already.
+    """
+    team_name_to_id = teams_df.set_index('name')['id'].to_dict()
+    return values.map(team_name_to_id).fillna(pd.to_numeric(values, errors='coerce'))
+
+
+@timed()
 def add_contextual_features(df, teams_df):
     """
     Adds contextual features:
@@ -44,37 +186,30 @@ def add_contextual_features(df, teams_df):
     - Opponent Strength
     - Player Cost Change
     """
-    # Map team names to IDs
-    team_name_to_id = teams_df.set_index('name')['id'].to_dict()
-    df['team'] = df['team'].map(team_name_to_id)
-    df['opponent_team'] = df['opponent_team'].map(team_name_to_id)
-
-    # Sort before diff
-    df = df.sort_values(['player_id', 'gameweek'])
-
-    # Merge player team strength
-    teams_strength_player = teams_df[['id', 'strength_overall_home', 'strength_overall_away']].rename(columns={
-        'id': 'team_id',
-        'strength_overall_home': 'team_strength_home',
-        'strength_overall_away': 'team_strength_away'
-    })
-    df = df.merge(teams_strength_player, left_on='team', right_on='team_id', how='left')
-
-    # Merge opponent team strength
-    teams_strength_opponent = teams_df[['id', 'strength_overall_home', 'strength_overall_away']].rename(columns={
-        'id': 'opponent_team_id',
-        'strength_overall_home': 'opponent_strength_home',
-        'strength_overall_away': 'opponent_strength_away'
-    })
-    df = df.merge(teams_strength_opponent, left_on='opponent_team', right_on='opponent_team_id', how='left')
+    # Map team names to IDs (the raw opponent_team column already holds ids)
+    df['team'] = team_ids(df['team'], teams_df)
+    df['opponent_team'] = team_ids(df['opponent_team'], teams_df)
+
+    # Sort before diff (already sorted when coming from compute_rolling_features)
+    if not _is_player_sorted(df):
+        df = df.sort_values(['player_id', 'gameweek'])
+    df = df.reset_index(drop=True)
+
+    # Player and opponent team strength, looked up by team id
+    strength_home, strength_away = team_strength_table(teams_df)
+    df['team_strength_home'] = lookup_team(strength_home, df['team'])
+    df['team_strength_away'] = lookup_team(strength_away, df['team'])
+    df['opponent_strength_home'] = lookup_team(strength_home, df['opponent_team'])
+    df['opponent_strength_away'] = lookup_team(strength_away, df['opponent_team'])
 
     # Home/Away flag
     df['is_home'] = df['was_home'].astype(int)
 
     # Dynamic opponent strength depending on venue
-    df['opponent_strength'] = df.apply(
-        lambda row: row['opponent_strength_away'] if row['was_home'] else row['opponent_strength_home'],
-        axis=1
+    df['opponent_strength'] = np.where(
+        df['was_home'].to_numpy(dtype=bool),
+        df['opponent_strength_away'].to_numpy(),
+        df['opponent_strength_home'].to_numpy()
     )
 
     # Fixture Difficulty
@@ -83,14 +218,16 @@ def add_contextual_features(df, teams_df):
     # Opponent Defense Strength (could use home or away depending)
     df['opponent_defense_strength'] = df['opponent_strength']
 
-    # Cost Change
-    df['cost_change'] = df.groupby('player_id')['now_cost'].diff().fillna(0)
-
-    # Clean up
-    df = df.drop(columns=['team_id', 'opponent_team_id'])
+    # Cost Change (zero on each player's first row)
+    cost = df['now_cost'].to_numpy(dtype=np.float64)
+    cost_change = np.zeros(len(df))
+    cost_change[1:] = cost[1:] - cost[:-1]
+    cost_change[_group_starts(df['player_id'].to_numpy()) == np.arange(len(df))] = 0
+    df['cost_change'] = cost_change
 
     return df
 
+
 def prepare_latest_features(df, latest_gw):
     """
     Extracts the latest gameweek features for each player.
@@ -106,3 +243,110 @@ def prepare_latest_features(df, latest_gw):
                           'is_home', 'fixture_difficulty', 'opponent_defense_strength']]
     
     return features
+
+
+# Per-player state carried into the forward (upcoming fixture) features.
+PLAYER_STATE_COLUMNS = ['player_id', 'name', 'position', 'team',
+                        *ROLLING_FEATURES, *ROLLING_STD_FEATURES, 'now_cost', 'cost_change']
+
+
+def latest_player_state(df):
+    """
+    Returns each player's most recent row (by gameweek) of PLAYER_STATE_COLUMNS
+    from a frame with rolling and contextual features.
+    """
+    if not _is_player_sorted(df):
+        df = df.sort_values(['player_id', 'gameweek'], kind='stable')
+    player_id = df['player_id'].to_numpy()
+    last = np.ones(len(df), dtype=bool)
+    last[:-1] = player_id[1:] != player_id[:-1]
+    return df.loc[last, PLAYER_STATE_COLUMNS].reset_index(drop=True)
+
+
+def team_fixtures(fixtures):
+    """
+    Expands a fixture list (gameweek or event, team_h, team_a as team ids) into
+    one row per team per fixture: arrays (gameweek, team, opponent, is_home).
+    Fixtures not scheduled yet (null event, as in the FPL API) are skipped.
+    """
+    gameweek_column = 'gameweek' if 'gameweek' in fixtures.columns else 'event'
+    fixtures = fixtures.dropna(subset=[gameweek_column, 'team_h', 'team_a'])
+    gameweek = fixtures[gameweek_column].to_numpy(dtype=np.int64)
+    home = fixtures['team_h'].to_numpy(dtype=np.int64)
+    away = fixtures['team_a'].to_numpy(dtype=np.int64)
+    return (np.concatenate([gameweek, gameweek]), np.concatenate([home, away]),
+            np.concatenate([away, home]), np.repeat(np.array([1, 0]), len(gameweek)))
+
+
+@timed()
+def build_fixture_features(state, fixtures, teams_df, start_gw=None, horizon=1):
+    """
+    Forward features for the upcoming fixtures: one row per player-fixture for
+    gameweeks start_gw .. start_gw + horizon - 1.
+
+    - state: latest_player_state() output (the rolling state is carried forward)
+    - fixtures: upcoming fixture list with gameweek (or event), team_h, team_a
+      (team ids, as in teams.csv); start_gw defaults to its first gameweek
+
+    is_home, fixture_difficulty and opponent_defense_strength come from the
+    fixture's opponent and venue (same definitions as add_contextual_features),
+    looked up in the team-strength arrays. Teams without a fixture in a gameweek
+    (blanks) get no row; 'fixture_count' is the player's number of fixtures in
+    that gameweek (2 for a double). See aggregate_fixtures to combine them.
+    """
+    gameweek, team, opponent, is_home = team_fixtures(fixtures)
+    if start_gw is None:
+        start_gw = int(gameweek.min()) if len(gameweek) else 0
+    window = (gameweek >= start_gw) & (gameweek < start_gw + horizon)
+    gameweek, team, opponent, is_home = gameweek[window], team[window], opponent[window], is_home[window]
+
+    # Fixtures per team per gameweek (doubles / blanks)
+    key = team * 100 + gameweek
+    _, inverse, counts = np.unique(key, return_inverse=True, return_counts=True)
+    fixture_count = counts[inverse]
+
+    # Join players to their team's fixtures without a pandas merge
+    order = np.argsort(team, kind='stable')
+    sorted_team = team[order]
+    player_team = pd.to_numeric(state['team'], errors='coerce').fillna(-1).to_numpy(dtype=np.int64)
+    lo = np.searchsorted(sorted_team, player_team, side='left')
+    n = np.searchsorted(sorted_team, player_team, side='right') - lo
+    player_rows = np.repeat(np.arange(len(state)), n)
+    offsets = np.arange(len(player_rows)) - np.repeat(np.cumsum(n) - n, n)
+    fixture_rows = order[np.repeat(lo, n) + offsets]
+
+    strength_home, strength_away = team_strength_table(teams_df)
+    home = is_home[fixture_rows].astype(bool)
+    opponent_strength = np.where(home, lookup_team(strength_away, opponent[fixture_rows]),
+                                 lookup_team(strength_home, opponent[fixture_rows]))
+
+    out = state.iloc[player_rows].reset_index(drop=True)
+    out.insert(4, 'gameweek', gameweek[fixture_rows])
+    out.insert(5, 'opponent_team', opponent[fixture_rows])
+    out['is_home'] = home.astype(int)
+    out['fixture_difficulty'] = opponent_strength - lookup_team(strength_home, team[fixture_rows])
+    out['opponent_defense_strength'] = opponent_strength
+    out['fixture_count'] = fixture_count[fixture_rows]
+    return out
+
+
+def aggregate_fixtures(df, sum_columns=('predicted_points',), gameweeks=None):
+    """
+    Combines per-fixture rows into one row per player per gameweek, summing
+    `sum_columns` (e.g. predictions) over a double gameweek. If `gameweeks` is
+    given, blank gameweeks are added as rows with zero fixtures and zero sums.
+    """
+    sum_columns = [c for c in sum_columns if c in df.columns]
+    keys = ['player_id', 'gameweek']
+    per_player = [c for c in df.columns if c in ('name', 'position', 'team', 'now_cost')]
+    grouped = df.groupby(keys, sort=True)
+    out = grouped[sum_columns].sum()
+    out['fixture_count'] = grouped.size()
+    out = out.join(grouped[per_player].first()).reset_index()
+
+    if gameweeks is not None:
+        players = df.drop_duplicates('player_id')[['player_id', *per_player]]
+        full = pd.MultiIndex.from_product([players['player_id'], list(gameweeks)], names=keys)
+        out = (out.set_index(keys).drop(columns=per_player).reindex(full, fill_value=0)
+               .reset_index().merge(players, on='player_id', how='left'))
+    return out[keys + per_player + sum_columns + ['fixture_count']]
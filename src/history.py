@@ -0,0 +1,246 @@
+"""
+Multi-season historical store.
+
+Each season's merged_gw file is ingested once into a Parquet dataset under
+HISTORY_DIR, hive-partitioned as season=<season>/gameweek=<gw>/. The schema is
+normalized at ingestion: the GW22+ mng_* layout is repaired, raw columns are
+renamed (element -> player_id, ...), every column is cast to HISTORY_SCHEMA and
+columns a season lacks (e.g. expected_goals before 2022-23) are stored as nulls.
+
+Queries push the column projection and the season/gameweek filters down to the
+Parquet reader: partitions outside the filter are never opened and only the
+requested column chunks are read.
+
+Team ids and strengths change between seasons, so each season's teams.csv is
+stored with it (under _teams/, which dataset discovery ignores) and used when
+that season's features are computed.
+
+Usage:
+    python -m src.history ingest 2024-25 data/merged_gw.csv --teams data/teams.csv
+    python -m src.history list
+"""
+import argparse
+import csv
+import logging
+import os
+import shutil
+import tempfile
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+
+from src.data import OLD_COLUMNS, NEW_COLUMNS, COLUMN_RENAMES, load_merged_gws_data
+from src.features import FEATURE_SOURCE_COLUMNS
+
+logger = logging.getLogger(__name__)
+
+HISTORY_DIR = 'data/history'
+TEAMS_DIR = '_teams'
+
+PARTITIONING_SCHEMA = pa.schema([('season', pa.string()), ('gameweek', pa.int64())])
+
+# Stored (non-partition) columns and their types, after renaming.
+_STRING_COLUMNS = ['name', 'position', 'team', 'kickoff_time']
+_FLOAT_COLUMNS = ['xP', 'creativity', 'expected_assists', 'expected_goal_involvements', 'expected_goals',
+                  'expected_goals_conceded', 'ict_index', 'influence', 'threat']
+_BOOL_COLUMNS = ['modified', 'was_home']
+HISTORY_SCHEMA = pa.schema([
+    (COLUMN_RENAMES.get(c, c),
+     pa.string() if c in _STRING_COLUMNS else pa.float64() if c in _FLOAT_COLUMNS
+     else pa.bool_() if c in _BOOL_COLUMNS else pa.int64())
+    for c in OLD_COLUMNS if c not in ('round', 'GW')
+])
+
+
+def _partitioning():
+    return ds.partitioning(PARTITIONING_SCHEMA, flavor='hive')
+
+
+# -----------------------------------------
+# 1. Ingestion
+# -----------------------------------------
+def _read_season(path):
+    """
+    Reads one raw season file into a frame with the renamed columns. Files with
+    the 24–25 layout (OLD_COLUMNS header, mng_* columns inserted from GW22) go
+    through the repairing loader; any other file is a regular CSV whose own
+    header is trusted.
+    """
+    with open(path, newline='') as f:
+        header = next(csv.reader(f))
+    if header in (OLD_COLUMNS, NEW_COLUMNS):
+        return load_merged_gws_data(path, use_cache=False)
+    wanted = set(OLD_COLUMNS) - {'round'}
+    df = pd.read_csv(path, usecols=lambda c: c in wanted, on_bad_lines='skip')
+    return df.rename(columns=COLUMN_RENAMES)
+
+
+def normalize_season(df, season):
+    """
+    Casts a season frame to HISTORY_SCHEMA (missing columns become nulls) and
+    adds the partition columns. Returns a pyarrow Table.
+    """
+    arrays = {}
+    for field in HISTORY_SCHEMA:
+        if field.name in df.columns:
+            values = df[field.name]
+            if pa.types.is_floating(field.type) or pa.types.is_integer(field.type):
+                values = pd.to_numeric(values, errors='coerce')
+            elif pa.types.is_boolean(field.type) and values.dtype == object:
+                values = values.map({'True': True, 'False': False, True: True, False: False})
+            arrays[field.name] = pa.array(values, from_pandas=True).cast(field.type, safe=False)
+        else:
+            arrays[field.name] = pa.nulls(len(df), field.type)
+    arrays['season'] = pa.array([season] * len(df), pa.string())
+    arrays['gameweek'] = pa.array(pd.to_numeric(df['gameweek']), pa.int64())
+    return pa.table(arrays, schema=HISTORY_SCHEMA.append(PARTITIONING_SCHEMA.field('season'))
+                    .append(PARTITIONING_SCHEMA.field('gameweek')))
+
+
+def ingest_season(path, season, root=HISTORY_DIR, teams_path=None):
+    """
+    Ingests one merged_gw file as `season` (e.g. '2024-25'), replacing
+    everything previously ingested for that season, and stores the season's
+    teams table if `teams_path` is given. Returns the number of rows written.
+
+    The season is written to a staging directory first and swapped in, so a
+    failed ingest leaves the previous data in place.
+    """
+    table = normalize_season(_read_season(path), season)
+    os.makedirs(root, exist_ok=True)
+    staging = tempfile.mkdtemp(prefix='_ingest-', dir=root)
+    try:
+        ds.write_dataset(table, staging, format='parquet', partitioning=_partitioning(),
+                         basename_template='part-{i}.parquet')
+        target = os.path.join(root, f"season={season}")
+        shutil.rmtree(target, ignore_errors=True)
+        os.replace(os.path.join(staging, f"season={season}"), target)
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+
+    if teams_path is not None:
+        os.makedirs(os.path.join(root, TEAMS_DIR), exist_ok=True)
+        pd.read_csv(teams_path).to_parquet(os.path.join(root, TEAMS_DIR, f"{season}.parquet"), index=False)
+    return table.num_rows
+
+
+def load_season_teams(season, root=HISTORY_DIR):
+    """
+    The teams table stored for `season`, or None if none was ingested.
+    """
+    path = os.path.join(root, TEAMS_DIR, f"{season}.parquet")
+    return pd.read_parquet(path) if os.path.exists(path) else None
+
+
+# -----------------------------------------
+# 2. Queries
+# -----------------------------------------
+def history_dataset(root=HISTORY_DIR):
+    """
+    The store as a pyarrow Dataset (season and gameweek are partition fields).
+    """
+    schema = HISTORY_SCHEMA.append(PARTITIONING_SCHEMA.field('season')) \
+                           .append(PARTITIONING_SCHEMA.field('gameweek'))
+    return ds.dataset(root, format='parquet', partitioning=_partitioning(), schema=schema)
+
+
+def seasons(root=HISTORY_DIR):
+    """
+    Ingested seasons, sorted.
+    """
+    if not os.path.isdir(root):
+        return []
+    return sorted(d.split('=', 1)[1] for d in os.listdir(root) if d.startswith('season='))
+
+
+def _filter(seasons=None, gameweeks=None, where=None):
+    expression = None
+    for part in (
+        ds.field('season').isin(list(seasons)) if seasons is not None else None,
+        ds.field('gameweek').isin([int(g) for g in gameweeks]) if gameweeks is not None else None,
+        where,
+    ):
+        if part is not None:
+            expression = part if expression is None else expression & part
+    return expression
+
+
+def read_history(columns=None, seasons=None, gameweeks=None, where=None, root=HISTORY_DIR):
+    """
+    Reads from the store with column projection and filters pushed down.
+
+    - columns: columns to read (default: all); 'season'/'gameweek' may be included
+    - seasons: iterable of seasons to read (default: all)
+    - gameweeks: iterable of gameweeks, e.g. range(1, 20) (default: all)
+    - where: an extra pyarrow.dataset expression, e.g. ds.field('minutes') > 0
+
+    Returns a pandas DataFrame.
+    """
+    table = history_dataset(root).to_table(columns=columns, filter=_filter(seasons, gameweeks, where))
+    return table.to_pandas()
+
+
+def load_feature_source(seasons=None, gameweeks=None, root=HISTORY_DIR):
+    """
+    Reads only FEATURE_SOURCE_COLUMNS (plus season) for the selected partitions.
+    """
+    return read_history(['season', *FEATURE_SOURCE_COLUMNS], seasons, gameweeks, root=root)
+
+
+def _season_teams(season, teams_df, root):
+    if isinstance(teams_df, dict) and season in teams_df:
+        return teams_df[season]
+    if isinstance(teams_df, pd.DataFrame):
+        return teams_df
+    teams = load_season_teams(season, root)
+    if teams is None:
+        from src.data import load_team_info
+        logger.warning("No teams table stored for %s; using data/teams.csv", season)
+        teams = load_team_info()
+    return teams
+
+
+def load_history_features(seasons=None, gameweeks=None, teams_df=None, window=3, root=HISTORY_DIR):
+    """
+    Computes the model features over several seasons. Player ids are only
+    unique within a season, so features are computed per season and the
+    results concatenated (with a 'season' column).
+
+    Each season uses its own teams table: `teams_df` may be a {season: frame}
+    dict or one frame for every season; by default the table stored at
+    ingestion is used (data/teams.csv, with a warning, if there is none).
+    """
+    from src.features import compute_rolling_features, add_contextual_features
+
+    source = load_feature_source(seasons, gameweeks, root)
+    parts = [
+        add_contextual_features(compute_rolling_features(group.drop(columns='season'), window),
+                                _season_teams(season, teams_df, root))
+        .assign(season=season)
+        for season, group in source.groupby('season', sort=True)
+    ]
+    return pd.concat(parts, ignore_index=True) if parts else source
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Multi-season historical store.")
+    sub = parser.add_subparsers(dest='command', required=True)
+    ingest = sub.add_parser('ingest', help="Ingest a season's merged_gw file")
+    ingest.add_argument('season')
+    ingest.add_argument('path')
+    ingest.add_argument('--teams', default=None, help="The season's teams.csv")
+    sub.add_parser('list', help="List ingested seasons and row counts")
+    args = parser.parse_args()
+
+    if args.command == 'ingest':
+        rows = ingest_season(args.path, args.season, teams_path=args.teams)
+        print(f"Ingested {rows} rows for {args.season} into {HISTORY_DIR}")
+    else:
+        dataset = history_dataset()
+        for season in seasons():
+            print(f"{season}: {dataset.count_rows(filter=ds.field('season') == season)} rows")
+
+
+if __name__ == '__main__':
+    main()
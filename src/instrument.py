@@ -0,0 +1,299 @@
+"""
+Lightweight stage instrumentation: spans, metrics, structured logs, profiling.
+
+Disabled by default; when disabled `span()` returns a shared no-op and `timed`
+functions cost one flag check per call. Enable with CATAPULT_METRICS=1 (or
+`enable()`). When enabled each span records:
+  - wall time, row count (len of a returned frame/array, or set explicitly),
+    RSS delta (Linux /proc/self/statm)
+  - any attributes annotated inside it, e.g. solver status, MIP gap, node count
+and emits one JSON log line on the 'catapult.metrics' logger. Aggregates are
+exposed as Prometheus text by `prometheus_text()` (served at /metrics by
+src.server).
+
+Profiling a stage: CATAPULT_PROFILE=<span name>[,<span name>...] (or '*')
+writes one profile per matching span to CATAPULT_PROFILE_DIR (default
+'profiles'): a cProfile .prof file, or with CATAPULT_PROFILER=sample a
+collapsed-stack .folded file (flamegraph input) sampled every 5 ms.
+
+    with span('optimizer.solve') as s:
+        ...
+        s.set(status=status, mip_gap=gap)
+
+    @timed('features.compute_rolling_features')
+    def compute_rolling_features(df, window=3): ...
+"""
+import cProfile
+import functools
+import itertools
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+
+logger = logging.getLogger('catapult.metrics')
+
+_enabled = os.environ.get('CATAPULT_METRICS', '').lower() in ('1', 'true', 'yes')
+_profile_stages = {s.strip() for s in os.environ.get('CATAPULT_PROFILE', '').split(',') if s.strip()}
+_profile_dir = os.environ.get('CATAPULT_PROFILE_DIR', 'profiles')
+_profiler_kind = os.environ.get('CATAPULT_PROFILER', 'cprofile')
+
+_lock = threading.Lock()
+_metrics = {}
+_local = threading.local()
+_profile_ids = itertools.count()
+
+try:
+    _PAGE_SIZE = os.sysconf('SC_PAGE_SIZE')
+except (AttributeError, ValueError, OSError):
+    _PAGE_SIZE = 4096
+
+
+def enable(on=True):
+    global _enabled
+    _enabled = on
+
+
+def enabled():
+    return _enabled
+
+
+def reset():
+    """
+    Drops all aggregated metrics.
+    """
+    with _lock:
+        _metrics.clear()
+
+
+def _rss_bytes():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except OSError:
+        return None
+
+
+# -----------------------------------------
+# 1. Profilers
+# -----------------------------------------
+class _SamplingProfiler:
+    """
+    Samples one thread's stack every `interval` seconds into collapsed stacks.
+    """
+
+    def __init__(self, thread_id, interval=0.005):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self, path):
+        self._stop.set()
+        self._thread.join()
+        with open(path + '.folded', 'w') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+class _CProfiler:
+    def __init__(self):
+        self.profile = cProfile.Profile()
+
+    def start(self):
+        self.profile.enable()
+
+    def stop(self, path):
+        self.profile.disable()
+        self.profile.dump_stats(path + '.prof')
+
+
+def _start_profiler(name):
+    if not (_profile_stages and ('*' in _profile_stages or name in _profile_stages)):
+        return None
+    profiler = _SamplingProfiler(threading.get_ident()) if _profiler_kind == 'sample' else _CProfiler()
+    try:
+        profiler.start()
+    except ValueError:  # another cProfile is already active in this thread
+        return None
+    return profiler
+
+
+# -----------------------------------------
+# 2. Spans
+# -----------------------------------------
+class Span:
+    """
+    A timed region. Use `set(**attributes)` to attach rows, solver status, etc.
+    """
+
+    def __init__(self, name, attributes):
+        self.name = name
+        self.attributes = dict(attributes)
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def __enter__(self):
+        stack = getattr(_local, 'stack', None)
+        if stack is None:
+            stack = _local.stack = []
+        stack.append(self)
+        self._profiler = _start_profiler(self.name)
+        self._rss = _rss_bytes()
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        duration = time.perf_counter() - self._start
+        rss = _rss_bytes()
+        _local.stack.pop()
+        if self._profiler is not None:
+            os.makedirs(_profile_dir, exist_ok=True)
+            stem = f"{self.name}-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{next(_profile_ids)}"
+            self._profiler.stop(os.path.join(_profile_dir, stem))
+        record = {'event': 'span', 'stage': self.name, 'duration_s': round(duration, 6)}
+        if rss is not None and self._rss is not None:
+            record['rss_delta_mb'] = round((rss - self._rss) / 2**20, 3)
+        if exc_type is not None:
+            record['error'] = exc_type.__name__
+        record.update(self.attributes)
+        _record(record)
+        logger.info(json.dumps(record, default=str))
+        return False
+
+
+class _NoSpan:
+    def set(self, **attributes):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NO_SPAN = _NoSpan()
+
+
+def span(name, **attributes):
+    """
+    Context manager timing the enclosed block as stage `name` (no-op when disabled).
+    """
+    return Span(name, attributes) if _enabled else _NO_SPAN
+
+
+def annotate(**attributes):
+    """
+    Attaches attributes to the innermost active span of this thread, if any.
+    """
+    if _enabled:
+        stack = getattr(_local, 'stack', None)
+        if stack:
+            stack[-1].set(**attributes)
+
+
+def timed(name=None):
+    """
+    Decorator: runs the function inside `span(name)` (default: module.function)
+    and records the row count of a returned frame or array.
+    """
+    def decorator(fn):
+        stage = name or f"{fn.__module__.rsplit('.', 1)[-1]}.{fn.__name__}"
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return fn(*args, **kwargs)
+            with Span(stage, {}) as s:
+                result = fn(*args, **kwargs)
+                shape = getattr(result, 'shape', None)
+                if shape and 'rows' not in s.attributes:
+                    s.set(rows=int(shape[0]))
+                return result
+        return wrapper
+    return decorator
+
+
+# -----------------------------------------
+# 3. Aggregation and export
+# -----------------------------------------
+def _record(record):
+    with _lock:
+        m = _metrics.setdefault(record['stage'], {'count': 0, 'errors': 0, 'duration_sum': 0.0,
+                                                  'duration_max': 0.0, 'gauges': {}, 'status': None})
+        m['count'] += 1
+        m['errors'] += 'error' in record
+        m['duration_sum'] += record['duration_s']
+        m['duration_max'] = max(m['duration_max'], record['duration_s'])
+        m['duration_last'] = record['duration_s']
+        for key, value in record.items():
+            if key in ('event', 'stage', 'duration_s', 'error'):
+                continue
+            if key == 'status':
+                m['status'] = str(value)
+            elif isinstance(value, (int, float)) and not isinstance(value, bool) and value == value:
+                m['gauges'][key] = value
+
+
+def snapshot():
+    """
+    Copy of the aggregated metrics: {stage: {count, errors, duration_*, gauges, status}}.
+    """
+    with _lock:
+        return {stage: {**m, 'gauges': dict(m['gauges'])} for stage, m in _metrics.items()}
+
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def prometheus_text(prefix='catapult'):
+    """
+    Aggregated metrics in the Prometheus text exposition format.
+    """
+    metrics = snapshot()
+    lines = [
+        f"# TYPE {prefix}_stage_duration_seconds summary",
+        *(f'{prefix}_stage_duration_seconds_sum{{stage="{_label(s)}"}} {m["duration_sum"]:.6f}\n'
+          f'{prefix}_stage_duration_seconds_count{{stage="{_label(s)}"}} {m["count"]}'
+          for s, m in metrics.items()),
+        f"# TYPE {prefix}_stage_duration_seconds_max gauge",
+        *(f'{prefix}_stage_duration_seconds_max{{stage="{_label(s)}"}} {m["duration_max"]:.6f}'
+          for s, m in metrics.items()),
+        f"# TYPE {prefix}_stage_last_duration_seconds gauge",
+        *(f'{prefix}_stage_last_duration_seconds{{stage="{_label(s)}"}} {m["duration_last"]:.6f}'
+          for s, m in metrics.items()),
+        f"# TYPE {prefix}_stage_errors_total counter",
+        *(f'{prefix}_stage_errors_total{{stage="{_label(s)}"}} {m["errors"]}' for s, m in metrics.items()),
+    ]
+    gauge_names = sorted({g for m in metrics.values() for g in m['gauges']})
+    for gauge in gauge_names:
+        metric = f"{prefix}_stage_{re.sub(r'[^a-zA-Z0-9_]', '_', gauge)}"
+        lines.append(f"# TYPE {metric} gauge")
+        lines.extend(f'{metric}{{stage="{_label(s)}"}} {m["gauges"][gauge]}'
+                     for s, m in metrics.items() if gauge in m['gauges'])
+    lines.append(f"# TYPE {prefix}_stage_status gauge")
+    lines.extend(f'{prefix}_stage_status{{stage="{_label(s)}",status="{_label(m["status"])}"}} 1'
+                 for s, m in metrics.items() if m['status'] is not None)
+    return '\n'.join(lines) + '\n'
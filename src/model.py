@@ -1,60 +1,112 @@
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
 from xgboost import XGBRegressor
 import lightgbm as lgb
 from catboost import CatBoostRegressor
 from sklearn.ensemble import StackingRegressor, RandomForestRegressor
 from sklearn.linear_model import LinearRegression
-from sklearn.model_selection import train_test_split, TimeSeriesSplit
 from joblib import dump, load
 import numpy as np
 import pandas as pd
 
-# Define the full predictor list including new features.
-PREDICTORS = [
-    'rolling_points', 'rolling_minutes', 'rolling_goals', 'rolling_assists',
-    'rolling_xG', 'rolling_xA', 'rolling_xGI', 'rolling_points_std',
-    'now_cost', 'cost_change', 'is_home', 'fixture_difficulty', 'opponent_defense_strength'
-]
+# The full predictor list lives with the feature code so lightweight modules can use it.
+from src.features import PREDICTORS
+from src.registry import register_model, quantile_model_name
+from src.stacking import fit_stacked_model, STACKING_CACHE_DIR
+from src.instrument import timed
+
 
 # -----------------------------------------
 # 1. Expanded Stacked Ensemble Model
 # -----------------------------------------
-def train_stacked_model(features_df, target_column='total_points', use_time_series_cv=False):
+# Base learner hyperparameters; tuned values in BEST_PARAMS_PATH override them.
+BEST_PARAMS_PATH = 'models/best_params.json'
+BASE_LEARNER_DEFAULTS = {
+    'xgb': dict(n_estimators=100, max_depth=3, random_state=42),
+    'lgb': dict(n_estimators=100, max_depth=3, random_state=42, verbose=-1),
+    'cat': dict(iterations=100, depth=3, random_state=42, verbose=0, allow_writing_files=False),
+    'rf': dict(n_estimators=100, max_depth=3, random_state=42),
+}
+
+def load_best_params(path=BEST_PARAMS_PATH):
+    """
+    Returns the tuned hyperparameters written by src.tuning, keyed by model
+    ('xgb', 'lgb', 'cat', 'quantile_p10', ...), or {} if nothing has been tuned.
+    """
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+def make_base_learners(n_jobs=None, params=None):
+    """
+    Returns the unfitted (name, estimator) base learners of the stacked ensemble,
+    using tuned hyperparameters where available (see load_best_params).
+    `n_jobs` caps each learner's internal thread pool (None = library default).
+    """
+    params = load_best_params() if params is None else params
+    config = {name: {**defaults, **params.get(name, {})} for name, defaults in BASE_LEARNER_DEFAULTS.items()}
+    return [
+        ('xgb', XGBRegressor(n_jobs=n_jobs, **config['xgb'])),
+        ('lgb', lgb.LGBMRegressor(n_jobs=n_jobs, **config['lgb'])),
+        ('cat', CatBoostRegressor(thread_count=n_jobs, **config['cat'])),
+        ('rf', RandomForestRegressor(n_jobs=n_jobs, **config['rf']))
+    ]
+
+def make_stacked_model(n_jobs=None, params=None):
+    """
+    Returns the unfitted stacked ensemble (base learners + LinearRegression meta-learner).
+    """
+    return StackingRegressor(
+        estimators=make_base_learners(n_jobs, params),
+        final_estimator=LinearRegression(),
+        cv=5  # This remains for final estimator cross validation.
+    )
+
+def time_split(features_df, test_size=0.2):
+    """
+    Splits rows by gameweek: the latest gameweeks holding at least `test_size`
+    of the rows (at least one gameweek) are held out.
+    Returns (train_df, holdout_df).
+    """
+    counts = features_df['gameweek'].value_counts().sort_index()
+    tail_share = counts[::-1].cumsum()[::-1] / counts.sum()
+    cutoff = tail_share[tail_share >= test_size].index.max()
+    later = features_df['gameweek'] >= cutoff
+    return features_df[~later], features_df[later]
+
+@timed()
+def train_stacked_model(features_df, target_column='total_points', use_time_series_cv=False,
+                        n_threads=None, use_cache=True):
     """
     Trains a stacked ensemble model using multiple base models:
       - XGBoost, LightGBM, CatBoost, and RandomForest.
-    Optionally uses a time-series split if specified.
+    Trains on all gameweeks before the latest one with `use_time_series_cv`,
+    otherwise holds out the latest ~20% of rows by gameweek (see time_split).
+    Uses tuned hyperparameters from BEST_PARAMS_PATH when present (see src.tuning).
+    The meta-learner is fit on forward-chaining out-of-fold predictions over
+    blocks of gameweeks. Base learners and folds are fit concurrently within
+    `n_threads`, and each fit is cached on its own training data, so after a
+    new gameweek only the new fold and the full-data fits run (see src.stacking).
     Saves the model as 'models/stacked_model.joblib'.
     """
-    X = features_df[PREDICTORS]
-    y = features_df[target_column]
-    
     if use_time_series_cv:
         # Use all data before the maximum gameweek for training.
-        max_gw = features_df['gameweek'].max()
-        X_train = features_df[features_df['gameweek'] < max_gw][PREDICTORS]
-        y_train = features_df[features_df['gameweek'] < max_gw][target_column]
+        train_df = features_df[features_df['gameweek'] < features_df['gameweek'].max()]
     else:
-        X_train, _, y_train, _ = train_test_split(
-            X, y, test_size=0.2, random_state=42
-        )
-    
-    estimators = [
-        ('xgb', XGBRegressor(n_estimators=100, max_depth=3, random_state=42)),
-        ('lgb', lgb.LGBMRegressor(n_estimators=100, max_depth=3, random_state=42)),
-        ('cat', CatBoostRegressor(iterations=100, depth=3, random_state=42, verbose=0)),
-        ('rf', RandomForestRegressor(n_estimators=100, max_depth=3, random_state=42))
-    ]
-    
-    stacked_regressor = StackingRegressor(
-        estimators=estimators,
-        final_estimator=LinearRegression(),
-        cv=5  # This remains for final estimator cross validation.
+        train_df, _ = time_split(features_df, test_size=0.2)
+
+    stacked_regressor = fit_stacked_model(
+        train_df[PREDICTORS], train_df[target_column], make_base_learners(), final_estimator=LinearRegression(),
+        n_threads=n_threads, cache_dir=STACKING_CACHE_DIR if use_cache else None, groups=train_df['gameweek']
     )
-    
-    stacked_regressor.fit(X_train, y_train)
     dump(stacked_regressor, 'models/stacked_model.joblib')
+    register_model('stacked', 'models/stacked_model.joblib', features_df=train_df)
     return stacked_regressor
 
+@timed()
 def predict_points(model, features_df):
     """
     Uses the trained stacked model to predict expected points.
@@ -66,11 +118,37 @@ def predict_points(model, features_df):
 # -----------------------------------------
 # 2. Multi-Quantile Modeling for Uncertainty
 # -----------------------------------------
+def make_quantile_model(q, n_jobs=None, params=None):
+    """
+    Returns an unfitted LightGBM quantile regressor for quantile `q`,
+    using tuned hyperparameters where available.
+    """
+    params = load_best_params() if params is None else params
+    config = dict(
+        n_estimators=200,  # Increased to give early stopping room.
+        max_depth=3,
+        random_state=42,
+        verbose=-1
+    )
+    config.update(params.get(quantile_model_name(q), {}))
+    return lgb.LGBMRegressor(objective='quantile', alpha=q, n_jobs=n_jobs, **config)
+
+def fit_quantile_model(model, X_train, y_train, X_val, y_val, early_stopping_rounds=10):
+    """
+    Fits a quantile model with early stopping on the validation set.
+    """
+    return model.fit(
+        X_train, y_train,
+        eval_set=[(X_val, y_val)],
+        callbacks=[lgb.early_stopping(early_stopping_rounds, verbose=False)]
+    )
+
+@timed()
 def train_multi_quantile_models(features_df, target_column='total_points', quantiles=[0.1, 0.5, 0.9], use_time_holdout=True):
     """
     Trains LightGBM quantile models for multiple quantiles.
     Optionally holds out the latest gameweek data to prevent data leakage.
-    Each model is trained with an internal validation split for early stopping.
+    Each model early-stops on the latest ~20% of its training rows by gameweek.
     Saves each model with a filename based on its quantile (e.g., 'models/quantile_model_p10.joblib').
     
     Returns a dictionary where keys are the quantiles and values are the corresponding model.
@@ -83,27 +161,15 @@ def train_multi_quantile_models(features_df, target_column='total_points', quant
         train_df = features_df
     
     models = {}
-    from sklearn.model_selection import train_test_split
     for q in quantiles:
-        quantile_model = lgb.LGBMRegressor(
-            objective='quantile', 
-            alpha=q,
-            n_estimators=200,  # Increased to give early stopping room.
-            max_depth=3, 
-            random_state=42
-        )
-        # Create a further validation split for early stopping.
-        X_train, X_val, y_train, y_val = train_test_split(
-            train_df[PREDICTORS], train_df[target_column], test_size=0.2, random_state=42
-        )
-        quantile_model.fit(
-            X_train, y_train,
-            eval_set=[(X_val, y_val)],
-            early_stopping_rounds=10,
-            verbose=False
-        )
+        quantile_model = make_quantile_model(q)
+        # Validate early stopping on the latest gameweeks of the training data.
+        fit_df, val_df = time_split(train_df, test_size=0.2)
+        fit_quantile_model(quantile_model, fit_df[PREDICTORS], fit_df[target_column],
+                           val_df[PREDICTORS], val_df[target_column])
         model_filename = f"models/quantile_model_p{int(q*100)}.joblib"
         dump(quantile_model, model_filename)
+        register_model(quantile_model_name(q), model_filename, features_df=train_df)
         models[q] = quantile_model
     return models
 
@@ -124,13 +190,101 @@ def predict_multi_quantile(models, features_df):
     return features_df
 
 # -----------------------------------------
-# 3. SHAP Feature Importance for Feature Selection
+# 3. Fused Batch Inference
+# -----------------------------------------
+def feature_matrix(features_df):
+    """
+    Builds the contiguous float64 (rows x PREDICTORS) matrix used for inference.
+    Kept in float64: the committed models were trained on float64 features.
+    """
+    return np.ascontiguousarray(features_df[PREDICTORS].to_numpy(dtype=np.float64))
+
+
+def _predict_matrix(estimator, X):
+    """
+    Predicts on a feature matrix, going straight to the native booster where
+    there is one so no per-call DataFrame conversion is needed.
+    """
+    if hasattr(estimator, 'get_booster'):  # XGBoost sklearn wrapper
+        best = getattr(estimator, 'best_iteration', None)
+        iteration_range = (0, best + 1) if best is not None else (0, 0)
+        return estimator.get_booster().inplace_predict(X, iteration_range=iteration_range)
+    if hasattr(estimator, 'booster_'):  # LightGBM sklearn wrapper (uses best_iteration if set)
+        return estimator.booster_.predict(X)
+    if hasattr(estimator, 'feature_names_in_'):  # sklearn estimators fitted on a frame
+        return estimator.predict(pd.DataFrame(X, columns=estimator.feature_names_in_, copy=False))
+    return estimator.predict(X)
+
+
+@timed()
+def predict_all(stacked_model, quantile_models, features, batch_size=None, n_threads=None):
+    """
+    Runs the stacked model and every quantile model in one call.
+
+    The features are converted once to a contiguous float64 matrix (a frame with
+    PREDICTORS columns, or an already built matrix). For each batch of rows the
+    stacked base learners and the quantile models run concurrently in a thread
+    pool (XGBoost, LightGBM and CatBoost release the GIL), then the meta-learner
+    combines the base predictions.
+
+    Returns a frame, aligned with `features`, with 'predicted_points',
+    'predicted_p10'/'predicted_p50'/'predicted_p90' (for the quantiles given) and
+    'predicted_risk' (p90 - predicted_points). With `stacked_model=None` only the
+    quantile columns are produced.
+    """
+    if isinstance(features, pd.DataFrame):
+        index, X = features.index, feature_matrix(features)
+    else:
+        X = np.ascontiguousarray(features, dtype=np.float64)
+        index = pd.RangeIndex(len(X))
+
+    if stacked_model is None:
+        base_models = []
+    else:
+        base_models = list(getattr(stacked_model, 'estimators_', [stacked_model]))
+    quantiles = sorted(quantile_models)
+    models = base_models + [quantile_models[q] for q in quantiles]
+    batch_size = batch_size or max(len(X), 1)
+
+    base = np.empty((len(X), len(base_models)))
+    quantile_preds = np.empty((len(X), len(quantiles)))
+    with ThreadPoolExecutor(max_workers=n_threads or min(len(models), os.cpu_count() or 1)) as pool:
+        for start in range(0, len(X), batch_size):
+            batch = X[start:start + batch_size]
+            preds = list(pool.map(lambda m: _predict_matrix(m, batch), models))
+            rows = slice(start, start + len(batch))
+            if base_models:
+                base[rows] = np.column_stack(preds[:len(base_models)])
+            if quantiles:
+                quantile_preds[rows] = np.column_stack(preds[len(base_models):])
+
+    result = pd.DataFrame(index=index)
+    if hasattr(stacked_model, 'final_estimator_'):
+        meta_input = np.hstack([base, X]) if getattr(stacked_model, 'passthrough', False) else base
+        result['predicted_points'] = stacked_model.final_estimator_.predict(meta_input)
+    elif stacked_model is not None:
+        result['predicted_points'] = base[:, 0]
+
+    for k, q in enumerate(quantiles):
+        result[f"predicted_p{int(q * 100)}"] = quantile_preds[:, k]
+    if 0.9 in quantile_models and stacked_model is not None:
+        result['predicted_risk'] = result['predicted_p90'] - result['predicted_points']
+    return result
+
+# -----------------------------------------
+# 4. SHAP Feature Importance for Feature Selection
 # -----------------------------------------
 def run_shap_analysis(model, X_train):
     """
     Computes SHAP values for the given model and training data.
     Returns a DataFrame with features and their corresponding mean absolute SHAP values.
+    Tree models and stacks of them use exact native TreeSHAP (see src.explain);
+    anything else falls back to shap's model-agnostic explainer.
     """
+    from src.explain import is_tree_explainable, global_importance
+    if is_tree_explainable(model) and list(X_train.columns) == PREDICTORS:
+        return global_importance(model, X_train)
+
     import shap
     explainer = shap.Explainer(model.predict, X_train)
     shap_values = explainer(X_train)
@@ -1,15 +1,152 @@
-from pulp import LpMaximize, LpProblem, LpVariable, lpSum, LpStatus
-import optuna
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from pulp import (LpMaximize, LpProblem, LpVariable, LpAffineExpression, LpConstraint, LpStatus,
+                  PULP_CBC_CMD)
 import numpy as np
-from xgboost import XGBRegressor
+import pandas as pd
+from scipy import sparse
+
+try:
+    from scipy.optimize import milp, Bounds, LinearConstraint
+except ImportError:  # scipy < 1.9 has no MILP interface; fall back to PuLP/CBC
+    milp = None
+
+from src.instrument import span, annotate, timed
 
-# Import the predictor list for tuning (you may adjust if needed)
-from src.model import PREDICTORS
+logger = logging.getLogger(__name__)
+
+# Squad rules (budget in tenths, e.g., 1000 means 100.0 units)
+BUDGET = 1000
+SQUAD_SIZE = 15
+POSITION_LIMITS = {'GK': 2, 'DEF': 5, 'MID': 5, 'FWD': 3}
+MAX_PER_TEAM = 3
 
 # -----------------------------------------
 # 1. Risk-Aware Team Optimizer
 # -----------------------------------------
-def optimize_team(features_df, risk_aversion=0.1):
+def squad_objective(players, risk_aversion=0.1):
+    """
+    Per-player objective coefficients: predicted_points - risk_aversion * predicted_risk.
+    """
+    return (players['predicted_points'].to_numpy(dtype=np.float64)
+            - risk_aversion * players['predicted_risk'].to_numpy(dtype=np.float64))
+
+
+def build_squad_constraints(players, budget=BUDGET):
+    """
+    Builds the squad constraints in matrix form: a sparse (rows x players)
+    coefficient matrix with lower and upper row bounds.
+
+    Rows, in order:
+      - budget: sum(now_cost * x) <= budget
+      - squad size: sum(x) == 15
+      - one row per position in POSITION_LIMITS: sum(x) == limit
+      - one row per team: sum(x) <= 3
+    """
+    n = len(players)
+    cols = np.arange(n)
+    position_codes = pd.Categorical(players['position'], categories=list(POSITION_LIMITS)).codes
+    team_codes, teams = pd.factorize(players['team'])
+
+    in_position = position_codes >= 0
+    in_team = team_codes >= 0
+    rows = np.concatenate([
+        np.zeros(n, dtype=int),
+        np.ones(n, dtype=int),
+        2 + position_codes[in_position],
+        2 + len(POSITION_LIMITS) + team_codes[in_team],
+    ])
+    data = np.concatenate([
+        players['now_cost'].to_numpy(dtype=np.float64),
+        np.ones(n),
+        np.ones(in_position.sum()),
+        np.ones(in_team.sum()),
+    ])
+    columns = np.concatenate([cols, cols, cols[in_position], cols[in_team]])
+    n_rows = 2 + len(POSITION_LIMITS) + len(teams)
+    A = sparse.csr_matrix((data, (rows, columns)), shape=(n_rows, n))
+
+    limits = np.array(list(POSITION_LIMITS.values()), dtype=np.float64)
+    lower = np.concatenate([[-np.inf, SQUAD_SIZE], limits, np.full(len(teams), -np.inf)])
+    upper = np.concatenate([[budget, SQUAD_SIZE], limits, np.full(len(teams), MAX_PER_TEAM)])
+    return A, lower, upper
+
+
+def _solve_highs(c, A, lower, upper, lb, ub, time_limit=None):
+    """
+    Solves max c.x subject to lower <= A x <= upper, lb <= x <= ub, x binary, with HiGHS.
+    Returns (x as a boolean mask, status string).
+    """
+    options = {} if time_limit is None else {'time_limit': time_limit}
+    res = milp(-c, constraints=LinearConstraint(A, lower, upper), integrality=np.ones(len(c)),
+               bounds=Bounds(lb, ub), options=options)
+    status = {0: "Optimal", 1: "Not Solved", 2: "Infeasible", 3: "Unbounded"}.get(res.status, "Undefined")
+    annotate(solver='highs', status=status, mip_gap=getattr(res, 'mip_gap', None),
+             mip_nodes=getattr(res, 'mip_node_count', None))
+    x = res.x > 0.5 if res.x is not None else np.zeros(len(c), dtype=bool)
+    return x, status
+
+
+def _solve_pulp(c, A, lower, upper, lb, ub, time_limit=None, initial=None):
+    """
+    Same problem as _solve_highs, built row by row from the matrix and solved with PuLP/CBC.
+    If `initial` (a boolean mask) is given, it is passed to CBC as a warm start.
+    """
+    n = len(c)
+    # Integer with 0/1 bounds rather than Binary, so that fixed bounds (lb=ub) are kept
+    x = [LpVariable(f"x_{i}", lowBound=lb[i], upBound=ub[i], cat="Integer") for i in range(n)]
+    prob = LpProblem("FPL_Team_Selection", LpMaximize)
+    prob += LpAffineExpression(zip(x, c))
+
+    for r in range(A.shape[0]):
+        start, end = A.indptr[r], A.indptr[r + 1]
+        expr = LpAffineExpression((x[j], v) for j, v in zip(A.indices[start:end], A.data[start:end]))
+        if lower[r] == upper[r]:
+            prob += LpConstraint(expr, sense=0, rhs=upper[r])
+        else:
+            if np.isfinite(upper[r]):
+                prob += LpConstraint(expr, sense=-1, rhs=upper[r])
+            if np.isfinite(lower[r]):
+                prob += LpConstraint(expr, sense=1, rhs=lower[r])
+
+    solver_kwargs = {}
+    if time_limit is not None:
+        solver_kwargs['timeLimit'] = time_limit
+    if initial is not None:
+        for var, value in zip(x, initial):
+            var.setInitialValue(int(value))
+        solver_kwargs['warmStart'] = True
+    status = prob.solve(PULP_CBC_CMD(**solver_kwargs))
+    annotate(solver='cbc', status=LpStatus[status], solver_time_s=prob.solutionTime)
+    return np.array([v.varValue is not None and v.varValue > 0.5 for v in x]), LpStatus[status]
+
+
+def solve_squad(c, A, lower, upper, lb=None, ub=None, solver=None, time_limit=None, initial=None):
+    """
+    Solves the matrix-form squad problem with the requested solver
+    ('highs' via scipy.optimize.milp, or 'pulp'). Defaults to HiGHS when available.
+    `initial` is a warm start for CBC only: scipy.optimize.milp takes no starting
+    solution, so HiGHS ignores it.
+    Returns (selected mask, status string).
+    """
+    n = len(c)
+    lb = np.zeros(n) if lb is None else lb
+    ub = np.ones(n) if ub is None else ub
+    solver = solver or ('highs' if milp is not None else 'pulp')
+    if solver == 'highs':
+        if milp is None:
+            raise ImportError("scipy>=1.9 is required for the 'highs' solver; use solver='pulp'.")
+        return _solve_highs(c, A, lower, upper, lb, ub, time_limit=time_limit)
+    if solver == 'pulp':
+        return _solve_pulp(c, A, lower, upper, lb, ub, time_limit=time_limit, initial=initial)
+    raise ValueError(f"Unknown solver: {solver}")
+
+
+@timed()
+def optimize_team(features_df, risk_aversion=0.1, budget=BUDGET, solver=None, prune=False):
     """
     Performs a risk-aware optimization using MILP.
     
@@ -17,99 +154,198 @@ def optimize_team(features_df, risk_aversion=0.1):
       maximize sum[(predicted_points - risk_aversion * predicted_risk) * x] over players
       
     Constraints:
-      - Total now_cost <= 1000 (budget in tenths, e.g., 1000 means 100.0 units)
+      - Total now_cost <= budget (in tenths, e.g., 1000 means 100.0 units)
       - Exactly 15 players are selected.
       - Position constraints based on the "position" field:
           * Exactly 2 Goalkeepers
-          * At least 3 Defenders
-          * At least 3 Midfielders
-          * At least 1 Forward
+          * Exactly 5 Defenders
+          * Exactly 5 Midfielders
+          * Exactly 3 Forwards
       - Maximum 3 players per team.
+
+    The model is built from NumPy arrays as a sparse constraint matrix and solved
+    with HiGHS (scipy.optimize.milp) when available, otherwise with PuLP/CBC
+    (or pass solver='pulp'). With `prune`, players that cannot be in an optimal
+    squad are dropped first (see src.pruning.CandidateIndex): same objective value,
+    but ties may resolve to a different squad. The pool size before and after is in
+    selected_team.attrs['pool']. Prune, build and solve times are recorded in
+    selected_team.attrs['timings']; a non-optimal solve is logged as a warning
+    and, with instrumentation enabled, its status/gap reported (see src.instrument).
     """
     players = features_df.copy().reset_index(drop=True)
-    n = len(players)
-    
-    # Create binary decision variables for each player
-    x = [LpVariable(f"x_{i}", cat="Binary") for i in range(n)]
-    
-    # Define the optimization problem
-    prob = LpProblem("FPL_Team_Selection", LpMaximize)
-    
-    # Objective: maximize adjusted predicted points
-    prob += lpSum((players.loc[i, 'predicted_points'] - risk_aversion * players.loc[i, 'predicted_risk']) * x[i] for i in range(n))
-    
-    # Budget constraint: total cost must be <= 1000 (e.g., £100.0)
-    prob += lpSum(players.loc[i, 'now_cost'] * x[i] for i in range(n)) <= 1000
-    
-    # Exactly 15 players must be selected
-    prob += lpSum(x) == 15
-    
-    # Position constraints
-    prob += lpSum(x[i] for i in range(n) if players.loc[i, 'position'] == "GK") == 2
-    prob += lpSum(x[i] for i in range(n) if players.loc[i, 'position'] == "DEF") == 5
-    prob += lpSum(x[i] for i in range(n) if players.loc[i, 'position'] == "MID") == 5
-    prob += lpSum(x[i] for i in range(n) if players.loc[i, 'position'] == "FWD") == 3
-    
-    # Team constraint: No more than 3 players per team
-    teams = players['team'].unique()
-    for team in teams:
-        prob += lpSum(x[i] for i in range(n) if players.loc[i, 'team'] == team) <= 3
-        
+    pool = {'players': len(players)}
+
+    start = time.perf_counter()
+    if prune:
+        from src.pruning import CandidateIndex
+        with span('optimizer.prune', rows=len(players)) as s:
+            players = CandidateIndex(players, risk_aversion).candidates().reset_index(drop=True)
+            s.set(kept=len(players))
+    pool['candidates'] = len(players)
+    pruned = time.perf_counter()
+    with span('optimizer.build', rows=len(players)):
+        c = squad_objective(players, risk_aversion)
+        A, lower, upper = build_squad_constraints(players, budget)
+    built = time.perf_counter()
+
     # Solve the MILP
-    status = prob.solve()
+    with span('optimizer.solve', rows=len(players)):
+        selected, status = solve_squad(c, A, lower, upper, solver=solver)
+    solved = time.perf_counter()
 
-    if LpStatus[status] != "Optimal":
-        print("Warning: Solver did not find an optimal solution!")
+    if status != "Optimal":
+        logger.warning("Solver did not find an optimal solution (status: %s)", status)
     
     # Retrieve and return the selected players
-    selected_indices = [i for i in range(n) if x[i].varValue == 1]
-    selected_team = players.loc[selected_indices]
+    selected_team = players.loc[np.flatnonzero(selected)]
+    selected_team.attrs['timings'] = {'prune': pruned - start, 'build': built - pruned, 'solve': solved - built}
+    selected_team.attrs['status'] = status
+    selected_team.attrs['pool'] = pool
     return selected_team
 
 
 # -----------------------------------------
-# 2. Hyperparameter Tuning (XGBoost with Time-Series CV)
+# 2. Batch Scenario Optimizer
+# -----------------------------------------
+_SCENARIO_BASE = {}
+
+
+def _init_scenario_worker(base):
+    _SCENARIO_BASE.update(base)
+
+
+def _solve_scenarios(jobs):
+    """
+    Solves a chunk of scenarios against the shared base model. Only the objective,
+    the budget row bound and the variable bounds change between scenarios; with
+    solver='pulp' each solve is warm-started from the previous solution (HiGHS,
+    the default, solves each scenario from scratch).
+    """
+    base = _SCENARIO_BASE
+    n = len(base['points'])
+    upper = base['upper'].copy()
+    previous = None
+    results = []
+    for idx, scenario in jobs:
+        c = base['points'] - scenario.get('risk_aversion', 0.1) * base['risk']
+        upper[0] = scenario.get('budget', BUDGET)
+        lb, ub = np.zeros(n), np.ones(n)
+        lb[[base['row_of'][p] for p in scenario.get('include', ())]] = 1
+        ub[[base['row_of'][p] for p in scenario.get('exclude', ()) if p in base['row_of']]] = 0
+
+        selected, status = solve_squad(c, base['A'], base['lower'], upper, lb, ub,
+                                       solver=base['solver'], initial=previous)
+        previous = selected if status == "Optimal" else previous
+        results.append((idx, np.flatnonzero(selected), status, float(c[selected].sum())))
+    return results
+
+
+def optimize_scenarios(features_df, scenarios, n_jobs=None, solver=None, prune=False):
+    """
+    Solves optimize_team for many scenarios, e.g. to build a risk/return frontier.
+
+    Each scenario is a dict with any of:
+      - risk_aversion (default 0.1)
+      - budget (default BUDGET)
+      - include: player_ids that must be selected
+      - exclude: player_ids that must not be selected
+
+    The constraint matrix is built once and shared; scenarios are ordered by
+    budget and risk_aversion so that neighbouring solves are similar, then split
+    into contiguous chunks across a process pool (n_jobs=1 solves in-process).
+    With `prune`, the pool is first reduced to players that can be optimal for
+    any risk aversion and budget (see src.pruning.CandidateIndex); players that
+    any scenario excludes never count as dominators and included ones are kept.
+    Included player_ids that are not in `features_df` raise a ValueError;
+    excluded ones that are not in it are ignored.
+
+    Returns one tidy frame with a row per selected player per scenario, with
+    'scenario', 'risk_aversion', 'budget', 'status' and 'objective' columns.
+    A scenario without a squad (e.g. infeasible) gets a single row with its
+    status, empty player columns and a NaN objective, and is logged as a warning.
+    """
+    players = features_df.copy().reset_index(drop=True)
+    known = set(players['player_id'])
+    for i, scenario in enumerate(scenarios):
+        missing = [p for p in scenario.get('include', ()) if p not in known]
+        if missing:
+            raise ValueError(f"Scenario {i} includes player_ids that are not in the player pool: {missing}")
+    if prune:
+        from src.pruning import CandidateIndex
+        excluded = {p for s in scenarios for p in s.get('exclude', ())}
+        included = {p for s in scenarios for p in s.get('include', ())}
+        players = CandidateIndex(players, exclude_dominators=excluded, keep_ids=included) \
+            .candidates().reset_index(drop=True)
+    A, lower, upper = build_squad_constraints(players, BUDGET)
+    base = {
+        'points': players['predicted_points'].to_numpy(dtype=np.float64),
+        'risk': players['predicted_risk'].to_numpy(dtype=np.float64),
+        'A': A, 'lower': lower, 'upper': upper,
+        'row_of': {p: i for i, p in enumerate(players['player_id'])},
+        'solver': solver,
+    }
+
+    order = sorted(range(len(scenarios)),
+                   key=lambda i: (scenarios[i].get('budget', BUDGET), scenarios[i].get('risk_aversion', 0.1)))
+    jobs = [(i, scenarios[i]) for i in order]
+    n_jobs = min(n_jobs or os.cpu_count() or 1, len(jobs))
+
+    if n_jobs <= 1:
+        _init_scenario_worker(base)
+        results = _solve_scenarios(jobs)
+    else:
+        chunks = [list(chunk) for chunk in np.array_split(np.arange(len(jobs)), n_jobs)]
+        with ProcessPoolExecutor(max_workers=n_jobs, initializer=_init_scenario_worker, initargs=(base,)) as pool:
+            parts = pool.map(_solve_scenarios, [[jobs[k] for k in chunk] for chunk in chunks])
+            results = [r for part in parts for r in part]
+
+    squads = []
+    for idx, selected, status, objective in sorted(results, key=lambda r: r[0]):
+        if len(selected) == 0:
+            logger.warning("Scenario %d has no squad (status: %s)", idx, status)
+            squad, objective = players.iloc[:0].reindex([0]), np.nan
+        else:
+            squad = players.loc[selected].copy()
+        squad.insert(0, 'scenario', idx)
+        squad.insert(1, 'risk_aversion', scenarios[idx].get('risk_aversion', 0.1))
+        squad.insert(2, 'budget', scenarios[idx].get('budget', BUDGET))
+        squad.insert(3, 'status', status)
+        squad.insert(4, 'objective', objective)
+        squads.append(squad)
+    if not squads:
+        return pd.DataFrame(columns=['scenario', 'risk_aversion', 'budget', 'status', 'objective',
+                                     *players.columns])
+    return pd.concat(squads, ignore_index=True)
+
+
+def scenario_frontier(squads):
+    """
+    Summarizes optimize_scenarios output to one row per scenario with the squad's
+    total cost, predicted points and predicted risk (the risk/return frontier).
+    Scenarios without a squad keep NaN totals.
+    """
+    def total(values):
+        return values.sum(min_count=1)
+
+    return squads.groupby(['scenario', 'risk_aversion', 'budget', 'status'], as_index=False).agg(
+        objective=('objective', 'first'),
+        total_cost=('now_cost', total),
+        predicted_points=('predicted_points', total),
+        predicted_risk=('predicted_risk', total),
+    )
+
+
+# -----------------------------------------
+# 3. Hyperparameter Tuning (XGBoost with Time-Series CV)
 # -----------------------------------------
-def tune_stacked_model(features_df, target_column='total_points', n_trials=20):
+def tune_stacked_model(features_df, target_column='total_points', n_trials=20, n_jobs=1):
     """
     Hyperparameter tuning for the XGBoost base estimator within the stacking ensemble.
-    Uses an expanding window time series cross-validation with early stopping.
-    Tuning parameters include: n_estimators, max_depth, learning_rate, subsample, reg_alpha, and reg_lambda.
+    Kept for compatibility; see src.tuning for the other members, resumable
+    studies and multi-process tuning.
     """
-    X = features_df[PREDICTORS]
-    y = features_df[target_column]
-    
-    def objective(trial):
-        # Expanded search space for XGBRegressor
-        param = {
-            'n_estimators': trial.suggest_int('n_estimators', 50, 200),
-            'max_depth': trial.suggest_int('max_depth', 2, 6),
-            'learning_rate': trial.suggest_loguniform('learning_rate', 0.01, 0.3),
-            'subsample': trial.suggest_uniform('subsample', 0.5, 1.0),
-            'reg_alpha': trial.suggest_uniform('reg_alpha', 0.0, 1.0),
-            'reg_lambda': trial.suggest_uniform('reg_lambda', 0.0, 1.0)
-        }
-        model = XGBRegressor(random_state=42, **param)
-        
-        # Use time series CV with an expanding window
-        from sklearn.model_selection import TimeSeriesSplit
-        tscv = TimeSeriesSplit(n_splits=3)
-        errors = []
-        for train_index, val_index in tscv.split(X):
-            X_train, X_val = X.iloc[train_index], X.iloc[val_index]
-            y_train, y_val = y.iloc[train_index], y.iloc[val_index]
-            # Early stopping
-            model.fit(
-                X_train, y_train, 
-                eval_set=[(X_val, y_val)], 
-                early_stopping_rounds=10, 
-                verbose=False
-            )
-            preds = model.predict(X_val)
-            errors.append(np.mean((y_val - preds) ** 2))
-        return np.mean(errors)
-    
-    study = optuna.create_study(direction="minimize")
-    study.optimize(objective, n_trials=n_trials)
-    print("Best hyperparameters:", study.best_params)
-    return study.best_params
+    from src.tuning import tune_model
+
+    best_params = tune_model('xgb', features_df, target_column=target_column, n_trials=n_trials, n_jobs=n_jobs)
+    print("Best hyperparameters:", best_params)
+    return best_params
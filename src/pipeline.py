@@ -0,0 +1,385 @@
+"""
+Headless pipeline: load -> features -> models -> predictions -> optimized team.
+
+The steps form a DAG of stages. Every stage has a key: the hash of its name,
+version, parameters and the content digests of its inputs. A stage's output is
+stored under PIPELINE_DIR/<stage>/<key>.arrow together with the digest of its
+content (and any small metadata the stage records, e.g. the latest gameweek of
+the features), so a rerun only executes stages whose inputs changed, and a
+stage that reproduces identical output leaves everything downstream cached. Sources (the
+CSVs and the registered models) are fingerprinted by file stat and registry
+entry and are only loaded when a stage that needs them actually runs.
+
+Stages whose inputs are ready run concurrently (e.g. stacked and quantile
+inference). Each run writes data/gw<NN>_predictions.csv and
+data/gw<NN>_optimized_team.csv, where NN is the gameweek being predicted (the
+one after the data used), plus a manifest that the Streamlit app reads. The
+exports are rewritten on every run, so they always match the run's parameters.
+Models missing from the registry (e.g. on a fresh checkout) are trained first.
+
+Usage:
+    python -m src.pipeline [--gameweek N] [--risk-aversion 0.01] [--force [STAGE ...]] [--no-train]
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import pandas as pd
+import pyarrow.feather as feather
+
+from src.instrument import span
+
+logger = logging.getLogger(__name__)
+
+PIPELINE_DIR = 'data/pipeline'
+MANIFEST_NAME = 'latest.json'
+QUANTILES = (0.1, 0.5, 0.9)
+
+
+def _digest(*parts):
+    return hashlib.sha1(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def _file_fingerprint(path):
+    stat = os.stat(path)
+    return _digest(os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+
+
+def _model_fingerprint(name):
+    from src.registry import model_entry
+    entry = model_entry(name)
+    stat = os.stat(entry['path']) if os.path.exists(entry['path']) else None
+    return _digest(entry, stat and (stat.st_mtime_ns, stat.st_size))
+
+
+def frame_digest(df):
+    """
+    Content hash of a frame (values, index and column names).
+    """
+    h = hashlib.sha1(json.dumps([str(c) for c in df.columns]).encode())
+    h.update(pd.util.hash_pandas_object(df, index=True).to_numpy().tobytes())
+    return h.hexdigest()
+
+
+# -----------------------------------------
+# 1. Stages
+# -----------------------------------------
+class Source:
+    """
+    An external input: `fingerprint()` is cheap, `load()` only runs if needed.
+    """
+
+    def __init__(self, name, fingerprint, load):
+        self.name = name
+        self.inputs = ()
+        self.fingerprint = fingerprint
+        self.load = load
+
+
+class Stage:
+    """
+    A cached step computing a frame from its inputs' values:
+    `func(*input_values, **params)`. Bump `version` when the code changes.
+    `metadata(output)` may return a small JSON-able dict stored with the
+    output, readable without loading it (Pipeline.metadata).
+    """
+
+    def __init__(self, name, func, inputs, params=None, version=1, metadata=None):
+        self.name = name
+        self.func = func
+        self.inputs = tuple(inputs)
+        self.params = params or {}
+        self.version = version
+        self.metadata = metadata
+
+
+def _features(gws, teams, window):
+    from src.features import compute_rolling_features, add_contextual_features
+    return add_contextual_features(compute_rolling_features(gws, window=window), teams)
+
+
+def _features_metadata(features):
+    return {'gameweek': int(features['gameweek'].max())}
+
+
+def _latest(features, gameweek):
+    from src.features import prepare_latest_features
+    return prepare_latest_features(features, gameweek or features['gameweek'].max())
+
+
+def _stacked_predictions(latest, stacked):
+    from src.model import predict_all
+    return predict_all(stacked, {}, latest)
+
+
+def _quantile_predictions(latest, quantile_models):
+    from src.model import predict_all
+    return predict_all(None, quantile_models, latest)
+
+
+def _predictions(latest, stacked_preds, quantile_preds):
+    predictions = latest.join(stacked_preds).join(quantile_preds)
+    predictions['predicted_risk'] = predictions['predicted_p90'] - predictions['predicted_points']
+    predictions['rounded_predicted'] = predictions['predicted_points'].round(0).astype(int)
+    return predictions
+
+
+def _optimized_team(predictions, risk_aversion):
+    from src.optimizer import optimize_team
+    team = optimize_team(predictions, risk_aversion=risk_aversion)
+    team['rounded_predicted'] = team['predicted_points'].round(0).astype(int)
+    return team
+
+
+def default_stages(data_path='data/merged_gw.csv', teams_path='data/teams.csv', gameweek=None,
+                   window=3, risk_aversion=0.01):
+    """
+    The app's flow as a DAG, in topological order.
+    """
+    from src.data import load_merged_gws_data, load_team_info
+    from src.registry import get_model, get_quantile_models, quantile_model_name
+
+    quantiles = QUANTILES
+    return [
+        Source('gws', lambda: _file_fingerprint(data_path), lambda: load_merged_gws_data(data_path)),
+        Source('teams', lambda: _file_fingerprint(teams_path), lambda: load_team_info(teams_path)),
+        Source('stacked_model', lambda: _model_fingerprint('stacked'), lambda: get_model('stacked')),
+        Source('quantile_models',
+               lambda: _digest([_model_fingerprint(quantile_model_name(q)) for q in quantiles]),
+               lambda: get_quantile_models(quantiles)),
+        Stage('features', _features, ['gws', 'teams'], {'window': window}, version=2,
+              metadata=_features_metadata),
+        Stage('latest', _latest, ['features'], {'gameweek': gameweek}),
+        Stage('stacked_predictions', _stacked_predictions, ['latest', 'stacked_model']),
+        Stage('quantile_predictions', _quantile_predictions, ['latest', 'quantile_models']),
+        Stage('predictions', _predictions, ['latest', 'stacked_predictions', 'quantile_predictions']),
+        Stage('optimized_team', _optimized_team, ['predictions'], {'risk_aversion': risk_aversion}),
+    ]
+
+
+# -----------------------------------------
+# 2. Runner
+# -----------------------------------------
+class Pipeline:
+    """
+    Runs a list of stages/sources with on-disk, content-addressed caching.
+    """
+
+    def __init__(self, stages, cache_dir=PIPELINE_DIR, n_jobs=None):
+        self.nodes = {node.name: node for node in stages}
+        self.cache_dir = cache_dir
+        self.n_jobs = n_jobs or min(4, os.cpu_count() or 1)
+        self.digests = {}
+        self.paths = {}
+        self.status = {}
+        self.metadata = {}
+        self._values = {}
+        self._locks = {name: threading.Lock() for name in self.nodes}
+
+    def _stage_files(self, stage, key):
+        base = os.path.join(self.cache_dir, stage.name, key)
+        return base + '.arrow', base + '.json'
+
+    def value(self, name):
+        """
+        The node's output, loaded (once) from the source or the stage cache.
+        """
+        with self._locks[name]:
+            if name not in self._values:
+                node = self.nodes[name]
+                if isinstance(node, Source):
+                    self._values[name] = node.load()
+                else:
+                    self._values[name] = feather.read_table(self.paths[name]).to_pandas()
+            return self._values[name]
+
+    def _run_node(self, name, force):
+        node = self.nodes[name]
+        if isinstance(node, Source):
+            self.digests[name] = node.fingerprint()
+            self.status[name] = 'source'
+            return
+
+        key = _digest(node.name, node.version, node.params, [self.digests[i] for i in node.inputs])
+        data_path, meta_path = self._stage_files(node, key)
+        if not force and os.path.exists(data_path) and os.path.exists(meta_path):
+            with open(meta_path) as f:
+                meta = json.load(f)
+            self.digests[name] = meta['digest']
+            self.metadata[name] = meta.get('metadata', {})
+            self.paths[name] = data_path
+            self.status[name] = 'cached'
+            return
+
+        with span(f"pipeline.{name}"):
+            output = node.func(*[self.value(i) for i in node.inputs], **node.params)
+        output = output.reset_index(drop=True)
+        os.makedirs(os.path.dirname(data_path), exist_ok=True)
+        feather.write_feather(output, data_path + '.tmp', compression='uncompressed')
+        os.replace(data_path + '.tmp', data_path)
+        digest = frame_digest(output)
+        metadata = node.metadata(output) if node.metadata else {}
+        with open(meta_path, 'w') as f:
+            json.dump({'stage': name, 'key': key, 'digest': digest, 'rows': len(output), 'metadata': metadata}, f)
+        with self._locks[name]:
+            self._values[name] = output
+        self.digests[name] = digest
+        self.metadata[name] = metadata
+        self.paths[name] = data_path
+        self.status[name] = 'ran'
+
+    def run(self, force=()):
+        """
+        Runs every node whose inputs are ready, concurrently, until all are done.
+        `force` lists stages to rerun even when cached ('all' for every stage).
+        Returns {name: 'source' | 'cached' | 'ran'}.
+        """
+        pending = dict(self.nodes)
+        running = {}
+        with ThreadPoolExecutor(max_workers=self.n_jobs) as pool:
+            while pending or running:
+                ready = [n for n, node in pending.items()
+                         if all(i in self.status for i in node.inputs)]
+                for name in ready:
+                    del pending[name]
+                    running[pool.submit(self._run_node, name, force == 'all' or name in force)] = name
+                if not running:
+                    raise ValueError(f"Unresolvable stage inputs: {sorted(pending)}")
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    del running[future]
+                    future.result()
+        return dict(self.status)
+
+
+# -----------------------------------------
+# 3. Entry points
+# -----------------------------------------
+def missing_models(quantiles=QUANTILES):
+    """
+    Names of the pipeline's models that are not in the registry.
+    """
+    from src.registry import model_entry, quantile_model_name
+
+    missing = []
+    for name in ['stacked', *(quantile_model_name(q) for q in quantiles)]:
+        try:
+            model_entry(name)
+        except KeyError:
+            missing.append(name)
+    return missing
+
+
+def train_missing_models(data_path='data/merged_gw.csv', teams_path='data/teams.csv', window=3,
+                         quantiles=QUANTILES):
+    """
+    Trains and registers the models missing from the registry, as the app did
+    before the pipeline existed. Returns the names trained.
+    """
+    from src.model import train_stacked_model, train_multi_quantile_models
+    from src.registry import quantile_model_name
+    from src.data import load_merged_gws_data, load_team_info
+
+    missing = missing_models(quantiles)
+    if missing:
+        logger.warning("Training missing models: %s", ', '.join(missing))
+        features = _features(load_merged_gws_data(data_path), load_team_info(teams_path), window)
+        if 'stacked' in missing:
+            train_stacked_model(features)
+        missing_quantiles = [q for q in quantiles if quantile_model_name(q) in missing]
+        if missing_quantiles:
+            train_multi_quantile_models(features, quantiles=missing_quantiles, use_time_holdout=True)
+    return missing
+
+
+def output_paths(gameweek, out_dir='data'):
+    """
+    CSV export paths for the gameweek being predicted.
+    """
+    return {
+        'predictions': os.path.join(out_dir, f"gw{gameweek}_predictions.csv"),
+        'optimized_team': os.path.join(out_dir, f"gw{gameweek}_optimized_team.csv"),
+    }
+
+
+def run_pipeline(gameweek=None, risk_aversion=0.01, force=(), cache_dir=PIPELINE_DIR, out_dir='data',
+                 n_jobs=None, train_missing=True, **data_paths):
+    """
+    Runs the default DAG from `gameweek`'s data (default: latest), exports the
+    CSVs for the following gameweek and writes the manifest (gameweek, stage
+    output files, export paths) read by load_outputs. The exports are always
+    rewritten: a cached stage output may differ from the last run's export
+    (e.g. after a run with another risk aversion).
+    Models missing from the registry are trained first; with
+    train_missing=False a RuntimeError names them instead.
+    Returns (pipeline, manifest).
+    """
+    if train_missing:
+        train_missing_models(**data_paths)
+    elif missing_models():
+        raise RuntimeError(
+            f"No registered model(s) {', '.join(missing_models())}. Train them with "
+            f"`python -m src.pipeline` (without --no-train), or register existing files with src.registry."
+        )
+    pipeline = Pipeline(default_stages(gameweek=gameweek, risk_aversion=risk_aversion, **data_paths),
+                        cache_dir=cache_dir, n_jobs=n_jobs)
+    status = pipeline.run(force=force)
+
+    if gameweek is None:
+        gameweek = pipeline.metadata['features']['gameweek']
+    exports = output_paths(gameweek + 1, out_dir)
+    for name, path in exports.items():
+        pipeline.value(name).to_csv(path, index=False)
+
+    manifest = {'gameweek': gameweek, 'status': status, 'exports': exports,
+                'outputs': {name: pipeline.paths[name] for name in ('predictions', 'optimized_team')}}
+    os.makedirs(cache_dir, exist_ok=True)
+    with open(os.path.join(cache_dir, MANIFEST_NAME), 'w') as f:
+        json.dump(manifest, f, indent=2)
+    return pipeline, manifest
+
+
+def load_outputs(cache_dir=PIPELINE_DIR):
+    """
+    Reads the last run's predictions and optimized team without recomputing.
+    Returns (gameweek, predictions, optimized_team), or None if nothing has run yet.
+    """
+    path = os.path.join(cache_dir, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        manifest = json.load(f)
+    outputs = {name: feather.read_table(p).to_pandas() for name, p in manifest['outputs'].items()}
+    return manifest['gameweek'], outputs['predictions'], outputs['optimized_team']
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the prediction/optimization pipeline with caching.")
+    parser.add_argument('--gameweek', type=int, default=None, help="Gameweek to predict from (default: latest)")
+    parser.add_argument('--risk-aversion', type=float, default=0.01)
+    parser.add_argument('--force', nargs='*', default=None, metavar='STAGE',
+                        help="Stages to rerun; a bare --force (or 'all') reruns every stage")
+    parser.add_argument('--jobs', type=int, default=None)
+    parser.add_argument('--no-train', action='store_true', help="Fail instead of training missing models")
+    args = parser.parse_args()
+
+    if args.force is None:
+        force = ()
+    elif not args.force or 'all' in args.force:
+        force = 'all'
+    else:
+        force = tuple(args.force)
+    _, manifest = run_pipeline(args.gameweek, args.risk_aversion, force=force, n_jobs=args.jobs,
+                               train_missing=not args.no_train)
+    for name, state in manifest['status'].items():
+        print(f"{name:22s} {state}")
+    print(f"From gameweek {manifest['gameweek']}: {manifest['exports']['predictions']}, "
+          f"{manifest['exports']['optimized_team']}")
+
+
+if __name__ == '__main__':
+    main()
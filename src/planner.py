@@ -0,0 +1,258 @@
+"""
+Multi-gameweek transfer planner.
+
+Extends the single-gameweek squad MILP in src/optimizer.py over a rolling
+horizon: per-gameweek squad, starting XI and captain variables, transfers in
+and out, free-transfer banking, -4 hits and money in the bank carried over.
+"""
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from scipy.optimize import milp, Bounds, LinearConstraint
+
+from src.optimizer import POSITION_LIMITS, SQUAD_SIZE, MAX_PER_TEAM
+from src.pruning import dominating_clubs, required_clubs
+
+# Starting XI rules: (min, max) starters per position
+LINEUP_SIZE = 11
+LINEUP_LIMITS = {'GK': (1, 1), 'DEF': (3, 5), 'MID': (2, 5), 'FWD': (1, 3)}
+MAX_FREE_TRANSFERS = 5
+HIT_COST = 4
+
+
+def _points_matrix(predictions, horizon):
+    """
+    Returns (players, points, gameweeks): one row per player, and an
+    (n_players x horizon) matrix of predicted points. If `predictions` has a
+    'gameweek' column, the first `horizon` gameweeks are used (missing
+    player-gameweeks, i.e. blanks, score 0); otherwise the same prediction is
+    used for every gameweek.
+    """
+    if 'gameweek' in predictions.columns:
+        gameweeks = np.sort(predictions['gameweek'].unique())[:horizon]
+        long = predictions[predictions['gameweek'].isin(gameweeks)]
+        points = long.pivot_table(index='player_id', columns='gameweek', values='predicted_points',
+                                  aggfunc='sum', fill_value=0.0).reindex(columns=gameweeks, fill_value=0.0)
+        players = (long.drop_duplicates('player_id', keep='last').drop(columns='gameweek')
+                   .set_index('player_id').loc[points.index])
+        return players.reset_index(), points.to_numpy(dtype=np.float64), list(gameweeks)
+
+    players = predictions.drop_duplicates('player_id', keep='last').reset_index(drop=True)
+    points = np.repeat(players['predicted_points'].to_numpy(dtype=np.float64)[:, None], horizon, axis=1)
+    return players, points, list(range(1, horizon + 1))
+
+
+def dominance_filter(players, points, keep_ids=(), depth=None, heuristic=False):
+    """
+    Drops players that are dominated, within their position, by players from at
+    least `depth` distinct clubs that cost no more and are predicted at least as
+    many points in every gameweek of the horizon. The default depth
+    (src.pruning.required_clubs over the horizon) guarantees that the optimal
+    plan value is unchanged: some dominator can stand in for a dropped player
+    without breaking the position, per-club or bank limits or using more
+    transfers. Beyond a few gameweeks that depth exceeds the number of clubs and
+    nothing is dropped.
+
+    With `heuristic`, the single-gameweek depth is used at every horizon. It
+    prunes far more, but it is NOT guaranteed optimal: a plan whose squads fill
+    different clubs over the horizon may need a dropped player.
+    Players in `keep_ids` (e.g. the current squad) are always kept.
+
+    Returns a boolean mask over `players`.
+    """
+    cost = players['now_cost'].to_numpy(dtype=np.float64)
+    position = players['position'].to_numpy()
+    club = pd.factorize(players['team'])[0]
+    keep = players['player_id'].isin(list(keep_ids)).to_numpy()
+    gameweeks = 1 if heuristic else points.shape[1]
+    for pos, quota in POSITION_LIMITS.items():
+        rows = np.flatnonzero(position == pos)
+        if len(rows) == 0:
+            continue
+        counts = dominating_clubs(cost[rows], points[rows], np.zeros(len(rows)), club[rows])
+        keep[rows] |= counts < (depth or required_clubs(quota, gameweeks=gameweeks))
+    return keep
+
+
+def plan_transfers(predictions, current_squad, bank=0, free_transfers=1, horizon=3,
+                   hit_cost=HIT_COST, bench_weight=0.1, time_limit=None, prune=False):
+    """
+    Plans transfers, starting XIs and captains over the next `horizon` gameweeks.
+
+    predictions: player_id, position, team, now_cost, predicted_points, and
+      optionally 'gameweek' for per-gameweek predictions.
+    current_squad: the 15 player_ids currently owned.
+    bank: money in the bank, in tenths (like now_cost).
+
+    Objective:
+      maximize sum over gameweeks of
+        starting XI points + captain points (counted twice)
+        + bench_weight * bench points
+        - hit_cost * paid transfers
+
+    Each unused free transfer rolls over (up to MAX_FREE_TRANSFERS); transfers
+    beyond the available free ones cost `hit_cost`. Players are bought and sold
+    at now_cost and the bank must stay non-negative.
+
+    With `prune=True`, dominated players are removed before the model is built
+    without changing the optimal value; prune='heuristic' prunes much harder
+    but may miss the optimal plan (see dominance_filter). With `time_limit`
+    (seconds), the best solution found so far is returned when the limit is hit.
+
+    Returns (squads, summary): one row per player in the squad per gameweek with
+    'starting', 'captain', 'bought' flags, and one row per gameweek with transfers,
+    hits, bank and expected points. summary.attrs holds the solver status, gap,
+    objective, candidate count and pruning mode.
+    """
+    players, points, gameweeks = _points_matrix(predictions, horizon)
+    owned = players['player_id'].isin(list(current_squad)).to_numpy()
+    if owned.sum() != len(set(current_squad)):
+        missing = set(current_squad) - set(players['player_id'])
+        raise ValueError(f"Current squad players missing from predictions: {sorted(missing)}")
+
+    if prune:
+        mask = dominance_filter(players, points, keep_ids=current_squad, heuristic=prune == 'heuristic')
+        players, points, owned = players[mask].reset_index(drop=True), points[mask], owned[mask]
+
+    n, T = points.shape
+    cost = players['now_cost'].to_numpy(dtype=np.float64)
+    position_codes = pd.Categorical(players['position'], categories=list(POSITION_LIMITS)).codes
+    team_codes, teams = pd.factorize(players['team'])
+
+    # Variable layout: five (n x T) player blocks, then three length-T scalar blocks.
+    blocks = ['squad', 'start', 'captain', 'buy', 'sell']
+    scalars = ['bank', 'free', 'hits']
+    offset = {name: k * n * T for k, name in enumerate(blocks)}
+    offset.update({name: len(blocks) * n * T + k * T for k, name in enumerate(scalars)})
+    n_vars = len(blocks) * n * T + len(scalars) * T
+
+    def var(name, t):
+        if name in scalars:
+            return offset[name] + t
+        return offset[name] + t * n + np.arange(n)
+
+    rows, cols, vals, lower, upper = [], [], [], [], []
+
+    def add(terms, lo, hi):
+        """Adds one constraint row: lo <= sum(coef * var) <= hi."""
+        r = len(lower)
+        for index, coef in terms:
+            index = np.atleast_1d(index)
+            rows.append(np.full(len(index), r))
+            cols.append(index)
+            vals.append(np.broadcast_to(np.asarray(coef, dtype=np.float64), index.shape))
+        lower.append(lo)
+        upper.append(hi)
+
+    def add_per_player(terms, lo, hi):
+        """Adds n rows at once: for each player i, lo <= sum(coef * var[i]) <= hi."""
+        r = len(lower)
+        for index, coef in terms:
+            rows.append(r + np.arange(n))
+            cols.append(index)
+            vals.append(np.broadcast_to(np.asarray(coef, dtype=np.float64), index.shape))
+        lower.extend(np.broadcast_to(lo, n))
+        upper.extend(np.broadcast_to(hi, n))
+
+    for t in range(T):
+        squad, start, captain, buy, sell = (var(b, t) for b in blocks)
+
+        # Squad continuity: squad_t = squad_{t-1} + buy_t - sell_t
+        prev_squad = owned.astype(np.float64)
+        terms = [(squad, 1.0), (buy, -1.0), (sell, 1.0)]
+        if t > 0:
+            terms.append((var('squad', t - 1), -1.0))
+            prev_squad = 0.0
+        add_per_player(terms, prev_squad, prev_squad)
+
+        # Bank carry-over: bank_t = bank_{t-1} + sales - purchases
+        terms = [(var('bank', t), 1.0), (sell, -cost), (buy, cost)]
+        prev_bank = float(bank)
+        if t > 0:
+            terms.append((var('bank', t - 1), -1.0))
+            prev_bank = 0.0
+        add(terms, prev_bank, prev_bank)
+
+        # Free transfers: transfers_t - free_t <= hits_t <= transfers_t, and
+        # free_{t+1} <= free_t - (transfers_t - hits_t) + 1
+        add([(buy, 1.0), (var('free', t), -1.0), (var('hits', t), -1.0)], -np.inf, 0)
+        add([(var('hits', t), 1.0), (buy, -1.0)], -np.inf, 0)
+        if t + 1 < T:
+            add([(var('free', t + 1), 1.0), (var('free', t), -1.0), (buy, 1.0), (var('hits', t), -1.0)],
+                -np.inf, 1)
+
+        # Squad rules
+        add([(squad, 1.0)], SQUAD_SIZE, SQUAD_SIZE)
+        for code, limit in enumerate(POSITION_LIMITS.values()):
+            add([(squad[position_codes == code], 1.0)], limit, limit)
+        for code in range(len(teams)):
+            add([(squad[team_codes == code], 1.0)], -np.inf, MAX_PER_TEAM)
+
+        # Starting XI and captain
+        add_per_player([(start, 1.0), (squad, -1.0)], -np.inf, 0)
+        add_per_player([(captain, 1.0), (start, -1.0)], -np.inf, 0)
+        add([(start, 1.0)], LINEUP_SIZE, LINEUP_SIZE)
+        for code, pos in enumerate(POSITION_LIMITS):
+            add([(start[position_codes == code], 1.0)], *LINEUP_LIMITS[pos])
+        add([(captain, 1.0)], 1, 1)
+
+    A = sparse.csr_matrix((np.concatenate(vals), (np.concatenate(rows), np.concatenate(cols))),
+                          shape=(len(lower), n_vars))
+
+    # Objective (maximized)
+    c = np.zeros(n_vars)
+    for t in range(T):
+        c[var('squad', t)] += bench_weight * points[:, t]
+        c[var('start', t)] += (1 - bench_weight) * points[:, t]
+        c[var('captain', t)] += points[:, t]
+        c[var('hits', t)] = -hit_cost
+
+    lb, ub = np.zeros(n_vars), np.ones(n_vars)
+    for t in range(T):
+        ub[var('bank', t)] = np.inf
+        lb[var('free', t)], ub[var('free', t)] = 1, MAX_FREE_TRANSFERS
+        ub[var('hits', t)] = np.inf
+    lb[var('free', 0)] = ub[var('free', 0)] = min(free_transfers, MAX_FREE_TRANSFERS)
+    integrality = np.ones(n_vars)
+    integrality[[var('bank', t) for t in range(T)]] = 0
+
+    options = {} if time_limit is None else {'time_limit': time_limit}
+    res = milp(-c, constraints=LinearConstraint(A, lower, upper), integrality=integrality,
+               bounds=Bounds(lb, ub), options=options)
+    if res.x is None:
+        raise RuntimeError(f"Transfer planner found no feasible plan: {res.message}")
+
+    x = res.x
+    squads, summary = [], []
+    for t, gw in enumerate(gameweeks):
+        in_squad = x[var('squad', t)] > 0.5
+        gw_squad = players.loc[in_squad].copy()
+        gw_squad.insert(0, 'gameweek', gw)
+        gw_squad['predicted_points'] = points[in_squad, t]
+        gw_squad['starting'] = x[var('start', t)][in_squad] > 0.5
+        gw_squad['captain'] = x[var('captain', t)][in_squad] > 0.5
+        gw_squad['bought'] = x[var('buy', t)][in_squad] > 0.5
+        squads.append(gw_squad)
+
+        bought = players.loc[x[var('buy', t)] > 0.5, 'player_id'].tolist()
+        sold = players.loc[x[var('sell', t)] > 0.5, 'player_id'].tolist()
+        summary.append({
+            'gameweek': gw,
+            'transfers_in': bought,
+            'transfers_out': sold,
+            'free_transfers': int(round(x[var('free', t)])),
+            'hits': int(round(x[var('hits', t)])),
+            'bank': float(x[var('bank', t)]),
+            'expected_points': float(points[:, t] @ np.round(x[var('start', t)])
+                                     + points[:, t] @ np.round(x[var('captain', t)])),
+        })
+
+    summary = pd.DataFrame(summary)
+    summary.attrs.update({
+        'status': {0: "Optimal", 1: "Time Limit"}.get(res.status, res.message),
+        'mip_gap': getattr(res, 'mip_gap', None),
+        'objective': float(-res.fun) if res.x is not None else None,
+        'candidates': n,
+        'pruning': prune,
+    })
+    return pd.concat(squads, ignore_index=True), summary
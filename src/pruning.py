@@ -0,0 +1,207 @@
+"""
+Candidate-pool pruning for the squad optimizer.
+
+A player i is dominated by j (same position) when j costs no more, is predicted
+at least `epsilon` more points and carries no more risk (exact ties are broken
+by row order). i can be dropped without changing the optimal squad value when
+its dominators span at least
+
+    quota - 1 + (SQUAD_SIZE - 1) // MAX_PER_TEAM + 1
+
+distinct clubs (9 for DEF/MID, 7 for FWD, 6 for GK): in any squad containing i,
+at most quota - 1 of those clubs' dominators are already picked at i's position
+and at most 4 clubs are full, so some dominator can replace i within budget,
+position and per-club limits without lowering the objective. Dominance is
+transitive, so the guarantee holds however many players are dropped.
+
+Without `risk_aversion` the test uses cost, points and risk separately, so the
+pruned pool is valid for every risk aversion >= 0 and every budget (e.g. for
+optimize_scenarios). With a fixed `risk_aversion` it compares the objective
+points - risk_aversion * risk directly and prunes harder.
+
+Only each club's own Pareto front can matter as dominators, so every player is
+compared against the club fronts (a few hundred players) in blocks of arrays
+rather than against the whole position.
+
+Usage:
+    index = CandidateIndex(latest)
+    optimize_team(index.candidates())
+    index.update(new_predictions)        # only positions that changed are redone
+"""
+import numpy as np
+import pandas as pd
+
+from src.optimizer import POSITION_LIMITS, SQUAD_SIZE, MAX_PER_TEAM
+from src.instrument import timed
+
+INDEX_COLUMNS = ['player_id', 'position', 'team', 'now_cost', 'predicted_points', 'predicted_risk']
+_BLOCK = 4096
+
+
+def required_clubs(quota, squad_size=SQUAD_SIZE, max_per_team=MAX_PER_TEAM, gameweeks=1):
+    """
+    Number of distinct clubs a player's dominators must span for it to be pruned.
+
+    Over several gameweeks (a transfer plan) take a plan that buys the pruned
+    player i at gameweek a. Pick a dominator j that is not in the squad at a and
+    whose club is never full (3 others) while i is held, and buy j instead of i.
+    If the plan later buys j anyway, buy i at that point instead. Transfers, bank
+    and club counts are no worse, and j scores at least as many points until then.
+    The argument then restarts from that gameweek. So the position blocks quota - 1
+    clubs once, while the full clubs (at most (squad_size - 1) // max_per_team per
+    gameweek) add up over the gameweeks.
+    """
+    return quota - 1 + gameweeks * ((squad_size - 1) // max_per_team) + 1
+
+
+# -----------------------------------------
+# 1. Dominance
+# -----------------------------------------
+def _dominates(cost, points, risk, rows, cols, epsilon=0.0):
+    """
+    Boolean matrix [len(rows), len(cols)]: cols[k] dominates rows[r].
+    `points` may also be (n x gameweeks); dominance then holds in every gameweek.
+    """
+    points = points.reshape(len(points), -1)
+    c_i, p_i, r_i = cost[rows, None], points[rows, None, :], risk[rows, None]
+    c_j, p_j, r_j = cost[None, cols], points[None, cols, :], risk[None, cols]
+    weak = (c_j <= c_i) & np.all(p_j >= p_i + epsilon, axis=2) & (r_j <= r_i)
+    equal = (c_j == c_i) & np.all(p_j == p_i, axis=2) & (r_j == r_i)
+    return weak & (~equal | (cols[None, :] < rows[:, None]))
+
+
+def club_fronts(cost, points, risk, club, pool):
+    """
+    Indices (into the arrays) of each club's Pareto front among the `pool` rows.
+    """
+    fronts = []
+    pool_clubs = club[pool]
+    for code in np.unique(pool_clubs):
+        members = pool[pool_clubs == code]
+        dominated = np.zeros(len(members), dtype=bool)
+        for start in range(0, len(members), _BLOCK):
+            rows = members[start:start + _BLOCK]
+            dominated[start:start + _BLOCK] = _dominates(cost, points, risk, rows, members).any(axis=1)
+        fronts.append(members[~dominated])
+    return np.concatenate(fronts) if fronts else np.array([], dtype=int)
+
+
+def dominating_clubs(cost, points, risk, club, pool=None, epsilon=0.0):
+    """
+    For every row, the number of distinct clubs with a `pool` player dominating
+    it by at least `epsilon` points. Rows are one position's players.
+    """
+    n = len(cost)
+    pool = np.arange(n) if pool is None else pool
+    front = club_fronts(cost, points, risk, club, pool)
+    counts = np.zeros(n, dtype=int)
+    if len(front) == 0:
+        return counts
+    club_codes, front_clubs = np.unique(club[front], return_inverse=True)
+    onehot = np.zeros((len(front), len(club_codes)))
+    onehot[np.arange(len(front)), front_clubs] = 1.0
+    for start in range(0, n, _BLOCK):
+        rows = np.arange(start, min(start + _BLOCK, n))
+        dominated_by = _dominates(cost, points, risk, rows, front, epsilon)
+        counts[rows] = ((dominated_by @ onehot) > 0).sum(axis=1)
+    return counts
+
+
+# -----------------------------------------
+# 2. Candidate index
+# -----------------------------------------
+class CandidateIndex:
+    """
+    Keeps, per position, the players that can appear in an optimal squad.
+
+    - risk_aversion: None (valid for any risk aversion) or the value to prune for
+    - epsilon: dominators must beat a player by at least this many points, which
+      keeps a band of near-front players (more robust to small prediction changes)
+    - exclude_dominators: player_ids that may not serve as dominators (e.g.
+      players a scenario excludes)
+    - keep_ids: player_ids that are never pruned (e.g. players a scenario forces in)
+    """
+
+    def __init__(self, players, risk_aversion=None, epsilon=0.0, exclude_dominators=(), keep_ids=()):
+        self.risk_aversion = risk_aversion
+        self.epsilon = epsilon
+        self.exclude_dominators = set(exclude_dominators)
+        self.keep_ids = set(keep_ids)
+        self.players = players.reset_index(drop=True)
+        self.mask = np.ones(len(self.players), dtype=bool)
+        self.rebuilt = []
+        self._build(list(POSITION_LIMITS))
+
+    def _values(self, rows):
+        players = self.players.loc[rows]
+        points = players['predicted_points'].to_numpy(dtype=np.float64)
+        risk = players['predicted_risk'].to_numpy(dtype=np.float64)
+        if self.risk_aversion is not None:
+            points, risk = points - self.risk_aversion * risk, np.zeros(len(rows))
+        return players['now_cost'].to_numpy(dtype=np.float64), points, risk
+
+    def _build(self, positions):
+        position = self.players['position'].to_numpy()
+        club = pd.factorize(self.players['team'])[0]
+        player_id = self.players['player_id']
+        for pos in positions:
+            rows = np.flatnonzero(position == pos)
+            cost, points, risk = self._values(rows)
+            pool = np.flatnonzero(~player_id.iloc[rows].isin(self.exclude_dominators).to_numpy())
+            counts = dominating_clubs(cost, points, risk, club[rows], pool, self.epsilon)
+            pruned = (counts >= required_clubs(POSITION_LIMITS[pos])) \
+                & ~player_id.iloc[rows].isin(self.keep_ids).to_numpy()
+            self.mask[rows] = ~pruned
+        self.rebuilt = list(positions)
+
+    @timed('pruning.update')
+    def update(self, players):
+        """
+        Replaces the players/predictions and recomputes only the positions whose
+        players, costs, clubs or predictions changed. Returns the rebuilt positions.
+        """
+        new = players.reset_index(drop=True)
+        old = self.players
+        changed = set(new['position']) ^ set(old['position'])
+        for pos in POSITION_LIMITS:
+            a = old.loc[old['position'] == pos, INDEX_COLUMNS].sort_values('player_id', kind='stable')
+            b = new.loc[new['position'] == pos, INDEX_COLUMNS].sort_values('player_id', kind='stable')
+            if not a.reset_index(drop=True).equals(b.reset_index(drop=True)):
+                changed.add(pos)
+
+        keep = pd.Series(self.mask, index=old['player_id'])
+        keep = keep[~keep.index.duplicated()]
+        self.players = new
+        self.mask = new['player_id'].map(keep).fillna(True).to_numpy(dtype=bool)
+        self._build([pos for pos in POSITION_LIMITS if pos in changed])
+        return self.rebuilt
+
+    def candidates(self):
+        """
+        The retained players (a frame with the original columns).
+        """
+        return self.players.loc[self.mask]
+
+    @property
+    def reduction_ratio(self):
+        """
+        Players in the full pool per retained player.
+        """
+        return len(self.players) / max(int(self.mask.sum()), 1)
+
+    def summary(self):
+        """
+        Per-position pool size, retained count and reduction ratio.
+        """
+        kept = pd.Series(self.mask).groupby(self.players['position'].to_numpy())
+        summary = pd.DataFrame({'players': kept.size(), 'kept': kept.sum()})
+        summary['ratio'] = summary['players'] / summary['kept'].clip(lower=1)
+        return summary
+
+
+@timed()
+def prune_candidates(players, risk_aversion=None, epsilon=0.0):
+    """
+    The players that can appear in an optimal squad (see CandidateIndex).
+    """
+    return CandidateIndex(players, risk_aversion, epsilon).candidates()
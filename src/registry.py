@@ -0,0 +1,329 @@
+"""
+Model artifact registry.
+
+Records each model's version, format, training gameweek range and the hash of
+the predictor list it was trained on, in models/registry.json. Models are
+loaded lazily on first use and cached per process; a model trained on a
+different predictor set is rejected instead of silently mispredicting.
+
+Stacked models can be exported to each base learner's native format
+(XGBoost UBJ, LightGBM text, CatBoost cbm, RandomForest memory-mapped joblib)
+plus the linear meta-learner weights as JSON. Loading those needs only the
+libraries of the members and skips unpickling full sklearn wrappers.
+
+Usage:
+    python -m src.registry list
+    python -m src.registry export stacked
+"""
+import argparse
+import hashlib
+import json
+import os
+import threading
+from datetime import datetime, timezone
+
+import numpy as np
+
+from src.features import PREDICTORS
+from src.instrument import span
+
+REGISTRY_PATH = 'models/registry.json'
+NATIVE_DIR = 'models/native'
+
+# Artifacts that predate the registry; used when a name has no registry entry.
+DEFAULT_ARTIFACTS = {
+    'stacked': 'models/stacked_model.joblib',
+    'quantile_p10': 'models/quantile_model_p10.joblib',
+    'quantile_p50': 'models/quantile_model_p50.joblib',
+    'quantile_p90': 'models/quantile_model_p90.joblib',
+}
+QUANTILE_NAMES = {0.1: 'quantile_p10', 0.5: 'quantile_p50', 0.9: 'quantile_p90'}
+
+_loaded = {}
+_lock = threading.Lock()
+
+
+def predictors_hash(predictors=PREDICTORS):
+    """
+    Short, order-sensitive hash of a predictor list.
+    """
+    return hashlib.sha256(json.dumps(list(predictors)).encode('utf-8')).hexdigest()[:16]
+
+
+def quantile_model_name(q):
+    return QUANTILE_NAMES.get(q, f"quantile_p{int(q * 100)}")
+
+
+# -----------------------------------------
+# 1. Registry file
+# -----------------------------------------
+def read_registry(registry_path=REGISTRY_PATH):
+    if not os.path.exists(registry_path):
+        return {'models': {}}
+    with open(registry_path) as f:
+        return json.load(f)
+
+
+def _write_registry(registry, registry_path):
+    os.makedirs(os.path.dirname(registry_path) or '.', exist_ok=True)
+    tmp = registry_path + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(registry, f, indent=2, sort_keys=True)
+    os.replace(tmp, registry_path)
+
+
+def register_model(name, path, fmt='joblib', features_df=None, predictors=PREDICTORS,
+                   registry_path=REGISTRY_PATH):
+    """
+    Records (or bumps the version of) a model artifact.
+    If `features_df` is given, its gameweek range is stored as the training range.
+    """
+    with _lock:
+        registry = read_registry(registry_path)
+        previous = registry['models'].get(name, {})
+        gameweeks = None
+        if features_df is not None and 'gameweek' in features_df:
+            gameweeks = [int(features_df['gameweek'].min()), int(features_df['gameweek'].max())]
+        entry = {
+            'name': name,
+            'version': previous.get('version', 0) + 1,
+            'format': fmt,
+            'path': path,
+            'predictors': list(predictors),
+            'predictors_hash': predictors_hash(predictors),
+            'trained_gameweeks': gameweeks if gameweeks is not None else previous.get('trained_gameweeks'),
+            'created': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        }
+        registry['models'][name] = entry
+        _write_registry(registry, registry_path)
+        _loaded.pop((registry_path, name), None)
+    return entry
+
+
+def model_entry(name, registry_path=REGISTRY_PATH):
+    """
+    Returns the registry entry for `name`, falling back to the pre-registry
+    artifact (with an unknown predictor set) if it has not been registered.
+    """
+    entry = read_registry(registry_path)['models'].get(name)
+    if entry is not None:
+        return entry
+    if name in DEFAULT_ARTIFACTS and os.path.exists(DEFAULT_ARTIFACTS[name]):
+        return {'name': name, 'version': 0, 'format': 'joblib', 'path': DEFAULT_ARTIFACTS[name],
+                'predictors': None, 'predictors_hash': None, 'trained_gameweeks': None}
+    raise KeyError(f"No model named '{name}' in {registry_path}")
+
+
+# -----------------------------------------
+# 2. Native formats
+# -----------------------------------------
+class NativeBooster:
+    """
+    A base learner loaded from its library's native format. `booster` is the
+    raw library object (xgboost.Booster, lightgbm.Booster or CatBoostRegressor).
+    """
+
+    def __init__(self, booster, kind):
+        self.booster = booster
+        self.kind = kind
+
+    def predict(self, X):
+        X = np.ascontiguousarray(np.asarray(X, dtype=np.float64))
+        if self.kind == 'xgboost':
+            return self.booster.inplace_predict(X)
+        return self.booster.predict(X)
+
+
+class LinearMeta:
+    """
+    The fitted linear meta-learner of a stacked model.
+    """
+
+    def __init__(self, coef, intercept):
+        self.coef_ = np.asarray(coef, dtype=np.float64)
+        self.intercept_ = float(intercept)
+
+    def predict(self, Z):
+        return np.asarray(Z, dtype=np.float64) @ self.coef_ + self.intercept_
+
+
+class NativeStack:
+    """
+    Stacked ensemble rebuilt from natively stored members. Exposes the same
+    estimators_ / named_estimators_ / final_estimator_ attributes as sklearn's
+    StackingRegressor, so it can be used wherever the joblib model is.
+    """
+
+    def __init__(self, members, meta, predictors):
+        self.named_estimators_ = dict(members)
+        self.estimators_ = list(self.named_estimators_.values())
+        self.final_estimator_ = meta
+        self.feature_names_in_ = np.asarray(predictors, dtype=object)
+
+    def predict(self, X):
+        base = np.column_stack([est.predict(X) for est in self.estimators_])
+        return self.final_estimator_.predict(base)
+
+
+def _member_format(estimator):
+    module = type(estimator).__module__
+    if module.startswith('xgboost'):
+        return 'xgboost', 'ubj'
+    if module.startswith('lightgbm'):
+        return 'lightgbm', 'txt'
+    if module.startswith('catboost'):
+        return 'catboost', 'cbm'
+    return 'joblib', 'joblib'
+
+
+def _save_member(estimator, path_stem):
+    kind, ext = _member_format(estimator)
+    path = f"{path_stem}.{ext}"
+    if kind == 'xgboost':
+        estimator.get_booster().save_model(path)
+    elif kind == 'lightgbm':
+        estimator.booster_.save_model(path)
+    elif kind == 'catboost':
+        estimator.save_model(path)
+    else:
+        from joblib import dump
+        dump(estimator, path)
+    return kind, os.path.basename(path)
+
+
+def _load_member(kind, path):
+    if kind == 'xgboost':
+        import xgboost
+        booster = xgboost.Booster()
+        booster.load_model(path)
+        return NativeBooster(booster, kind)
+    if kind == 'lightgbm':
+        import lightgbm
+        return NativeBooster(lightgbm.Booster(model_file=path), kind)
+    if kind == 'catboost':
+        from catboost import CatBoostRegressor
+        return NativeBooster(CatBoostRegressor().load_model(path), kind)
+    from joblib import load
+    # Tree arrays are memory-mapped, so processes share the pages.
+    return load(path, mmap_mode='r')
+
+
+def export_native(name, out_dir=None, registry_path=REGISTRY_PATH):
+    """
+    Exports a registered stacked or single-booster model to native formats
+    under `out_dir` (default models/native/<name>) and re-registers it.
+    """
+    entry = model_entry(name, registry_path)
+    model = get_model(name, registry_path)
+    out_dir = out_dir or os.path.join(NATIVE_DIR, name)
+    os.makedirs(out_dir, exist_ok=True)
+    predictors = entry['predictors'] or list(getattr(model, 'feature_names_in_', PREDICTORS))
+
+    if hasattr(model, 'named_estimators_'):
+        members = [{'name': member, 'kind': kind, 'file': fname}
+                   for member, est in model.named_estimators_.items()
+                   for kind, fname in [_save_member(est, os.path.join(out_dir, member))]]
+        manifest = {
+            'members': members,
+            'meta': {'coef': model.final_estimator_.coef_.tolist(),
+                     'intercept': float(model.final_estimator_.intercept_)},
+        }
+        fmt = 'native-stack'
+    else:
+        kind, fname = _save_member(model, os.path.join(out_dir, 'model'))
+        manifest = {'members': [{'name': 'model', 'kind': kind, 'file': fname}]}
+        fmt = 'native'
+
+    with open(os.path.join(out_dir, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f, indent=2)
+    return register_model(name, out_dir, fmt=fmt, predictors=predictors, registry_path=registry_path)
+
+
+def _load_native(entry):
+    with open(os.path.join(entry['path'], 'manifest.json')) as f:
+        manifest = json.load(f)
+    members = [(m['name'], _load_member(m['kind'], os.path.join(entry['path'], m['file'])))
+               for m in manifest['members']]
+    if entry['format'] == 'native':
+        return members[0][1]
+    meta = LinearMeta(manifest['meta']['coef'], manifest['meta']['intercept'])
+    return NativeStack(members, meta, entry['predictors'])
+
+
+# -----------------------------------------
+# 3. Lazy loading with predictor validation
+# -----------------------------------------
+def _check_predictors(name, entry, model, predictors):
+    expected = predictors_hash(predictors)
+    if entry['predictors_hash'] is not None and entry['predictors_hash'] != expected:
+        raise ValueError(
+            f"Model '{name}' v{entry['version']} was trained on a different predictor set "
+            f"({entry['predictors_hash']} != {expected}); retrain or register a compatible model."
+        )
+    trained_on = getattr(model, 'feature_names_in_', None)
+    if trained_on is not None and list(trained_on) != list(predictors):
+        raise ValueError(
+            f"Model '{name}' expects features {list(trained_on)}, but PREDICTORS is {list(predictors)}."
+        )
+
+
+def get_model(name, registry_path=REGISTRY_PATH, predictors=PREDICTORS):
+    """
+    Returns the model registered as `name`, loading it on first use.
+    Raises ValueError if it was trained on a different predictor list.
+    """
+    key = (registry_path, name)
+    model = _loaded.get(key)
+    if model is not None:
+        return model
+    with _lock:
+        if key not in _loaded:
+            entry = model_entry(name, registry_path)
+            with span('registry.load', model=name, format=entry['format']):
+                if entry['format'].startswith('native'):
+                    model = _load_native(entry)
+                else:
+                    from joblib import load
+                    model = load(entry['path'])
+            _check_predictors(name, entry, model, predictors)
+            _loaded[key] = model
+    return _loaded[key]
+
+
+def get_quantile_models(quantiles=(0.1, 0.5, 0.9), registry_path=REGISTRY_PATH):
+    """
+    Returns {quantile: model} for the registered quantile models.
+    """
+    return {q: get_model(quantile_model_name(q), registry_path) for q in quantiles}
+
+
+def clear_cache():
+    """
+    Drops all loaded models (e.g. after retraining in the same process).
+    """
+    with _lock:
+        _loaded.clear()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect registered models and export them to native formats.")
+    sub = parser.add_subparsers(dest='command', required=True)
+    sub.add_parser('list')
+    export = sub.add_parser('export')
+    export.add_argument('names', nargs='+')
+    args = parser.parse_args()
+
+    if args.command == 'list':
+        names = sorted(set(read_registry()['models']) | set(DEFAULT_ARTIFACTS))
+        for name in names:
+            entry = model_entry(name)
+            print(f"{name:14} v{entry['version']:<3} {entry['format']:13} {entry['path']} "
+                  f"gw={entry['trained_gameweeks']} predictors={entry['predictors_hash']}")
+    else:
+        for name in args.names:
+            entry = export_native(name)
+            print(f"Exported {name} v{entry['version']} to {entry['path']}")
+
+
+if __name__ == '__main__':
+    main()
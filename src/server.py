@@ -0,0 +1,148 @@
+"""
+Long-lived prediction service for the browser extension.
+
+Models are loaded once at startup; the latest features, predictions and the
+optimized squad are computed once per gameweek and served from memory as
+pre-serialized JSON with ETags, so repeated requests do no model or solver work.
+
+GET /metrics serves stage timings and solver status in the Prometheus text
+format when instrumentation is enabled (--metrics or CATAPULT_METRICS=1).
+
+Run with:
+    python -m src.server --port 5000
+"""
+import argparse
+import hashlib
+import json
+import logging
+import threading
+
+from flask import Flask, Response, abort, jsonify, request
+
+from src.data import load_merged_gws_data, load_team_info
+from src.features import compute_rolling_features, add_contextual_features, prepare_latest_features
+from src.model import predict_all
+from src.optimizer import optimize_team
+from src.registry import get_model, get_quantile_models, clear_cache
+from src import instrument
+
+
+def load_models():
+    """
+    Loads the stacked model and the quantile models through the registry.
+    """
+    return {'stacked': get_model('stacked'), 'quantile': get_quantile_models()}
+
+
+def _payload(df):
+    """
+    Serializes a frame to a JSON array of records and returns (body, etag).
+    """
+    body = df.to_json(orient='records').encode('utf-8')
+    return body, hashlib.sha1(body).hexdigest()
+
+
+def build_state(models, risk_aversion=0.01, data_path="data/merged_gw.csv", teams_path="data/teams.csv"):
+    """
+    Runs the full prediction flow once and returns the state served by the endpoints.
+    """
+    df_gws = load_merged_gws_data(data_path)
+    teams_df = load_team_info(teams_path)
+    df_features = compute_rolling_features(df_gws, window=3)
+    df_features = add_contextual_features(df_features, teams_df)
+    latest_gw = int(df_features['gameweek'].max())
+
+    predictions = prepare_latest_features(df_features, latest_gw)
+    predictions = predictions.join(predict_all(models['stacked'], models['quantile'], predictions))
+    predictions['rounded_predicted'] = predictions['predicted_points'].round(0).astype(int)
+
+    team = optimize_team(predictions, risk_aversion=risk_aversion)
+    team['rounded_predicted'] = team['predicted_points'].round(0).astype(int)
+
+    best15 = _payload(team)
+    per_position = _payload(predictions)
+    return {
+        'gameweek': latest_gw,
+        'players': {record['player_id']: json.dumps(record).encode('utf-8')
+                    for record in json.loads(per_position[0])},
+        'payloads': {'best15': best15, 'bestPerPosition': per_position},
+        'version': hashlib.sha1((best15[1] + per_position[1]).encode()).hexdigest(),
+    }
+
+
+def _cached_response(body, etag):
+    response = Response(body, mimetype='application/json')
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
+
+
+def create_app(models=None, risk_aversion=0.01, **data_paths):
+    """
+    Creates the Flask app. Models are loaded and the state is built once here;
+    POST /reload rebuilds the state (e.g. after a new gameweek) and swaps it in atomically;
+    POST /reload?models=1 also reloads the models, which later reloads keep using.
+    """
+    app = Flask(__name__)
+    models = models if models is not None else load_models()
+    state = {'models': models, 'current': build_state(models, risk_aversion, **data_paths)}
+    reload_lock = threading.Lock()
+
+    @app.after_request
+    def allow_extension(response):
+        response.headers['Access-Control-Allow-Origin'] = '*'
+        response.headers['Access-Control-Expose-Headers'] = 'ETag'
+        return response
+
+    @app.route('/best15')
+    def best15():
+        return _cached_response(*state['current']['payloads']['best15'])
+
+    @app.route('/bestPerPosition')
+    def best_per_position():
+        return _cached_response(*state['current']['payloads']['bestPerPosition'])
+
+    @app.route('/player/<int:player_id>')
+    def player(player_id):
+        current = state['current']
+        if player_id not in current['players']:
+            abort(404)
+        return _cached_response(current['players'][player_id], f"{current['version']}-{player_id}")
+
+    @app.route('/reload', methods=['POST'])
+    def reload():
+        with reload_lock:
+            reload_models = request.args.get('models', '0') == '1'
+            if reload_models:
+                clear_cache()
+            with instrument.span('server.reload', models=int(reload_models)):
+                current_models = load_models() if reload_models else state['models']
+                state['current'] = build_state(current_models, risk_aversion, **data_paths)
+                state['models'] = current_models
+        return jsonify({'gameweek': state['current']['gameweek'], 'version': state['current']['version']})
+
+    @app.route('/metrics')
+    def metrics():
+        return Response(instrument.prometheus_text(), mimetype='text/plain; version=0.0.4')
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve FPL predictions for the browser extension.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--risk-aversion', type=float, default=0.01)
+    parser.add_argument('--metrics', action='store_true', help="Enable stage instrumentation and JSON logs")
+    args = parser.parse_args()
+
+    if args.metrics:
+        instrument.enable()
+        logging.basicConfig(level=logging.INFO, format='%(message)s')
+
+    app = create_app(risk_aversion=args.risk_aversion)
+    app.run(host=args.host, port=args.port, threaded=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,192 @@
+"""
+Vectorized Monte Carlo simulation of squad scores from the quantile models.
+
+Each player's points are modelled as a split normal fitted to predicted_p10,
+predicted_p50 and predicted_p90. Draws are generated as one (draws x players)
+array per chunk and scored for every candidate squad with a single matrix
+product; per-squad moments and a fixed-size histogram are accumulated across
+chunks, so memory use does not grow with the number of draws.
+"""
+import numpy as np
+import pandas as pd
+
+from src.planner import LINEUP_LIMITS, LINEUP_SIZE
+
+# z-score of the 90th percentile of a standard normal
+Z90 = 1.2815515655446004
+HISTOGRAM_BINS = 1024
+
+
+def fit_quantile_distributions(players):
+    """
+    Fits a split normal to each player's (p10, p50, p90) predictions.
+    Crossed quantiles are sorted first. Returns (median, sigma_low, sigma_high) float32 arrays.
+    """
+    q = np.sort(players[['predicted_p10', 'predicted_p50', 'predicted_p90']].to_numpy(dtype=np.float32), axis=1)
+    median = q[:, 1]
+    return median, (q[:, 1] - q[:, 0]) / Z90, (q[:, 2] - q[:, 1]) / Z90
+
+
+def sample_points(distributions, n_draws, rng=None):
+    """
+    Draws an (n_draws x players) float32 array of simulated points.
+    """
+    rng = np.random.default_rng(rng)
+    median, sigma_low, sigma_high = distributions
+    z = rng.standard_normal((n_draws, len(median)), dtype=np.float32)
+    return median + z * np.where(z < 0, sigma_low, sigma_high)
+
+
+def _split_normal_moments(distributions):
+    median, sigma_low, sigma_high = (d.astype(np.float64) for d in distributions)
+    mean = median + (sigma_high - sigma_low) / np.sqrt(2 * np.pi)
+    var = (sigma_low ** 2 + sigma_high ** 2) / 2 - (mean - median) ** 2
+    return mean, var
+
+
+def _squad_lists(squads):
+    """
+    Accepts a list of player_id lists, or a tidy frame with 'scenario' and
+    'player_id' columns (as returned by optimize_scenarios). Scenarios without
+    a squad (a NaN player_id row, e.g. infeasible) are skipped.
+    """
+    if isinstance(squads, pd.DataFrame):
+        squads = squads.dropna(subset=['player_id'])
+        grouped = squads.groupby('scenario', sort=True)['player_id']
+        return list(grouped.groups.keys()), [list(ids) for _, ids in grouped]
+    return list(range(len(squads))), [list(ids) for ids in squads]
+
+
+def lineup_weights(players, squads, bench_weight=0.0, captain_multiplier=2, score_column='predicted_p50'):
+    """
+    Builds an (n_squads x n_players) weight matrix: each squad's starting XI
+    gets weight 1, its captain `captain_multiplier` and its bench `bench_weight`.
+
+    The XI is the best formation-legal eleven by `score_column` (one GK, then the
+    position minimums, then the best remaining outfield players), and the
+    captain is the starter with the highest score.
+
+    All squads are handled at once as a padded (n_squads x squad size) array
+    sorted by score: a player starts if it is within its position's minimum, or
+    within its position's maximum and among the best remaining players that
+    fill the XI.
+    """
+    index = pd.Index(players['player_id'])
+    score = players[score_column].to_numpy(dtype=np.float64)
+    codes = pd.Categorical(players['position'], categories=list(LINEUP_LIMITS)).codes
+    minimum = np.array([lo for lo, _ in LINEUP_LIMITS.values()])
+    maximum = np.array([hi for _, hi in LINEUP_LIMITS.values()])
+    weights = np.zeros((len(squads), len(players)), dtype=np.float32)
+    if not squads:
+        return weights
+
+    lengths = np.array([len(squad) for squad in squads])
+    flat = index.get_indexer(np.concatenate([np.asarray(squad) for squad in squads]))
+    if (flat < 0).any():
+        raise KeyError(f"Squad players not in `players`: {sorted(set(np.concatenate(squads)) - set(index))}")
+    n_squads, width = len(squads), int(lengths.max())
+    valid = np.arange(width) < lengths[:, None]
+    idx = np.zeros((n_squads, width), dtype=np.intp)
+    idx[valid] = flat
+
+    # Sort each squad by score (stable, padding last)
+    order = np.argsort(np.where(valid, -score[idx], np.inf), axis=1, kind='stable')
+    idx = np.take_along_axis(idx, order, axis=1)
+    valid = np.take_along_axis(valid, order, axis=1)
+    ranked_score = np.where(valid, score[idx], -np.inf)
+    position = np.where(valid, codes[idx], -1)
+
+    # Rank of each player within its position in its squad
+    rank = np.zeros((n_squads, width), dtype=int)
+    for code in range(len(LINEUP_LIMITS)):
+        same = position == code
+        rank[same] = (np.cumsum(same, axis=1) - 1)[same]
+    known = position >= 0
+    required = known & (rank < minimum[position])
+    eligible = known & ~required & (rank < maximum[position])
+    slots = LINEUP_SIZE - required.sum(axis=1)
+    starter = required | (eligible & (np.cumsum(eligible, axis=1) <= slots[:, None]))
+
+    # Captain: the best starter; ties go to the first starter in XI order
+    # (position minimums by position, then the remaining starters by score)
+    col = np.arange(width)
+    xi_order = np.where(required, position * width + col, len(LINEUP_LIMITS) * width + col)
+    best = np.where(starter, ranked_score, -np.inf).max(axis=1, keepdims=True)
+    captain = np.argmin(np.where(starter & (ranked_score == best), xi_order, np.iinfo(int).max), axis=1)
+    has_xi = starter.any(axis=1)
+
+    rows = np.broadcast_to(np.arange(n_squads)[:, None], idx.shape)
+    weights[rows[valid], idx[valid]] = bench_weight
+    weights[rows[starter], idx[starter]] = 1.0
+    weights[np.flatnonzero(has_xi), idx[has_xi, captain[has_xi]]] = captain_multiplier
+    return weights
+
+
+def simulate_squads(players, squads, n_draws=100_000, bench_weight=0.0, quantiles=(0.05, 0.1, 0.25),
+                    max_memory_mb=256, seed=None):
+    """
+    Simulates the total score of many candidate squads.
+
+    players: frame with player_id, position and the predicted_p10/p50/p90 columns.
+    squads: list of player_id lists, or the tidy output of optimize_scenarios
+    (scenarios without a squad are skipped).
+
+    Draws are processed in chunks sized to `max_memory_mb`; for each chunk one
+    (draws x players) sample array is scored against all squads at once.
+    Returns one row per squad with expected_points, variance, std and the
+    requested lower quantiles (as p5, p10, ...).
+    """
+    labels, squad_ids = _squad_lists(squads)
+    if not squad_ids:
+        return pd.DataFrame(columns=['squad', 'expected_points', 'variance', 'std',
+                                     *(f"p{round(q * 100):g}" for q in quantiles)])
+
+    # Only simulate players that appear in some squad.
+    used = np.unique(np.concatenate([np.asarray(ids) for ids in squad_ids]))
+    pool = players[players['player_id'].isin(used)].drop_duplicates('player_id').reset_index(drop=True)
+    weights = lineup_weights(pool, squad_ids, bench_weight=bench_weight)
+    distributions = fit_quantile_distributions(pool)
+
+    n_squads, n_players = weights.shape
+    # Per draw: float32 samples plus three sampling temporaries per player, and
+    # float32 scores plus three temporaries (squares, bin positions, bin indices) per squad.
+    bytes_per_draw = 4 * (4 * n_players + 4 * n_squads)
+    chunk = int(max(1, min(n_draws, max_memory_mb * 2 ** 20 // bytes_per_draw)))
+
+    # Histogram range per squad from the analytic mean and std of the weighted sum.
+    mean, var = _split_normal_moments(distributions)
+    centre = weights @ mean
+    spread = 8 * np.sqrt((weights.astype(np.float64) ** 2) @ var) + 1e-6
+    low = (centre - spread).astype(np.float32)
+    width = (2 * spread / HISTOGRAM_BINS).astype(np.float32)
+
+    rng = np.random.default_rng(seed)
+    total = np.zeros(n_squads)
+    total_sq = np.zeros(n_squads)
+    hist = np.zeros(n_squads * HISTOGRAM_BINS, dtype=np.int64)
+    bin_offset = (np.arange(n_squads) * HISTOGRAM_BINS).astype(np.int32)
+    for start in range(0, n_draws, chunk):
+        draws = sample_points(distributions, min(chunk, n_draws - start), rng)
+        scores = draws @ weights.T
+        total += scores.sum(axis=0, dtype=np.float64)
+        total_sq += np.square(scores).sum(axis=0, dtype=np.float64)
+        bins = ((scores - low) / width).astype(np.int32)
+        np.clip(bins, 0, HISTOGRAM_BINS - 1, out=bins)
+        bins += bin_offset
+        del scores
+        hist += np.bincount(bins.ravel(), minlength=len(hist))
+
+    expected = total / n_draws
+    variance = np.maximum(total_sq / n_draws - expected ** 2, 0.0) * n_draws / max(n_draws - 1, 1)
+    result = pd.DataFrame({'squad': labels, 'expected_points': expected, 'variance': variance,
+                           'std': np.sqrt(variance)})
+
+    hist = hist.reshape(n_squads, HISTOGRAM_BINS)
+    cdf = np.cumsum(hist, axis=1) / n_draws
+    for q in quantiles:
+        b = np.argmax(cdf >= q, axis=1)
+        below = np.where(b > 0, cdf[np.arange(n_squads), b - 1], 0.0)
+        in_bin = hist[np.arange(n_squads), b] / n_draws
+        frac = np.divide(q - below, in_bin, out=np.zeros(n_squads), where=in_bin > 0)
+        result[f"p{round(q * 100):g}"] = low + width.astype(np.float64) * (b + frac)
+    return result
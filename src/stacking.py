@@ -0,0 +1,208 @@
+"""
+Stacked-ensemble training with cached fold fits.
+
+Fits the same kind of model as `StackingRegressor.fit` (base learners refit on
+all rows, a linear meta-learner on their out-of-fold predictions), but:
+- with `groups` (each row's gameweek) the folds are forward-chaining blocks of
+  FOLD_GAMEWEEKS gameweeks: each block after the first is predicted by a model
+  trained on all earlier gameweeks, so no fold sees the future. The first
+  block has no out-of-fold predictions and is left out of the meta-learner's
+  training rows. Without `groups` the folds are an unshuffled KFold, exactly
+  as StackingRegressor uses for regressors;
+- the fold fits and full-data fits of every base learner run concurrently,
+  with one thread budget divided between them so the libraries' own thread
+  pools don't oversubscribe the machine;
+- every fold fit and full-data fit is cached in STACKING_CACHE_DIR, keyed by a
+  hash of that fit's own training rows and the learner's hyperparameters. The
+  out-of-fold predictions are recomputed from the cached fold models. Block
+  boundaries depend only on the gameweek numbers, so after a new gameweek is
+  added every earlier fold is a cache hit and only the new fold and the
+  full-data fits are refit;
+- after a fit, each learner's entries under other keys (older data or
+  hyperparameters) are evicted.
+
+A retrain on unchanged data is then all cache hits, and changing one learner's
+hyperparameters refits just that learner.
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from joblib import dump, load
+from sklearn.base import clone
+from sklearn.ensemble import StackingRegressor
+from sklearn.linear_model import LinearRegression
+from sklearn.model_selection import KFold
+from sklearn.utils import Bunch
+
+from src.instrument import annotate
+
+logger = logging.getLogger(__name__)
+
+STACKING_CACHE_DIR = 'models/stacking_cache'
+
+# Thread-count parameters are excluded from the cache key: they change speed, not the model.
+THREAD_PARAMS = ('n_jobs', 'thread_count')
+
+# Gameweeks per block of the forward-chaining folds (see gameweek_folds).
+FOLD_GAMEWEEKS = 6
+
+
+def data_hash(X, y):
+    """
+    Hash of the training matrix (values and column names) and target.
+    """
+    h = hashlib.sha1()
+    h.update(json.dumps([str(c) for c in getattr(X, 'columns', [])]).encode())
+    h.update(np.ascontiguousarray(np.asarray(X, dtype=np.float64)).tobytes())
+    h.update(np.ascontiguousarray(np.asarray(y, dtype=np.float64)).tobytes())
+    return h.hexdigest()
+
+
+def learner_key(estimator, data_digest):
+    """
+    Cache key for one fit of a base learner: estimator class + hyperparameters
+    + hash of the fit's training data.
+    """
+    params = {k: v for k, v in estimator.get_params().items() if k not in THREAD_PARAMS}
+    spec = json.dumps([type(estimator).__name__, params, data_digest], sort_keys=True, default=repr)
+    return hashlib.sha1(spec.encode()).hexdigest()[:16]
+
+
+def gameweek_folds(groups, fold_gameweeks=FOLD_GAMEWEEKS):
+    """
+    Forward-chaining (train_idx, val_idx) folds over blocks of `fold_gameweeks`
+    gameweeks (1-6, 7-12, ...): each block after the first is validated by a
+    model trained on every earlier gameweek.
+    """
+    block = (np.asarray(groups, dtype=np.int64) - 1) // fold_gameweeks
+    blocks = np.unique(block)
+    if len(blocks) < 2:
+        raise ValueError(f"Time-based stacking needs gameweeks spanning at least two blocks of "
+                         f"{fold_gameweeks}; got {len(blocks)}.")
+    return [(np.flatnonzero(block < b), np.flatnonzero(block == b)) for b in blocks[1:]]
+
+
+def evict_stale(cache_dir, keys):
+    """
+    Removes cached entries of the learners in `keys` ({name: set of current
+    keys}) under any other key. Returns the removed file names.
+    """
+    if not cache_dir or not os.path.isdir(cache_dir):
+        return []
+    removed = []
+    for fname in os.listdir(cache_dir):
+        match = re.fullmatch(r'(.+)-([0-9a-f]{16})\.joblib', fname)
+        if match and match.group(1) in keys and match.group(2) not in keys[match.group(1)]:
+            os.remove(os.path.join(cache_dir, fname))
+            removed.append(fname)
+    return removed
+
+
+def _thread_param(estimator):
+    # CatBoost calls it thread_count; sklearn, XGBoost and LightGBM use n_jobs
+    params = estimator.get_params()
+    return next((p for p in THREAD_PARAMS if p in params), None)
+
+
+def _with_threads(estimator, n_threads):
+    """
+    Returns an unfitted clone limited to `n_threads` internal threads
+    (a plain clone for single-threaded estimators).
+    """
+    param = _thread_param(estimator)
+    return clone(estimator) if param is None else clone(estimator).set_params(**{param: n_threads})
+
+
+def _fit_task(estimator, X, y, train_idx, n_threads):
+    """
+    Fits one clone on `train_idx` (all rows if None) and returns it. The
+    full-data fit gets the original n_jobs back, since it is the one used for
+    inference (CatBoost can't be changed after fitting, but its predict()
+    threads separately).
+    """
+    model = _with_threads(estimator, n_threads)
+    if train_idx is None:
+        model.fit(X, y)
+        if _thread_param(estimator) == 'n_jobs':
+            model.set_params(n_jobs=estimator.get_params()['n_jobs'])
+        return model
+    return model.fit(X.iloc[train_idx], y.iloc[train_idx])
+
+
+def fit_stacked_model(X, y, estimators, final_estimator=None, cv=5, n_threads=None,
+                      cache_dir=STACKING_CACHE_DIR, groups=None, fold_gameweeks=FOLD_GAMEWEEKS):
+    """
+    Fits a StackingRegressor from (name, estimator) pairs with cached,
+    concurrent fold fits.
+
+    - X, y: training DataFrame and Series.
+    - groups: each row's gameweek, for forward-chaining gameweek folds (see
+      gameweek_folds); None uses an unshuffled KFold with `cv` splits.
+    - n_threads: total thread budget (default: all CPUs).
+    - cache_dir: cache location; None disables the cache.
+
+    Returns the fitted StackingRegressor.
+    """
+    final_estimator = LinearRegression() if final_estimator is None else final_estimator
+    n_threads = n_threads or os.cpu_count() or 1
+    folds = list(KFold(n_splits=cv).split(X)) if groups is None else gameweek_folds(groups, fold_gameweeks)
+    # Fit 0 is the full-data fit, fit k >= 1 is fold k - 1
+    train_sets = [None] + [train_idx for train_idx, _ in folds]
+    digests = [data_hash(X, y) if idx is None else data_hash(X.iloc[idx], y.iloc[idx]) for idx in train_sets]
+
+    # Load cached fits; queue the others
+    models, tasks, keys = {}, [], {}
+    for name, estimator in estimators:
+        models[name] = [None] * len(train_sets)
+        keys[name] = set()
+        for k, (train_idx, digest) in enumerate(zip(train_sets, digests)):
+            key = learner_key(estimator, digest)
+            keys[name].add(key)
+            path = os.path.join(cache_dir, f"{name}-{key}.joblib") if cache_dir else None
+            if path and os.path.exists(path):
+                models[name][k] = load(path)
+            else:
+                tasks.append((name, k, path, estimator, train_idx))
+
+    if tasks:
+        workers = min(len(tasks), n_threads)
+        threads_per_task = max(1, n_threads // workers)
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(_fit_task, estimator, X, y, train_idx, threads_per_task)
+                       for _, _, _, estimator, train_idx in tasks]
+            results = [f.result() for f in futures]
+        for (name, k, path, _, _), model in zip(tasks, results):
+            models[name][k] = model
+            if path:
+                os.makedirs(cache_dir, exist_ok=True)
+                dump(model, path)
+    n_fits = len(estimators) * len(train_sets)
+    logger.info("Stacking: fit %d of %d base-learner fits, reused %d (%d folds)",
+                len(tasks), n_fits, n_fits - len(tasks), len(folds))
+    annotate(refit=len(tasks), reused=n_fits - len(tasks))
+    evicted = evict_stale(cache_dir, keys)
+    if evicted:
+        logger.info("Stacking: evicted %d stale cache entries", len(evicted))
+
+    # Out-of-fold predictions from the fold models
+    names = [name for name, _ in estimators]
+    oof = np.full((len(y), len(names)), np.nan)
+    for j, name in enumerate(names):
+        for k, (_, val_idx) in enumerate(folds, start=1):
+            oof[val_idx, j] = models[name][k].predict(X.iloc[val_idx])
+    covered = ~np.isnan(oof).any(axis=1)
+
+    # Assemble the fitted StackingRegressor as its own fit() would
+    stacked = StackingRegressor(estimators=estimators, final_estimator=final_estimator, cv=cv)
+    stacked.estimators_ = [models[name][0] for name in names]
+    stacked.named_estimators_ = Bunch(**{name: models[name][0] for name in names})
+    stacked.stack_method_ = ['predict'] * len(names)
+    if hasattr(X, 'columns'):
+        stacked.feature_names_in_ = np.asarray(X.columns, dtype=object)
+    stacked.final_estimator_ = clone(final_estimator).fit(oof[covered], np.asarray(y)[covered])
+    return stacked
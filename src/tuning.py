@@ -0,0 +1,212 @@
+"""
+Hyperparameter search for every ensemble member and the quantile models.
+
+- Folds are split by gameweek (expanding window), never by raw row order.
+- Each fold's score is reported to an Optuna pruner, so poor trials stop early.
+- Studies live in a local SQLite database, so tuning can be resumed and several
+  worker processes can tune the same study concurrently
+  (e.g. run `python -m src.tuning xgb --trials 50` in several shells).
+- Best parameters are written to BEST_PARAMS_PATH, where the model factories in
+  src.model pick them up.
+"""
+import argparse
+import json
+import os
+
+import lightgbm as lgb
+import numpy as np
+import optuna
+from catboost import CatBoostRegressor
+from xgboost import XGBRegressor
+
+from src.model import BEST_PARAMS_PATH, BASE_LEARNER_DEFAULTS, load_best_params, feature_matrix
+from src.registry import QUANTILE_NAMES
+
+STUDY_STORAGE = 'sqlite:///models/tuning.db'
+MEMBERS = ['xgb', 'lgb', 'cat'] + list(QUANTILE_NAMES.values())
+EARLY_STOPPING_ROUNDS = 10
+
+
+def gameweek_folds(gameweeks, n_splits=3):
+    """
+    Expanding-window folds over gameweek-sorted rows. The unique gameweeks are
+    cut into n_splits + 1 contiguous blocks; fold i trains on blocks 0..i and
+    validates on block i + 1. Returns (train, validation) slices.
+    """
+    unique = np.unique(gameweeks)
+    bounds = np.array_split(unique, n_splits + 1)
+    folds = []
+    for i in range(n_splits):
+        train_end = np.searchsorted(gameweeks, bounds[i + 1][0])
+        val_end = np.searchsorted(gameweeks, bounds[i + 1][-1], side='right')
+        folds.append((slice(0, train_end), slice(train_end, val_end)))
+    return folds
+
+
+def _quantile_of(member):
+    return {name: q for q, name in QUANTILE_NAMES.items()}.get(member)
+
+
+def suggest_params(trial, member):
+    """
+    Search space for each member.
+    """
+    if member == 'xgb':
+        return {
+            'n_estimators': trial.suggest_int('n_estimators', 50, 400),
+            'max_depth': trial.suggest_int('max_depth', 2, 6),
+            'learning_rate': trial.suggest_float('learning_rate', 0.01, 0.3, log=True),
+            'subsample': trial.suggest_float('subsample', 0.5, 1.0),
+            'reg_alpha': trial.suggest_float('reg_alpha', 0.0, 1.0),
+            'reg_lambda': trial.suggest_float('reg_lambda', 0.0, 1.0),
+        }
+    if member == 'cat':
+        return {
+            'iterations': trial.suggest_int('iterations', 50, 400),
+            'depth': trial.suggest_int('depth', 2, 6),
+            'learning_rate': trial.suggest_float('learning_rate', 0.01, 0.3, log=True),
+            'l2_leaf_reg': trial.suggest_float('l2_leaf_reg', 1.0, 10.0, log=True),
+        }
+    # LightGBM: the stacked member and the quantile models
+    return {
+        'n_estimators': trial.suggest_int('n_estimators', 50, 400),
+        'max_depth': trial.suggest_int('max_depth', 2, 6),
+        'num_leaves': trial.suggest_int('num_leaves', 4, 64, log=True),
+        'learning_rate': trial.suggest_float('learning_rate', 0.01, 0.3, log=True),
+        'min_child_samples': trial.suggest_int('min_child_samples', 5, 100, log=True),
+        'subsample': trial.suggest_float('subsample', 0.5, 1.0),
+        'subsample_freq': 1,
+        'colsample_bytree': trial.suggest_float('colsample_bytree', 0.5, 1.0),
+        'reg_alpha': trial.suggest_float('reg_alpha', 0.0, 1.0),
+        'reg_lambda': trial.suggest_float('reg_lambda', 0.0, 1.0),
+    }
+
+
+def _fit_and_score(member, params, n_threads, X_train, y_train, X_val, y_val):
+    """
+    Fits one member with early stopping on the validation fold.
+    Returns (validation loss, number of boosting rounds used).
+    """
+    q = _quantile_of(member)
+    if member == 'xgb':
+        model = XGBRegressor(**{**BASE_LEARNER_DEFAULTS['xgb'], **params}, n_jobs=n_threads,
+                             early_stopping_rounds=EARLY_STOPPING_ROUNDS)
+        model.fit(X_train, y_train, eval_set=[(X_val, y_val)], verbose=False)
+        rounds = model.best_iteration + 1
+    elif member == 'cat':
+        model = CatBoostRegressor(**{**BASE_LEARNER_DEFAULTS['cat'], **params}, thread_count=n_threads)
+        model.fit(X_train, y_train, eval_set=(X_val, y_val), early_stopping_rounds=EARLY_STOPPING_ROUNDS)
+        rounds = model.get_best_iteration() + 1
+    else:
+        base = dict(BASE_LEARNER_DEFAULTS['lgb'])
+        if q is not None:
+            base.update(objective='quantile', alpha=q)
+        model = lgb.LGBMRegressor(**{**base, **params}, n_jobs=n_threads)
+        model.fit(X_train, y_train, eval_set=[(X_val, y_val)],
+                  callbacks=[lgb.early_stopping(EARLY_STOPPING_ROUNDS, verbose=False)])
+        rounds = model.best_iteration_ or params['n_estimators']
+
+    diff = y_val - model.predict(X_val)
+    if q is not None:
+        return float(np.mean(np.maximum(q * diff, (q - 1) * diff))), rounds
+    return float(np.mean(diff ** 2)), rounds
+
+
+def _rounds_param(member):
+    return 'iterations' if member == 'cat' else 'n_estimators'
+
+
+def save_best_params(member, params, path=BEST_PARAMS_PATH):
+    """
+    Merges one member's best parameters into the best-params file.
+    """
+    all_params = load_best_params(path)
+    all_params[member] = params
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp = path + f'.{os.getpid()}.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(all_params, f, indent=2, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def tune_model(member, features_df, target_column='total_points', n_trials=20, n_jobs=1,
+               n_splits=3, storage=STUDY_STORAGE, study_name=None, timeout=None, params_path=BEST_PARAMS_PATH):
+    """
+    Tunes one member ('xgb', 'lgb', 'cat', 'quantile_p10', 'quantile_p50' or
+    'quantile_p90') with gameweek folds and median pruning.
+
+    Trials run on `n_jobs` threads (each model gets cpu_count // n_jobs threads)
+    and are stored in `storage`, so calling this again, or from other processes
+    with the same study name, continues the same study.
+
+    The best parameters (with the boosting rounds set to the mean early-stopped
+    round count) are saved to `params_path` for the model factories (skipped if
+    None) and returned.
+    """
+    if member not in MEMBERS:
+        raise ValueError(f"Unknown member '{member}'; expected one of {MEMBERS}")
+
+    df = features_df.sort_values('gameweek', kind='stable')
+    X = feature_matrix(df)
+    y = df[target_column].to_numpy(dtype=np.float32)
+    folds = gameweek_folds(df['gameweek'].to_numpy(), n_splits)
+    n_threads = max(1, (os.cpu_count() or 1) // max(n_jobs, 1))
+
+    def objective(trial):
+        params = suggest_params(trial, member)
+        losses, rounds = [], []
+        for step, (train, val) in enumerate(folds):
+            loss, used = _fit_and_score(member, params, n_threads, X[train], y[train], X[val], y[val])
+            losses.append(loss)
+            rounds.append(used)
+            trial.report(float(np.mean(losses)), step)
+            if trial.should_prune():
+                raise optuna.TrialPruned()
+        trial.set_user_attr('rounds', int(np.mean(rounds)))
+        return float(np.mean(losses))
+
+    if storage and storage.startswith('sqlite:///'):
+        os.makedirs(os.path.dirname(storage[len('sqlite:///'):]) or '.', exist_ok=True)
+    study = optuna.create_study(
+        study_name=study_name or f"catapult-{member}",
+        storage=storage,
+        load_if_exists=True,
+        direction='minimize',
+        pruner=optuna.pruners.MedianPruner(n_startup_trials=5, n_warmup_steps=0),
+    )
+    study.optimize(objective, n_trials=n_trials, n_jobs=n_jobs, timeout=timeout)
+
+    best = dict(study.best_params)
+    if member not in ('xgb', 'cat'):
+        best['subsample_freq'] = 1
+    best[_rounds_param(member)] = study.best_trial.user_attrs.get('rounds', best[_rounds_param(member)])
+    if params_path:
+        save_best_params(member, best, params_path)
+    return best
+
+
+def tune_all(features_df, members=MEMBERS, **kwargs):
+    """
+    Tunes each member in turn; returns {member: best params}.
+    """
+    return {member: tune_model(member, features_df, **kwargs) for member in members}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tune ensemble members (resumable, multi-process safe).")
+    parser.add_argument('members', nargs='*', default=MEMBERS)
+    parser.add_argument('--trials', type=int, default=20)
+    parser.add_argument('--jobs', type=int, default=1)
+    parser.add_argument('--timeout', type=float, default=None)
+    args = parser.parse_args()
+
+    from src.data import load_merged_gws_data, load_team_info
+    from src.features import compute_rolling_features, add_contextual_features
+    df_features = add_contextual_features(compute_rolling_features(load_merged_gws_data()), load_team_info())
+    for member in args.members:
+        best = tune_model(member, df_features, n_trials=args.trials, n_jobs=args.jobs, timeout=args.timeout)
+        print(f"{member}: {best}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,32 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.optimizer import POSITION_LIMITS
+
+
+def make_players(per_position=12, n_teams=10, seed=0):
+    """
+    A synthetic player pool with `per_position` players per position spread
+    over `n_teams` clubs, with point, risk and quantile predictions.
+    """
+    rng = np.random.default_rng(seed)
+    positions = [pos for pos in POSITION_LIMITS for _ in range(per_position)]
+    n = len(positions)
+    p50 = rng.uniform(0, 8, n).round(1)
+    return pd.DataFrame({
+        'player_id': np.arange(1, n + 1),
+        'position': positions,
+        'team': np.arange(n) % n_teams,
+        'now_cost': rng.integers(40, 100, n),
+        'predicted_points': rng.uniform(0, 8, n),
+        'predicted_risk': rng.uniform(0, 3, n),
+        'predicted_p10': p50 - rng.uniform(0, 3, n),
+        'predicted_p50': p50,
+        'predicted_p90': p50 + rng.uniform(0, 3, n),
+    })
+
+
+@pytest.fixture
+def players():
+    return make_players()
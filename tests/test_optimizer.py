@@ -0,0 +1,35 @@
+"""
+Tests for src.optimizer on a small synthetic player pool.
+"""
+import pytest
+
+from src.optimizer import optimize_team, optimize_scenarios
+
+
+@pytest.mark.parametrize('prune', [False, True])
+def test_timings_separate_pruning(players, prune):
+    team = optimize_team(players, prune=prune)
+    timings = team.attrs['timings']
+    assert set(timings) == {'prune', 'build', 'solve'}
+    assert all(t >= 0 for t in timings.values())
+    assert len(team) == 15 and team.attrs['status'] == 'Optimal'
+
+
+def test_unknown_include_raises(players):
+    with pytest.raises(ValueError, match='999999'):
+        optimize_scenarios(players, [{'risk_aversion': 0.1}, {'include': [999999]}], n_jobs=1)
+
+
+@pytest.mark.parametrize('prune', [False, True])
+def test_include_survives_pruning(players, prune):
+    # A clearly dominated player: the most expensive forward with no points
+    weak = players.loc[players['position'] == 'FWD'].index[0]
+    players.loc[weak, ['now_cost', 'predicted_points', 'predicted_risk']] = [99, 0.0, 3.0]
+    weak_id = players.loc[weak, 'player_id']
+
+    squads = optimize_scenarios(players, [{'risk_aversion': 0.1}, {'risk_aversion': 0.1, 'include': [weak_id]}],
+                                n_jobs=1, prune=prune)
+    forced = squads[squads['scenario'] == 1]
+    assert forced['status'].iloc[0] == 'Optimal'
+    assert weak_id in set(forced['player_id'])
+    assert weak_id not in set(squads.loc[squads['scenario'] == 0, 'player_id'])
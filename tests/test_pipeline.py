@@ -0,0 +1,29 @@
+"""
+Tests for src.pipeline's exports on cached reruns.
+"""
+import pandas as pd
+
+from src.pipeline import run_pipeline
+
+
+def test_exports_follow_the_current_run(tmp_path):
+    cache_dir, out_dir = str(tmp_path / 'pipeline'), str(tmp_path / 'out')
+    (tmp_path / 'out').mkdir()
+
+    def run(risk_aversion):
+        pipeline, manifest = run_pipeline(risk_aversion=risk_aversion, cache_dir=cache_dir, out_dir=out_dir,
+                                          n_jobs=1, train_missing=False)
+        exported = pd.read_csv(manifest['exports']['optimized_team'])
+        return pipeline, manifest, exported
+
+    _, first, low = run(0.01)
+    _, _, high = run(0.5)
+    assert set(low['player_id']) != set(high['player_id'])
+
+    # Every stage is cached now, but the export must match this run, not the 0.5 one
+    pipeline, manifest, again = run(0.01)
+    assert set(manifest['status'].values()) <= {'source', 'cached'}
+    assert sorted(again['player_id']) == sorted(low['player_id'])
+    assert manifest['gameweek'] == first['gameweek']
+    # The gameweek comes from the features stage's metadata, not the frame
+    assert 'features' not in pipeline._values
@@ -0,0 +1,32 @@
+"""
+Tests for the transfer planner's candidate pruning (src.planner.dominance_filter).
+"""
+import numpy as np
+import pytest
+
+from tests.conftest import make_players
+from src.optimizer import optimize_team
+from src.planner import plan_transfers
+from src.pruning import required_clubs
+
+
+def test_required_clubs():
+    # quota - 1 position-blocked clubs once, 4 full clubs per gameweek
+    assert [required_clubs(q) for q in (2, 5, 3)] == [6, 9, 7]
+    assert [required_clubs(q, gameweeks=3) for q in (2, 5, 3)] == [14, 17, 15]
+
+
+@pytest.mark.parametrize('horizon', [2, 3])
+def test_exact_pruning_keeps_the_optimal_plan(horizon):
+    players = make_players(per_position=30, n_teams=20, seed=horizon)
+    rng = np.random.default_rng(horizon)
+    predictions = players.loc[players.index.repeat(horizon)].assign(
+        gameweek=np.tile(np.arange(1, horizon + 1), len(players)))
+    predictions['predicted_points'] += rng.normal(0, 1.0, len(predictions))
+    current = optimize_team(players.assign(predicted_points=rng.uniform(0, 1, len(players))), 0)['player_id']
+
+    _, full = plan_transfers(predictions, current.tolist(), horizon=horizon, bank=30)
+    _, pruned = plan_transfers(predictions, current.tolist(), horizon=horizon, bank=30, prune=True)
+    assert full.attrs['pruning'] is False and full.attrs['candidates'] == len(players)
+    assert pruned.attrs['candidates'] < len(players)
+    assert pruned.attrs['objective'] == pytest.approx(full.attrs['objective'], rel=1e-4)
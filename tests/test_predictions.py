@@ -0,0 +1,42 @@
+"""
+Pins the committed models' predictions for the latest gameweek of
+data/merged_gw.csv to a float64 baseline (tests/data/latest_predictions.csv).
+"""
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.data import load_merged_gws_data, load_team_info
+from src.features import (compute_rolling_features, add_contextual_features, prepare_latest_features,
+                          compact_dtypes, PREDICTORS)
+from src.model import predict_all, feature_matrix
+from src.registry import get_model, get_quantile_models
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), 'data', 'latest_predictions.csv')
+PREDICTION_COLUMNS = ['predicted_points', 'predicted_p10', 'predicted_p50', 'predicted_p90']
+TOLERANCE = 1e-6
+
+
+@pytest.fixture(scope='module')
+def features():
+    return add_contextual_features(compute_rolling_features(load_merged_gws_data()), load_team_info())
+
+
+def test_predictors_stay_float64(features):
+    assert all(features[col].dtype == np.float64 for col in PREDICTORS if features[col].dtype.kind == 'f')
+    compacted = compact_dtypes(features.copy())
+    assert (compacted[PREDICTORS].dtypes == features[PREDICTORS].dtypes).all()
+    assert feature_matrix(features).dtype == np.float64
+
+
+def test_predictions_match_float64_baseline(features):
+    latest = prepare_latest_features(features, features['gameweek'].max())
+    predicted = predict_all(get_model('stacked'), get_quantile_models(), latest)
+    predicted = latest[['player_id']].join(predicted).sort_values('player_id').reset_index(drop=True)
+
+    baseline = pd.read_csv(BASELINE_PATH)
+    assert predicted['player_id'].tolist() == baseline['player_id'].tolist()
+    for col in PREDICTION_COLUMNS:
+        np.testing.assert_allclose(predicted[col], baseline[col], rtol=0, atol=TOLERANCE, err_msg=col)
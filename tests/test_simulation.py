@@ -0,0 +1,62 @@
+"""
+Tests for src.simulation.
+"""
+import numpy as np
+
+from src.optimizer import optimize_scenarios
+from src.planner import LINEUP_LIMITS, LINEUP_SIZE
+from src.simulation import lineup_weights, simulate_squads
+
+
+def reference_lineup_weights(players, squads, bench_weight=0.0, captain_multiplier=2, score_column='predicted_p50'):
+    """
+    The per-squad loop lineup_weights replaces.
+    """
+    row_of = {p: i for i, p in enumerate(players['player_id'])}
+    score = players[score_column].to_numpy(dtype=np.float64)
+    position = players['position'].to_numpy()
+    weights = np.zeros((len(squads), len(players)), dtype=np.float32)
+    for s, squad in enumerate(squads):
+        idx = np.array([row_of[p] for p in squad])
+        idx = idx[np.argsort(-score[idx], kind='stable')]
+        starters = []
+        for pos, (minimum, _) in LINEUP_LIMITS.items():
+            starters.extend(idx[position[idx] == pos][:minimum])
+        counts = {pos: minimum for pos, (minimum, _) in LINEUP_LIMITS.items()}
+        for i in idx:
+            if len(starters) == LINEUP_SIZE:
+                break
+            if i not in starters and counts[position[i]] < LINEUP_LIMITS[position[i]][1]:
+                starters.append(i)
+                counts[position[i]] += 1
+        weights[s, idx] = bench_weight
+        weights[s, starters] = 1.0
+        weights[s, max(starters, key=lambda i: score[i])] = captain_multiplier
+    return weights
+
+
+def test_lineup_weights_match_reference(players):
+    rng = np.random.default_rng(1)
+    by_position = {pos: players.loc[players['position'] == pos, 'player_id'].to_numpy() for pos in LINEUP_LIMITS}
+    squads = []
+    for _ in range(200):
+        counts = {'GK': 2, 'DEF': rng.integers(3, 7), 'MID': rng.integers(2, 7), 'FWD': rng.integers(1, 4)}
+        squad = np.concatenate([rng.choice(by_position[pos], n, replace=False) for pos, n in counts.items()])
+        squads.append(list(rng.permutation(squad)))
+
+    for bench_weight in (0.0, 0.25):
+        expected = reference_lineup_weights(players, squads, bench_weight=bench_weight)
+        np.testing.assert_array_equal(lineup_weights(players, squads, bench_weight=bench_weight), expected)
+
+
+def test_infeasible_scenario_is_skipped(players):
+    scenarios = [{'risk_aversion': 0.1}, {'risk_aversion': 0.1, 'budget': 0}, {'risk_aversion': 0.5}]
+    squads = optimize_scenarios(players, scenarios, n_jobs=1)
+    assert squads.loc[squads['scenario'] == 1, 'player_id'].isna().all()
+
+    result = simulate_squads(players, squads, n_draws=2000, seed=0)
+    assert result['squad'].tolist() == [0, 2]
+    assert np.isfinite(result['expected_points']).all()
+
+    empty = simulate_squads(players, squads[squads['scenario'] == 1], n_draws=10)
+    assert empty.empty
@@ -0,0 +1,77 @@
+"""
+Tests for src.stacking's gameweek folds and fold cache.
+"""
+import os
+
+import numpy as np
+import pandas as pd
+from sklearn.linear_model import LinearRegression
+from sklearn.tree import DecisionTreeRegressor
+
+import src.stacking as stacking
+from src.model import time_split
+from src.stacking import fit_stacked_model, gameweek_folds
+
+
+def make_data(gameweeks, n_players=40, seed=0):
+    """
+    Rows sorted by (player_id, gameweek) like the feature frames, with a
+    linear target; a row's values depend only on its player and gameweek.
+    """
+    rows = []
+    for player in range(n_players):
+        rng = np.random.default_rng([seed, player])
+        values = rng.normal(size=(40, 3))
+        for gw in range(1, gameweeks + 1):
+            rows.append((player, gw, *values[gw - 1]))
+    df = pd.DataFrame(rows, columns=['player_id', 'gameweek', 'a', 'b', 'c'])
+    df['y'] = 2 * df['a'] - df['b'] + 0.5 * df['c'] ** 2
+    return df
+
+
+def estimators():
+    return [('lin', LinearRegression()), ('tree', DecisionTreeRegressor(max_depth=3, random_state=0))]
+
+
+def fit(df, cache_dir):
+    return fit_stacked_model(df[['a', 'b', 'c']], df['y'], estimators(), cache_dir=cache_dir,
+                             groups=df['gameweek'], fold_gameweeks=3)
+
+
+def test_gameweek_folds_only_look_back():
+    groups = np.repeat(np.arange(1, 11), 5)
+    folds = gameweek_folds(groups, fold_gameweeks=3)
+    assert [sorted(set(groups[val])) for _, val in folds] == [[4, 5, 6], [7, 8, 9], [10]]
+    for train, val in folds:
+        assert groups[train].max() < groups[val].min()
+
+
+def test_new_gameweek_reuses_earlier_folds(tmp_path, monkeypatch):
+    cache_dir = str(tmp_path)
+    fit(make_data(12), cache_dir)
+    before = set(os.listdir(cache_dir))
+
+    fitted = []
+    fit_task = stacking._fit_task
+    monkeypatch.setattr(stacking, '_fit_task',
+                        lambda est, X, y, idx, n: fitted.append(len(X) if idx is None else len(idx))
+                        or fit_task(est, X, y, idx, n))
+    extended = make_data(13)
+    cached = fit(extended, cache_dir)
+
+    # Every fold is a cache hit, including the new one (gameweeks 13-15, trained
+    # on 1-12 like the previous full-data fit): only the full-data fits run.
+    assert fitted == [len(extended)] * 2
+    after = set(os.listdir(cache_dir))
+    assert before < after and len(after) == len(before) + 2
+
+    cold = fit(extended, None)
+    X = extended[['a', 'b', 'c']]
+    np.testing.assert_allclose(cached.predict(X), cold.predict(X))
+
+
+def test_time_split_holds_out_latest_gameweeks():
+    df = make_data(10)
+    train, holdout = time_split(df, test_size=0.2)
+    assert train['gameweek'].max() < holdout['gameweek'].min()
+    assert sorted(holdout['gameweek'].unique()) == [9, 10]